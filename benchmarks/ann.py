@@ -0,0 +1,114 @@
+"""
+Recall@k against QPS for each vector index type on synthetic data:
+
+    python -m benchmarks.ann --vectors 100000 --dim 384 --queries 500
+
+Vectors are drawn around random cluster centres, like sentence embeddings of
+a topical corpus. Exact flat search gives the ground truth; every other spec
+is swept over its search parameter (nprobe or efSearch). Queries run one at
+a time through `TableIndex.search`, as the server issues them.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import click
+import numpy as np
+
+from realitydb.vector_index import IndexSpec, TableIndex
+
+
+def synthetic(
+    vectors: int, queries: int, dim: int, clusters: int, seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim), dtype=np.float32)
+
+    def sample(n: int) -> np.ndarray:
+        points = centres[rng.integers(clusters, size=n)]
+        return points + 0.5 * rng.standard_normal((n, dim), dtype=np.float32)
+
+    return sample(vectors), sample(queries)
+
+
+def build(spec: IndexSpec, data: np.ndarray) -> Tuple[TableIndex, float]:
+    table = TableIndex(spec)
+    start = time.perf_counter()
+    table.add(np.arange(len(data), dtype=np.int64), data)
+    return table, time.perf_counter() - start
+
+
+def run(
+    table: TableIndex,
+    queries: np.ndarray,
+    k: int,
+    truth: Optional[List[set]],
+    **params: Any,
+) -> Tuple[float, float, List[set]]:
+    found: List[set] = []
+    start = time.perf_counter()
+    for query in queries:
+        hits = table.search(query[None, :], k, **params)
+        found.append({label for label, _ in hits})
+    qps = len(queries) / (time.perf_counter() - start)
+    if truth is None:
+        return 1.0, qps, found
+    recall = float(np.mean([len(f & t) / k for f, t in zip(found, truth)]))
+    return recall, qps, found
+
+
+def sweeps(vectors: int, metric: str) -> List[Tuple[Dict[str, Any], str, List[int]]]:
+    nlist = max(1, min(4096, int(4 * vectors**0.5), vectors // 39))
+    common: Dict[str, Any] = {"metric": metric, "nlist": nlist}
+    probes = [p for p in (1, 4, 16, 64) if p <= nlist]
+    return [
+        ({"type": "hnsw", "metric": metric}, "ef_search", [16, 32, 64, 128, 256]),
+        ({"type": "ivf_flat", **common}, "nprobe", probes),
+        ({"type": "ivf_sq", **common}, "nprobe", probes),
+        ({"type": "ivf_pq", **common, "pq_bits": 8}, "nprobe", probes),
+    ]
+
+
+@click.command()
+@click.option("--vectors", default=100_000, show_default=True)
+@click.option("--queries", default=500, show_default=True)
+@click.option("--dim", default=384, show_default=True)
+@click.option("--clusters", default=100, show_default=True)
+@click.option("-k", "k", default=10, show_default=True)
+@click.option("--metric", type=click.Choice(["l2", "ip", "cosine"]), default="cosine")
+@click.option("--pq-m", default=48, show_default=True, help="PQ sub-quantizers.")
+def main(
+    vectors: int,
+    queries: int,
+    dim: int,
+    clusters: int,
+    k: int,
+    metric: str,
+    pq_m: int,
+) -> None:
+    data, query_data = synthetic(vectors, queries, dim, clusters)
+    flat, seconds = build(IndexSpec(metric=metric), data)
+    _, qps, truth = run(flat, query_data, k, None)
+    print(
+        f"{'index':<10}{'param':>14}{'recall@%d' % k:>11}{'QPS':>10}"
+        f"{'build s':>9}{'MiB':>9}"
+    )
+    mib = flat.nbytes / (1 << 20)
+    print(f"{'flat':<10}{'':>14}{1.0:>11.3f}{qps:>10,.0f}{seconds:>9.1f}{mib:>9.1f}")
+    for fields, param, values in sweeps(vectors, metric):
+        if fields["type"] == "ivf_pq":
+            fields["pq_m"] = pq_m
+        table, seconds = build(IndexSpec(**fields), data)
+        mib = table.nbytes / (1 << 20)
+        for value in values:
+            recall, qps, _ = run(table, query_data, k, truth, **{param: value})
+            print(
+                f"{fields['type']:<10}{'%s=%d' % (param, value):>14}{recall:>11.3f}"
+                f"{qps:>10,.0f}{seconds:>9.1f}{mib:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
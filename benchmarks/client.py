@@ -0,0 +1,82 @@
+"""
+Measures RPCClient throughput against an in-process RPCServer:
+
+    python -m benchmarks.client --requests 5000 --concurrency 64
+
+Compares sequential awaits, concurrent calls multiplexed over the pool, and
+concurrent calls with GetItem/PutItem auto-batching.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+from uuid import uuid4
+
+import click
+
+from realitydb.client import RPCClient
+
+from .harness import serve_in_process
+
+
+async def run(
+    url: str,
+    table: str,
+    requests: int,
+    concurrency: int,
+    batch_window: Optional[float],
+    op: Callable[[RPCClient, int], Awaitable[Any]],
+) -> float:
+    async with RPCClient(url, batch_window=batch_window) as client:
+        remaining = iter(range(requests))
+
+        async def worker() -> None:
+            for i in remaining:
+                await op(client, i)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return requests / (time.perf_counter() - start)
+
+
+async def benchmark(requests: int, concurrency: int) -> None:
+    async with serve_in_process() as base_url:
+        url = f"{base_url}/benchmark"
+        table = f"client_{uuid4().hex}"
+        await compare_modes(url, table, requests, concurrency)
+
+
+async def compare_modes(url: str, table: str, requests: int, concurrency: int):
+    def put(client: RPCClient, i: int) -> Awaitable[Any]:
+        return client.put_item(table, {"id": str(i), "data": "x" * 100})
+
+    def get(client: RPCClient, i: int) -> Awaitable[Any]:
+        return client.get_item(table, str(i))
+
+    modes = [
+        ("sequential", 1, None),
+        ("multiplexed", concurrency, None),
+        ("auto-batched", concurrency, 0.0),
+    ]
+    try:
+        print(f"{'mode':<14}{'op':<6}{'ops/s':>12}")
+        for name, workers, window in modes:
+            for op_name, op in (("put", put), ("get", get)):
+                rate = await run(url, table, requests, workers, window, op)
+                print(f"{name:<14}{op_name:<6}{rate:>12,.0f}")
+    finally:
+        async with RPCClient(url) as client:
+            await client.delete_table(table)
+
+
+@click.command()
+@click.option("--requests", default=5000, show_default=True)
+@click.option("--concurrency", default=64, show_default=True)
+def main(requests: int, concurrency: int) -> None:
+    asyncio.run(benchmark(requests, concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Measures AddToVectorStore ingest throughput per embedding batch size:
+
+    python -m benchmarks.embedding --documents 2000 --batch-size 1 --batch-size 64
+
+Documents are written straight through `VectorStore.add_documents`, so the
+numbers cover inference, the WriteBatch and the index update only.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Tuple
+from uuid import uuid4
+
+import click
+
+from realitydb.models import DocumentObject
+from realitydb.vector_index import indexes
+from realitydb.vectorstore import VectorStore
+
+
+async def benchmark(documents: int, batch_sizes: Tuple[int, ...]) -> None:
+    prefix = "benchmark"
+    corpus = [
+        {"content": f"document {i} about topic {i % 97}", "metadata": {"i": i}}
+        for i in range(documents)
+    ]
+    VectorStore.embed(["warm up"])  # load the model outside the measurement
+    print(f"{'batch size':>10}{'docs/s':>12}")
+    for batch_size in batch_sizes:
+        table = f"embedding_{uuid4().hex}"
+        await indexes.get(prefix, table)
+        try:
+            start = time.perf_counter()
+            await VectorStore.add_documents(
+                corpus, prefix, table, batch_size=batch_size
+            )
+            rate = documents / (time.perf_counter() - start)
+            print(f"{batch_size:>10}{rate:>12,.0f}")
+        finally:
+            indexes.drop(prefix, table)
+            await DocumentObject.delete_table(prefix=prefix, table_name=table)
+
+
+@click.command()
+@click.option("--documents", default=2000, show_default=True)
+@click.option(
+    "--batch-size",
+    "batch_sizes",
+    multiple=True,
+    type=int,
+    default=(1, 8, 32, 128),
+    show_default=True,
+)
+def main(documents: int, batch_sizes: Tuple[int, ...]) -> None:
+    asyncio.run(benchmark(documents, batch_sizes))
+
+
+if __name__ == "__main__":
+    main()
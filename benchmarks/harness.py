@@ -0,0 +1,487 @@
+"""
+Load and latency benchmarks for every GlowMethod:
+
+    python -m benchmarks.harness run --operations 2000 --concurrency 16 \\
+        --distribution zipfian --read-ratio 0.9 --output results.json
+    python -m benchmarks.harness compare before.json after.json
+
+Each method runs against temporary RocksDB tables twice: at the storage layer
+(the registered handler, called in-process) and end-to-end over WebSocket
+against an in-process RPCServer. Runs are reproducible for a given `--seed`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import platform
+import random
+import shutil
+import string
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import click
+import orjson
+import uvicorn
+
+from realitydb.client import RPCClient
+from realitydb.models import table_path
+from realitydb.registry import methods
+from realitydb.rpc_server import RPCServer
+
+Properties = Dict[str, Any]
+Call = Callable[[str, Properties], Any]
+
+
+@dataclass(frozen=True)
+class Config:
+    keys: int = 10_000
+    operations: int = 2_000
+    concurrency: int = 16
+    doc_size: int = 1_024
+    distribution: str = "uniform"
+    zipf_s: float = 1.1
+    read_ratio: float = 0.9
+    batch_size: int = 10
+    seed: int = 0
+    vector: bool = False
+
+
+@dataclass
+class Result:
+    layer: str
+    method: str
+    operations: int
+    errors: int
+    seconds: float
+    throughput: float
+    p50_ms: float
+    p99_ms: float
+
+
+@asynccontextmanager
+async def serve_in_process(**kwargs: Any) -> AsyncIterator[str]:
+    """Runs an RPCServer on a free loopback port; yields its ws:// base URL."""
+    # The server logs every request at INFO, which would dominate the run.
+    logging.getLogger("realitydb.rpc_server").setLevel(logging.WARNING)
+    server = uvicorn.Server(
+        uvicorn.Config(RPCServer(**kwargs), port=0, log_level="warning", lifespan="off")
+    )
+    serving = asyncio.ensure_future(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"ws://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await serving
+
+
+class Keys:
+    """Key indices drawn uniformly or from a Zipfian distribution."""
+
+    def __init__(self, config: Config, rng: random.Random) -> None:
+        self.n = config.keys
+        self.rng = rng
+        self.cumulative: Optional[List[float]] = None
+        if config.distribution == "zipfian":
+            total = 0.0
+            self.cumulative = []
+            for rank in range(1, self.n + 1):
+                total += 1.0 / rank**config.zipf_s
+                self.cumulative.append(total)
+
+    def __call__(self) -> int:
+        if self.cumulative is None:
+            return self.rng.randrange(self.n)
+        point = self.rng.random() * self.cumulative[-1]
+        return bisect.bisect_left(self.cumulative, point)
+
+
+def key(index: int) -> str:
+    return "key-%08d" % index
+
+
+class Workloads:
+    """Builds the request sequence for every method ahead of timing."""
+
+    def __init__(self, config: Config, table_name: str) -> None:
+        self.config = config
+        self.table_name = table_name
+        self.rng = random.Random(config.seed)
+        self.pick = Keys(config, self.rng)
+        self.payload = "".join(
+            self.rng.choices(string.ascii_letters + string.digits, k=config.doc_size)
+        )
+
+    def document(self, index: int) -> Dict[str, Any]:
+        return {"id": key(index), "group": index % 10, "n": index, "data": self.payload}
+
+    def table(self, **properties: Any) -> Properties:
+        return dict(properties, table_name=self.table_name)
+
+    def requests(self) -> List[Tuple[str, List[Tuple[str, Properties]]]]:
+        config = self.config
+        ops = config.operations
+        heavy = max(ops // 100, 1)
+        batch = config.batch_size
+        pick = self.pick
+        mixed = [
+            (
+                ("GetItem", self.table(id=key(pick())))
+                if self.rng.random() < config.read_ratio
+                else ("PutItem", self.table(item=self.document(pick())))
+            )
+            for _ in range(ops)
+        ]
+        workloads = [
+            ("GetItem", [("GetItem", self.table(id=key(pick()))) for _ in range(ops)]),
+            (
+                "PutItem",
+                [
+                    ("PutItem", self.table(item=self.document(pick())))
+                    for _ in range(ops)
+                ],
+            ),
+            (
+                "UpdateItem",
+                [
+                    (
+                        "UpdateItem",
+                        self.table(
+                            id=key(i),
+                            updates=[{"action": "put", "data": {"n": -i}}],
+                        ),
+                    )
+                    for i in (pick() for _ in range(ops))
+                ],
+            ),
+            (
+                "BatchGetItem",
+                [
+                    (
+                        "BatchGetItem",
+                        self.table(ids=[key(pick()) for _ in range(batch)]),
+                    )
+                    for _ in range(ops // batch or 1)
+                ],
+            ),
+            (
+                "BatchWriteItem",
+                [
+                    (
+                        "BatchWriteItem",
+                        self.table(items=[self.document(pick()) for _ in range(batch)]),
+                    )
+                    for _ in range(ops // batch or 1)
+                ],
+            ),
+            (
+                "Batch",
+                [
+                    (
+                        "Batch",
+                        {
+                            "requests": [
+                                {
+                                    "method": "GetItem",
+                                    "properties": self.table(id=key(pick())),
+                                }
+                                for _ in range(batch)
+                            ],
+                            "ordered": False,
+                        },
+                    )
+                    for _ in range(ops // batch or 1)
+                ],
+            ),
+            (
+                "Query",
+                [
+                    (
+                        "Query",
+                        self.table(filters={"group": self.rng.randrange(10)}, limit=25),
+                    )
+                    for _ in range(heavy)
+                ],
+            ),
+            ("Scan", [("Scan", self.table()) for _ in range(heavy)]),
+            ("Mixed", mixed),
+            # Deletes run last, on keys no other workload reads afterwards.
+            (
+                "DeleteItem",
+                [
+                    ("DeleteItem", self.table(id=key(config.keys + i)))
+                    for i in range(ops)
+                ],
+            ),
+        ]
+        return workloads
+
+    def preload(self) -> List[Tuple[str, Properties]]:
+        config = self.config
+        chunk = 500
+        documents = [self.document(i) for i in range(config.keys + config.operations)]
+        return [("CreateTable", self.table())] + [
+            ("BatchWriteItem", self.table(items=documents[i : i + chunk]))
+            for i in range(0, len(documents), chunk)
+        ]
+
+    def tables(self) -> List[Tuple[str, List[Tuple[str, Properties]]]]:
+        count = max(self.config.operations // 100, self.config.concurrency)
+        names = ["%s-%d" % (self.table_name, i) for i in range(count)]
+        return [
+            ("CreateTable", [("CreateTable", {"table_name": n}) for n in names]),
+            ("DeleteTable", [("DeleteTable", {"table_name": n}) for n in names]),
+        ]
+
+    def vectors(self) -> List[Tuple[str, List[Tuple[str, Properties]]]]:
+        ops = max(self.config.operations // 10, 1)
+        words = self.payload[:64]
+        return [
+            (
+                "AddToVectorStore",
+                [
+                    (
+                        "AddToVectorStore",
+                        {
+                            "table_name": self.table_name + "-vectors",
+                            "documents": [
+                                {"content": f"{words} {i}", "metadata": {"n": i}}
+                            ],
+                        },
+                    )
+                    for i in range(ops)
+                ],
+            ),
+            (
+                "SearchVectorStore",
+                [
+                    (
+                        "SearchVectorStore",
+                        {
+                            "table_name": self.table_name + "-vectors",
+                            "query": f"{words} {self.rng.randrange(ops)}",
+                            "k": 5,
+                        },
+                    )
+                    for _ in range(ops)
+                ],
+            ),
+        ]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(q * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+async def measure(
+    layer: str,
+    method: str,
+    call: Call,
+    requests: List[Tuple[str, Properties]],
+    concurrency: int,
+) -> Result:
+    latencies: List[float] = []
+    errors = 0
+    pending = iter(requests)
+
+    async def worker() -> None:
+        nonlocal errors
+        for name, properties in pending:
+            start = time.perf_counter()
+            try:
+                await call(name, properties)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return Result(
+        layer=layer,
+        method=method,
+        operations=len(requests),
+        errors=errors,
+        seconds=seconds,
+        throughput=len(requests) / seconds if seconds else 0.0,
+        p50_ms=percentile(latencies, 0.50) * 1000,
+        p99_ms=percentile(latencies, 0.99) * 1000,
+    )
+
+
+async def run_layer(
+    layer: str,
+    call: Call,
+    config: Config,
+    prefix: str,
+    supported: Callable[[str], bool] = lambda method: True,
+) -> List[Result]:
+    workloads = Workloads(config, "bench")
+    for name, properties in workloads.preload():
+        await call(name, properties)
+    groups = workloads.requests() + workloads.tables()
+    if config.vector:
+        groups += workloads.vectors()
+    results = []
+    try:
+        for method, requests in groups:
+            if not all(supported(name) for name, _ in requests):
+                continue
+            results.append(
+                await measure(layer, method, call, requests, config.concurrency)
+            )
+            click.echo(format_result(results[-1]), err=True)
+    finally:
+        await call("DeleteTable", {"table_name": "bench"})
+        if config.vector:
+            await call("DeleteTable", {"table_name": "bench-vectors"})
+        shutil.rmtree(table_path(prefix, ""), ignore_errors=True)
+    return results
+
+
+async def benchmark(config: Config, layers: List[str]) -> List[Result]:
+    results: List[Result] = []
+    if "storage" in layers:
+        prefix = "bench-storage-" + uuid4().hex
+
+        async def call(method: str, properties: Properties) -> Any:
+            return await methods.get(method)(properties, prefix)
+
+        # Batch envelopes only exist on a server instance.
+        results += await run_layer(
+            "storage", call, config, prefix, lambda method: method in methods
+        )
+    if "websocket" in layers:
+        prefix = "bench-websocket-" + uuid4().hex
+        async with serve_in_process() as url:
+            client = RPCClient(f"{url}/{prefix}", pool_size=4, batch_window=None)
+            try:
+                results += await run_layer("websocket", client.call, config, prefix)
+            finally:
+                await client.close()
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_result(result: Result) -> str:
+    return "%-10s %-18s %8d ops %10.0f ops/s  p50 %8.3f ms  p99 %8.3f ms%s" % (
+        result.layer,
+        result.method,
+        result.operations,
+        result.throughput,
+        result.p50_ms,
+        result.p99_ms,
+        "  (%d errors)" % result.errors if result.errors else "",
+    )
+
+
+@click.group()
+def cli() -> None:
+    pass
+
+
+@cli.command()
+@click.option("--keys", default=Config.keys, show_default=True)
+@click.option("--operations", default=Config.operations, show_default=True)
+@click.option("--concurrency", default=Config.concurrency, show_default=True)
+@click.option("--doc-size", default=Config.doc_size, show_default=True)
+@click.option(
+    "--distribution",
+    type=click.Choice(["uniform", "zipfian"]),
+    default=Config.distribution,
+    show_default=True,
+)
+@click.option("--zipf-s", default=Config.zipf_s, show_default=True)
+@click.option("--read-ratio", default=Config.read_ratio, show_default=True)
+@click.option("--batch-size", default=Config.batch_size, show_default=True)
+@click.option("--seed", default=Config.seed, show_default=True)
+@click.option("--vector/--no-vector", default=Config.vector, show_default=True)
+@click.option(
+    "--layer",
+    "layers",
+    type=click.Choice(["storage", "websocket"]),
+    multiple=True,
+    default=("storage", "websocket"),
+    show_default=True,
+)
+@click.option("--output", type=click.Path(dir_okay=False), default=None)
+def run(layers: Tuple[str, ...], output: Optional[str], **options: Any) -> None:
+    """Runs every workload and writes the results as JSON."""
+    config = Config(**options)
+    started = datetime.now(timezone.utc).isoformat()
+    results = asyncio.run(benchmark(config, list(layers)))
+    report = {
+        "commit": git_commit(),
+        "started": started,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": asdict(config),
+        "results": [asdict(result) for result in results],
+    }
+    data = orjson.dumps(report, option=orjson.OPT_INDENT_2)
+    if output:
+        with open(output, "wb") as f:
+            f.write(data)
+    else:
+        click.echo(data.decode("utf-8"))
+
+
+@cli.command()
+@click.argument("baseline", type=click.File("rb"))
+@click.argument("candidate", type=click.File("rb"))
+def compare(baseline: Any, candidate: Any) -> None:
+    """Prints throughput and latency changes between two result files."""
+    before = orjson.loads(baseline.read())
+    after = orjson.loads(candidate.read())
+    if before["config"] != after["config"]:
+        click.echo("warning: runs used different configurations", err=True)
+    previous = {(r["layer"], r["method"]): r for r in before["results"]}
+    for result in after["results"]:
+        old = previous.get((result["layer"], result["method"]))
+        if old is None:
+            continue
+
+        def change(field: str) -> str:
+            if not old[field]:
+                return "     n/a"
+            return "%+7.1f%%" % ((result[field] / old[field] - 1) * 100)
+
+        click.echo(
+            "%-10s %-18s ops/s %s  p50 %s  p99 %s"
+            % (
+                result["layer"],
+                result["method"],
+                change("throughput"),
+                change("p50_ms"),
+                change("p99_ms"),
+            )
+        )
+
+
+if __name__ == "__main__":
+    cli()
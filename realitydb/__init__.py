@@ -1,4 +1,28 @@
-from .models import DocumentObject
-from .rpc_server import RPCServer
-from .vectorstore import VectorStore
-__all__ = ["RPCServer", "DocumentObject", "VectorStore"]
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .client import RPCClient
+    from .models import DocumentObject
+    from .registry import MethodRegistry
+    from .rpc_server import RPCServer
+    from .vectorstore import VectorStore
+
+__all__ = ["RPCServer", "RPCClient", "DocumentObject", "VectorStore", "MethodRegistry"]
+
+# Imported on first access, so that light submodules (e.g. the document
+# extraction workers) can be imported without the server and the model.
+_modules = {
+    "RPCServer": ".rpc_server",
+    "RPCClient": ".client",
+    "DocumentObject": ".models",
+    "VectorStore": ".vectorstore",
+    "MethodRegistry": ".registry",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module = _modules.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(module, __name__), name)
@@ -0,0 +1,39 @@
+"""
+Document extraction run in worker processes. Only the document classes
+are imported here, so that workers stay free of the server, its threads
+and the embedding model.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Type
+
+import base64c
+
+from ._proxy import DocumentFile
+from .documents import DocxFile, ExcelFile, PDFFile, PPTXFile
+
+KINDS: Dict[str, Type[DocumentFile]] = {
+    "docx": DocxFile,
+    "excel": ExcelFile,
+    "pptx": PPTXFile,
+    "pdf": PDFFile,
+}
+
+
+def pages(kind: str, path: str) -> Optional[int]:
+    return KINDS[kind](name=path).pages()
+
+
+def extract(
+    kind: str, path: str, images: bool, start: Optional[int], stop: Optional[int]
+) -> List[str]:
+    """The HTML of the text or the images of pages `start` to `stop`."""
+    document = KINDS[kind](name=path)
+    span = () if start is None else (start, stop)
+    if images:
+        return [
+            f"<img src='data:image/jpeg;base64,{base64c.b64encode(image).decode()}'/>"
+            for image in document.extract_images(*span)  # type: ignore
+        ]
+    return [f"<p>{chunk}</p>" for chunk in document.extract_text(*span)]  # type: ignore
@@ -4,7 +4,7 @@ import mimetypes
 import os
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Generator, Generic, Iterable, TypeVar, cast
+from typing import Generator, Generic, Iterable, Optional, TypeVar, cast
 
 from typing_extensions import override
 
@@ -33,6 +33,14 @@ class DocumentFile(LazyProxy[T], ABC):
         self.file = self.__load__()
         
         self.size = os.path.getsize(self.name)
+
+    def pages(self) -> Optional[int]:
+        """
+        The number of pages extraction can be split by, passing `start` and
+        `stop` to `extract_text` and `extract_images`; None if the document
+        is only extracted whole.
+        """
+        return None
       
     @abstractmethod
     def __load__(self) -> T:
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, cast
+
+from typing_extensions import Literal, Required, TypedDict
+
+from .models import DocumentObject
+from .registry import methods
+from .utils import INVALID_PARAMS, INVALID_REQUEST, RPCError
+
+if TYPE_CHECKING:
+    from .rpc_server import RPCServer
+
+MAX_BATCH_SIZE = 1000
+
+READS = frozenset({"GetItem"})
+WRITES = frozenset({"PutItem", "DeleteItem"})
+
+
+class BatchProperties(TypedDict, total=False):
+    requests: Required[List[Any]]
+    ordered: bool
+    consistency: Literal["eventual", "strong"]
+
+
+class _Group:
+    """Sub-requests executed together: a multi-get, a WriteBatch or a single call."""
+
+    __slots__ = ("kind", "table_name", "indices")
+
+    def __init__(self, kind: str, table_name: Optional[str], index: int) -> None:
+        self.kind = kind
+        self.table_name = table_name
+        self.indices = [index]
+
+
+def _classify(server: RPCServer, request: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    method = request["method"]
+    table_name = request["properties"].get("table_name")
+    # Plugins that override a built-in are always dispatched individually.
+    builtin = method in methods and (
+        server.registry.get(method).handler is methods.get(method).handler
+    )
+    if builtin and isinstance(table_name, str):
+        if method in READS:
+            return "read", table_name
+        if method in WRITES:
+            return "write", table_name
+    return "call", None
+
+
+async def execute_batch(
+    server: RPCServer, requests: List[Any], ordered: bool, prefix: str
+) -> List[Dict[str, Any]]:
+    """
+    Executes `requests` and returns one response frame per sub-request.
+
+    GetItem calls on the same table are served by one multi-get and
+    PutItem/DeleteItem calls on the same table are applied in one WriteBatch.
+    When `ordered`, only adjacent sub-requests are grouped and groups run one
+    after another; otherwise all same-table reads and writes are grouped and
+    every group runs concurrently.
+    """
+    if len(requests) > MAX_BATCH_SIZE:
+        raise RPCError(
+            code=INVALID_PARAMS,
+            message=f"Batch exceeds {MAX_BATCH_SIZE} requests",
+        )
+    frames: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+    subrequests: List[Dict[str, Any]] = []
+    groups: List[_Group] = []
+    by_key: Dict[Tuple[str, Optional[str]], _Group] = {}
+
+    for index, request in enumerate(requests):
+        request_id = request.get("id", index) if isinstance(request, dict) else index
+        if (
+            not isinstance(request, dict)
+            or not isinstance(request.get("method"), str)
+            or not isinstance(request.get("properties", {}), dict)
+        ):
+            frames[index] = server.error_frame(
+                request_id,
+                RPCError(code=INVALID_REQUEST, message="Malformed batch sub-request"),
+            )
+            subrequests.append({})
+            continue
+        if request["method"] == "Batch":
+            frames[index] = server.error_frame(
+                request_id,
+                RPCError(code=INVALID_REQUEST, message="Batches cannot be nested"),
+            )
+            subrequests.append({})
+            continue
+        request = {
+            "id": request_id,
+            "method": request["method"],
+            "properties": request.get("properties", {}),
+        }
+        subrequests.append(request)
+        kind, table_name = _classify(server, request)
+        if kind == "call":
+            groups.append(_Group(kind, table_name, index))
+        elif ordered:
+            last = groups[-1] if groups else None
+            if last and last.kind == kind and last.table_name == table_name:
+                last.indices.append(index)
+            else:
+                groups.append(_Group(kind, table_name, index))
+        else:
+            group = by_key.get((kind, table_name))
+            if group is None:
+                group = by_key[(kind, table_name)] = _Group(kind, table_name, index)
+                groups.append(group)
+            else:
+                group.indices.append(index)
+
+    async def run(group: _Group) -> None:
+        if group.kind == "read":
+            await _run_reads(server, group, subrequests, frames, prefix)
+        elif group.kind == "write":
+            await _run_writes(server, group, subrequests, frames, prefix)
+        else:
+            request = subrequests[group.indices[0]]
+            frames[group.indices[0]] = await server.process(
+                request["method"], request["properties"], prefix, request["id"]
+            )
+
+    if ordered:
+        for group in groups:
+            await run(group)
+    else:
+        await asyncio.gather(*(run(group) for group in groups))
+    return [frame for frame in frames if frame is not None]
+
+
+def _validate(
+    server: RPCServer,
+    group: _Group,
+    subrequests: List[Dict[str, Any]],
+    frames: List[Optional[Dict[str, Any]]],
+) -> List[Tuple[int, Any]]:
+    valid: List[Tuple[int, Any]] = []
+    for index in group.indices:
+        request = subrequests[index]
+        try:
+            spec = server.registry.get(request["method"])
+            valid.append((index, spec.validate(request["properties"])))
+        except RPCError as e:
+            frames[index] = server.error_frame(request["id"], e)
+    return valid
+
+
+async def _run_reads(
+    server: RPCServer,
+    group: _Group,
+    subrequests: List[Dict[str, Any]],
+    frames: List[Optional[Dict[str, Any]]],
+    prefix: str,
+) -> None:
+    valid = _validate(server, group, subrequests, frames)
+    if not valid:
+        return
+    try:
+        items = await DocumentObject.multi_get(
+            prefix=prefix,
+            table_name=cast(str, group.table_name),
+            ids=[properties["id"] for _, properties in valid],
+        )
+    except (RPCError, Exception) as e:
+        _fail(server, valid, subrequests, frames, e)
+        return
+    for (index, properties), item in zip(valid, items):
+        request_id = subrequests[index]["id"]
+        if item is None:
+            frames[index] = server.error_frame(
+                request_id,
+                RPCError(
+                    code=404, message="Item with id '%s' not found" % properties["id"]
+                ),
+            )
+        else:
+            frames[index] = server.success_frame(request_id, server.serialize(item))
+
+
+async def _run_writes(
+    server: RPCServer,
+    group: _Group,
+    subrequests: List[Dict[str, Any]],
+    frames: List[Optional[Dict[str, Any]]],
+    prefix: str,
+) -> None:
+    operations: List[Tuple[str, Any]] = []
+    valid: List[Tuple[int, Any]] = []
+    for index, properties in _validate(server, group, subrequests, frames):
+        if subrequests[index]["method"] == "DeleteItem":
+            operations.append(("delete", properties["id"]))
+        else:
+            try:
+                operations.append(("put", DocumentObject(**properties["item"])))
+            except Exception as e:
+                frames[index] = server.error_frame(
+                    subrequests[index]["id"],
+                    RPCError(code=INVALID_PARAMS, message=str(e)),
+                )
+                continue
+        valid.append((index, properties))
+    if not operations:
+        return
+    try:
+        results = await DocumentObject.write_batch(
+            prefix=prefix,
+            table_name=cast(str, group.table_name),
+            operations=operations,
+        )
+    except (RPCError, Exception) as e:
+        _fail(server, valid, subrequests, frames, e)
+        return
+    for (index, _), result in zip(valid, results):
+        request_id = subrequests[index]["id"]
+        if isinstance(result, RPCError):
+            frames[index] = server.error_frame(request_id, result)
+        else:
+            frames[index] = server.success_frame(request_id, server.serialize(result))
+
+
+def _fail(
+    server: RPCServer,
+    valid: List[Tuple[int, Any]],
+    subrequests: List[Dict[str, Any]],
+    frames: List[Optional[Dict[str, Any]]],
+    error: BaseException,
+) -> None:
+    if not isinstance(error, RPCError):
+        error = RPCError(message=f"{error.__class__.__name__}: {error}")
+    for index, _ in valid:
+        frames[index] = server.error_frame(subrequests[index]["id"], error)
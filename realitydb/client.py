@@ -0,0 +1,499 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlencode
+from uuid import uuid4
+
+import orjson
+from typing_extensions import Literal
+
+from .compression import decompress
+from .utils import RPCError, get_logger
+
+logger = get_logger(__name__)
+
+CONNECTION_LOST = 503
+POOL_SIZE = 4
+MAX_BATCH = 100
+
+COALESCED = frozenset({"GetItem", "PutItem"})
+
+
+class _Socket:
+    """
+    One WebSocket carrying many concurrent requests, matched by id. They are
+    sent as `concurrent`, since callers that need ordering await each call.
+    """
+
+    def __init__(self, ws: Any) -> None:
+        self.ws = ws
+        self.pending: Dict[str, asyncio.Future[Dict[str, Any]]] = {}
+        self.streams: Dict[str, asyncio.Queue[Dict[str, Any]]] = {}
+        self.background: Set[asyncio.Task[None]] = set()
+        self.reader = asyncio.ensure_future(self._read())
+
+    @property
+    def closed(self) -> bool:
+        return self.reader.done()
+
+    @property
+    def load(self) -> int:
+        return len(self.pending) + len(self.streams)
+
+    async def send(self, frame: Dict[str, Any]) -> None:
+        await self.ws.send(orjson.dumps(frame).decode("utf-8"))
+
+    def send_soon(self, frame: Dict[str, Any]) -> None:
+        """Sends `frame` in the background, for code that cannot await."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self.send(frame))
+        self.background.add(task)
+        task.add_done_callback(self._sent)
+
+    def _sent(self, task: asyncio.Task[None]) -> None:
+        self.background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Could not send frame: %s", task.exception())
+
+    async def request(self, method: str, properties: Any) -> Any:
+        request_id = uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            try:
+                await self.send(
+                    {
+                        "id": request_id,
+                        "method": method,
+                        "properties": properties,
+                        "concurrent": True,
+                    }
+                )
+            except Exception as e:
+                raise RPCError(
+                    code=CONNECTION_LOST,
+                    message=f"Connection lost: {e}",
+                    data={"retryable": True},
+                ) from e
+            frame = await future
+        finally:
+            self.pending.pop(request_id, None)
+        return _result(frame)
+
+    async def _read(self) -> None:
+        try:
+            async for message in self.ws:
+                if isinstance(message, bytes):
+                    message = decompress(message)
+                frame = orjson.loads(message)
+                key = str(frame.get("id"))
+                future = self.pending.get(key)
+                if future is not None:
+                    if not future.done():
+                        future.set_result(frame)
+                elif key in self.streams:
+                    self.streams[key].put_nowait(frame)
+                else:
+                    logger.warning("Unmatched response frame: %s", frame)
+        except Exception as e:
+            logger.warning("Connection closed: %s", e)
+        finally:
+            lost = {
+                "status": "error",
+                "error": {
+                    "code": CONNECTION_LOST,
+                    "message": "Connection lost",
+                    "data": {"retryable": True},
+                },
+            }
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_result(lost)
+            for queue in self.streams.values():
+                queue.put_nowait(lost)
+
+
+def _result(frame: Dict[str, Any]) -> Any:
+    if frame.get("status") == "error":
+        error = frame.get("error") or {}
+        raise RPCError(
+            code=error.get("code", -32000),
+            message=error.get("message", "Unknown error"),
+            data=error.get("data"),
+        )
+    return frame.get("result")
+
+
+class _Coalescer:
+    """
+    Collects GetItem or PutItem calls issued within `window` seconds and
+    sends them as one Batch, which the server serves with a multi-get or a
+    single WriteBatch per table.
+    """
+
+    def __init__(
+        self, client: RPCClient, method: str, window: float, max_size: int
+    ) -> None:
+        self.client = client
+        self.method = method
+        self.window = window
+        self.max_size = max_size
+        self.queued: List[Tuple[Dict[str, Any], asyncio.Future[Any]]] = []
+        self.timer: Optional[asyncio.Handle] = None
+        self.tasks: Set[asyncio.Task[None]] = set()
+
+    def submit(self, properties: Dict[str, Any]) -> asyncio.Future[Any]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.queued.append((properties, future))
+        if len(self.queued) >= self.max_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = (
+                loop.call_later(self.window, self.flush)
+                if self.window > 0
+                else loop.call_soon(self.flush)
+            )
+        return future
+
+    def flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        queued, self.queued = self.queued, []
+        if queued:
+            task = asyncio.ensure_future(self._send(queued))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _send(self, queued: List[Tuple[Dict[str, Any], asyncio.Future[Any]]]):
+        try:
+            if len(queued) == 1:
+                properties, future = queued[0]
+                result = await self.client.call(self.method, properties)
+                if not future.done():
+                    future.set_result(result)
+                return
+            frames = await self.client.call(
+                "Batch",
+                {
+                    "requests": [
+                        {"id": index, "method": self.method, "properties": properties}
+                        for index, (properties, _) in enumerate(queued)
+                    ],
+                    "ordered": False,
+                },
+            )
+            for (_, future), frame in zip(queued, frames):
+                if future.done():
+                    continue
+                try:
+                    future.set_result(_result(frame))
+                except RPCError as e:
+                    future.set_exception(e)
+        except BaseException as e:
+            for _, future in queued:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+
+
+class RPCClient:
+    """
+    Async client for an `RPCServer`.
+
+    `url` includes the prefix, e.g. `ws://localhost:8000/myapp`. Requests are
+    multiplexed over a pool of up to `pool_size` WebSockets, opened as
+    concurrency demands. Concurrent `get_item`/`put_item` calls issued within
+    `batch_window` seconds are coalesced into one Batch request; 0 coalesces
+    calls made in the same event loop iteration and None disables it.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        pool_size: int = POOL_SIZE,
+        batch_window: Optional[float] = 0.0,
+        max_batch: int = MAX_BATCH,
+        compression: bool = False,
+    ) -> None:
+        query = {"compression": "zstd"} if compression else {}
+        self.url = url.rstrip("/") + ("?" + urlencode(query) if query else "")
+        self.pool_size = pool_size
+        self.batch_window = batch_window
+        self._sockets: List[_Socket] = []
+        self._lock = asyncio.Lock()
+        self._coalescers: Dict[str, _Coalescer] = {}
+        if batch_window is not None:
+            self._coalescers = {
+                method: _Coalescer(self, method, batch_window, max_batch)
+                for method in COALESCED
+            }
+
+    async def __aenter__(self) -> RPCClient:
+        await self._socket()
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        await self.close()
+
+    async def _open(self) -> _Socket:
+        from websockets.asyncio.client import connect
+
+        try:
+            ws = await connect(self.url, max_size=None)
+        except OSError as e:
+            raise RPCError(
+                code=CONNECTION_LOST,
+                message=f"Cannot connect to {self.url}: {e}",
+                data={"retryable": True},
+            ) from e
+        socket = _Socket(ws)
+        self._sockets.append(socket)
+        return socket
+
+    async def _socket(self) -> _Socket:
+        """The least loaded open socket, opening another one if all are busy."""
+        self._sockets = [socket for socket in self._sockets if not socket.closed]
+        socket = min(self._sockets, key=lambda s: s.load, default=None)
+        if socket is not None and (
+            socket.load == 0 or len(self._sockets) >= self.pool_size
+        ):
+            return socket
+        async with self._lock:
+            if len(self._sockets) < self.pool_size:
+                return await self._open()
+        return min(self._sockets, key=lambda s: s.load)
+
+    async def close(self) -> None:
+        for coalescer in self._coalescers.values():
+            coalescer.flush()
+            if coalescer.tasks:
+                await asyncio.gather(*coalescer.tasks, return_exceptions=True)
+        sockets, self._sockets = self._sockets, []
+        for socket in sockets:
+            await socket.ws.close()
+            await asyncio.gather(socket.reader, return_exceptions=True)
+
+    async def call(self, method: str, properties: Dict[str, Any]) -> Any:
+        """Sends one request and returns its result, raising `RPCError`."""
+        socket = await self._socket()
+        return await socket.request(method, properties)
+
+    async def _coalesced(self, method: str, properties: Dict[str, Any]) -> Any:
+        coalescer = self._coalescers.get(method)
+        if coalescer is None:
+            return await self.call(method, properties)
+        return await coalescer.submit(properties)
+
+    async def stream(
+        self, method: str, properties: Dict[str, Any], credits: int = 8
+    ) -> AsyncIterator[Any]:
+        """
+        Yields the items of a streamed Scan or Query, granting the server a
+        credit per frame consumed. Breaking out early cancels the stream.
+        """
+        socket = await self._socket()
+        request_id = uuid4().hex
+        queue: asyncio.Queue[Dict[str, Any]] = asyncio.Queue()
+        socket.streams[request_id] = queue
+        done = False
+        try:
+            await socket.send(
+                {
+                    "id": request_id,
+                    "method": method,
+                    "properties": dict(properties, stream=True, credits=credits),
+                    "concurrent": True,
+                }
+            )
+            while True:
+                frame = await queue.get()
+                status = frame.get("status")
+                done = status != "partial"
+                for item in _result(frame) or ():
+                    yield item
+                if done:
+                    return
+                await socket.send({"id": request_id, "method": "StreamCredit"})
+        finally:
+            socket.streams.pop(request_id, None)
+            if not done and not socket.closed:
+                # Not awaited: a generator that is garbage-collected instead
+                # of closed with aclose() cannot await in its finally.
+                socket.send_soon({"id": request_id, "method": "StreamCancel"})
+
+    async def create_table(self, table_name: str) -> Dict[str, Any]:
+        return await self.call("CreateTable", {"table_name": table_name})
+
+    async def delete_table(self, table_name: str) -> Dict[str, Any]:
+        return await self.call("DeleteTable", {"table_name": table_name})
+
+    async def get_item(
+        self, table_name: str, id: str, embeddings: bool = False
+    ) -> Dict[str, Any]:
+        if embeddings:
+            return await self.call(
+                "GetItem", {"table_name": table_name, "id": id, "embeddings": True}
+            )
+        return await self._coalesced("GetItem", {"table_name": table_name, "id": id})
+
+    async def put_item(self, table_name: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._coalesced(
+            "PutItem", {"table_name": table_name, "item": item}
+        )
+
+    async def delete_item(self, table_name: str, id: str) -> Dict[str, Any]:
+        return await self.call("DeleteItem", {"table_name": table_name, "id": id})
+
+    async def scan(self, table_name: str) -> List[Dict[str, Any]]:
+        return await self.call("Scan", {"table_name": table_name})
+
+    async def query(
+        self,
+        table_name: str,
+        filters: Optional[Dict[str, Any]] = None,
+        limit: int = 25,
+        offset: int = 0,
+    ) -> List[Dict[str, Any]]:
+        return await self.call(
+            "Query",
+            {
+                "table_name": table_name,
+                "filters": filters or {},
+                "limit": limit,
+                "offset": offset,
+            },
+        )
+
+    async def batch_get_item(
+        self, table_name: str, ids: List[str], embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        properties: Dict[str, Any] = {"table_name": table_name, "ids": ids}
+        if embeddings:
+            properties["embeddings"] = True
+        return await self.call("BatchGetItem", properties)
+
+    async def batch_write_item(
+        self, table_name: str, items: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        return await self.call(
+            "BatchWriteItem", {"table_name": table_name, "items": items}
+        )
+
+    async def update_item(
+        self, table_name: str, id: str, updates: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        return await self.call(
+            "UpdateItem", {"table_name": table_name, "id": id, "updates": updates}
+        )
+
+    async def add_to_vector_store(
+        self,
+        table_name: str,
+        documents: List[Dict[str, Any]],
+        batch_size: Optional[int] = None,
+    ) -> Any:
+        properties: Dict[str, Any] = {"table_name": table_name, "documents": documents}
+        if batch_size is not None:
+            properties["batch_size"] = batch_size
+        return await self.call("AddToVectorStore", properties)
+
+    async def delete_from_vector_store(self, table_name: str, id: str) -> Any:
+        return await self.call(
+            "DeleteFromVectorStore", {"table_name": table_name, "id": id}
+        )
+
+    async def search_vector_store(
+        self,
+        table_name: str,
+        query: str,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: Literal["vector", "lexical", "hybrid"] = "vector",
+        weights: Optional[Dict[str, float]] = None,
+        budget: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        properties: Dict[str, Any] = {"table_name": table_name, "query": query, "k": k}
+        if mode != "vector":
+            properties["mode"] = mode
+        if filters:
+            properties["filters"] = filters
+        if weights:
+            properties["weights"] = weights
+        if budget is not None:
+            properties["budget"] = budget
+        if nprobe is not None:
+            properties["nprobe"] = nprobe
+        if ef_search is not None:
+            properties["ef_search"] = ef_search
+        return await self.call("SearchVectorStore", properties)
+
+    async def search_vector_store_many(
+        self,
+        table_name: str,
+        queries: List[Dict[str, Any]],
+        k: int = 5,
+        combine: Literal["separate", "dedupe", "merge"] = "separate",
+        mode: Literal["vector", "lexical", "hybrid"] = "vector",
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        """
+        Runs several queries in one round trip. Each is `{"query": text}` or
+        `{"vector": embedding}`, optionally with its own `k` and `filters`;
+        `filters` applies to the queries that set none.
+        """
+        properties: Dict[str, Any] = {
+            "table_name": table_name,
+            "queries": queries,
+            "k": k,
+            "combine": combine,
+        }
+        if mode != "vector":
+            properties["mode"] = mode
+        if nprobe is not None:
+            properties["nprobe"] = nprobe
+        if ef_search is not None:
+            properties["ef_search"] = ef_search
+        if filters:
+            properties["filters"] = filters
+        return await self.call("SearchVectorStore", properties)
+
+    async def configure_vector_index(self, table_name: str, **index: Any) -> Any:
+        """Sets the table's IndexSpec, e.g. `type="hnsw", metric="cosine"`."""
+        return await self.call(
+            "ConfigureVectorIndex", {"table_name": table_name, "index": index}
+        )
+
+    async def update_in_vector_store(
+        self,
+        table_name: str,
+        id: str,
+        content: str,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        return await self.call(
+            "UpdateInVectorStore",
+            {
+                "table_name": table_name,
+                "id": id,
+                "content": content,
+                "metadata": metadata,
+            },
+        )
+
+    async def batch(
+        self, requests: List[Dict[str, Any]], ordered: bool = True
+    ) -> List[Dict[str, Any]]:
+        """Runs a Batch envelope; returns one response frame per sub-request."""
+        return await self.call("Batch", {"requests": requests, "ordered": ordered})
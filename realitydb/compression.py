@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Mapping, Tuple, Union
+
+import orjson
+import zstandard as zstd
+from pydantic import BaseModel, Field
+from typing_extensions import Literal
+
+from .metrics import metrics
+from .tracing import tracer
+from .utils import INVALID_REQUEST, PARSE_ERROR, RPCError, asyncify
+
+# A WebSocket message: text frames carry plain JSON, binary frames carry
+# Zstd-compressed JSON.
+Message = Union[str, bytes]
+
+MAX_MESSAGE_BYTES = 64 << 20
+# Frames whose result holds at least this many items are serialized on the
+# worker pool too, as orjson.dumps of thousands of rows blocks the loop.
+LARGE_RESULT_ITEMS = 256
+SAMPLE_BYTES = 16 << 10
+SAMPLES = 3
+
+COMPRESSED_BYTES = metrics.counter(
+    "realitydb_compression_bytes_total",
+    "Bytes before (raw) and after (wire) compression of Zstd frames.",
+    ("direction", "stage"),
+)
+SKIPPED = metrics.counter(
+    "realitydb_compression_skipped_total",
+    "Large frames sent uncompressed because they did not compress well.",
+)
+
+
+class CompressionConfig(BaseModel):
+    """
+    Per-connection compression, negotiated with query parameters on the
+    WebSocket URL, e.g. `ws://host/prefix?compression=zstd&threshold=16384`.
+
+    Responses of at least `threshold` bytes are sent as binary frames holding
+    Zstd-compressed JSON unless a sample shows they would shrink by less
+    than `min_savings` (media that is already compressed, such as JPEG bytes
+    in base64). Clients may send binary Zstd frames in either mode.
+    """
+
+    compression: Literal["none", "zstd"] = "none"
+    threshold: int = Field(default=16 << 10, ge=0)
+    level: int = Field(default=3, ge=1, le=22)
+    min_savings: float = Field(default=0.3, ge=0, lt=1)
+
+    @classmethod
+    def from_query(cls, params: Mapping[str, str]) -> CompressionConfig:
+        fields = {k: v for k, v in params.items() if k in cls.model_fields}
+        try:
+            return cls.model_validate(fields)
+        except ValueError as e:
+            raise RPCError(
+                code=INVALID_REQUEST, message=f"Invalid compression settings: {e}"
+            ) from e
+
+
+_local = threading.local()
+
+
+def _compressor(level: int) -> zstd.ZstdCompressor:
+    # Compressors are not thread-safe; keep one per worker thread and level.
+    compressors: Dict[int, zstd.ZstdCompressor] = _local.__dict__.setdefault(
+        "compressors", {}
+    )
+    compressor = compressors.get(level)
+    if compressor is None:
+        compressor = compressors[level] = zstd.ZstdCompressor(level=level)
+    return compressor
+
+
+def _sample(data: bytes) -> bytes:
+    if len(data) <= SAMPLE_BYTES * SAMPLES:
+        return data
+    step = (len(data) - SAMPLE_BYTES) // (SAMPLES - 1)
+    return b"".join(data[i * step : i * step + SAMPLE_BYTES] for i in range(SAMPLES))
+
+
+def compressible(data: bytes, min_savings: float) -> bool:
+    """Estimates from a few fast-compressed slices whether `data` is worth it."""
+    sample = _sample(data)
+    return len(_compressor(1).compress(sample)) <= len(sample) * (1 - min_savings)
+
+
+def decompress(data: bytes, max_size: int = MAX_MESSAGE_BYTES) -> bytes:
+    try:
+        if zstd.frame_content_size(data) > max_size:
+            raise RPCError(code=INVALID_REQUEST, message="Message too large")
+        # `max_output_size` bounds frames that do not record their size.
+        return zstd.ZstdDecompressor().decompress(data, max_output_size=max_size)
+    except zstd.ZstdError as e:
+        raise RPCError(code=PARSE_ERROR, message=f"Invalid Zstd frame: {e}") from e
+
+
+class Codec:
+    """Encodes outgoing frames and decodes incoming messages for a connection."""
+
+    def __init__(self, config: CompressionConfig) -> None:
+        self.config = config
+
+    def _compress(self, data: bytes) -> Message:
+        config = self.config
+        if not compressible(data, config.min_savings):
+            return data.decode("utf-8")
+        return _compressor(config.level).compress(data)
+
+    def _serialize(self, frame: Dict[str, Any]) -> bytes:
+        with tracer.span("codec.encode") as span:
+            data = orjson.dumps(frame)
+            if span is not None:
+                span.set(bytes=len(data))
+        return data
+
+    def _compresses(self, size: int) -> bool:
+        return self.config.compression != "none" and size >= self.config.threshold
+
+    def _encode(self, frame: Dict[str, Any]) -> Tuple[int, Message]:
+        data = self._serialize(frame)
+        if not self._compresses(len(data)):
+            return len(data), data.decode("utf-8")
+        with tracer.span("codec.compress", bytes=len(data)):
+            return len(data), self._compress(data)
+
+    async def encode(self, frame: Dict[str, Any]) -> Message:
+        """
+        Serializes `frame`. Large frames are serialized and compressed on
+        the worker pool, so small frames on the same connection are not held
+        up behind them.
+        """
+        result = frame.get("result")
+        if isinstance(result, (list, dict)) and len(result) >= LARGE_RESULT_ITEMS:
+            size, message = await asyncify(self._encode)(frame)
+        else:
+            data = self._serialize(frame)
+            size = len(data)
+            if not self._compresses(size):
+                return data.decode("utf-8")
+            with tracer.span("codec.compress", bytes=size):
+                message = await asyncify(self._compress)(data)
+        if isinstance(message, bytes):
+            COMPRESSED_BYTES.labels("out", "raw").inc(size)
+            COMPRESSED_BYTES.labels("out", "wire").inc(len(message))
+        elif self._compresses(size):
+            SKIPPED.inc()
+        return message
+
+    async def decode(self, message: Message) -> Any:
+        if isinstance(message, str):
+            return orjson.loads(message)
+        if len(message) < self.config.threshold:
+            data = decompress(message)
+        else:
+            data = await asyncify(decompress)(message)
+        COMPRESSED_BYTES.labels("in", "wire").inc(len(message))
+        COMPRESSED_BYTES.labels("in", "raw").inc(len(data))
+        return orjson.loads(data)
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Dict,
+    Optional,
+    Set,
+)
+
+from .compression import Message
+from .utils import get_logger
+
+if TYPE_CHECKING:
+    from .streaming import ResultStream
+
+logger = get_logger(__name__)
+
+MAX_CONCURRENCY = 32
+
+
+class Connection:
+    """
+    Per-WebSocket state: frame encoding, serialized sends, the requests being
+    served and the result streams open on the socket.
+
+    Requests are served in the order they arrive: each starts once the ones
+    before it have finished. Requests sent with `"concurrent": true` only
+    wait for the ordered requests before them, and run alongside each other.
+    At most `max_concurrency` requests are in flight; the receive loop waits
+    for a free slot, which pushes back on clients that pipeline too much.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Message], Awaitable[None]],
+        encode: Callable[[Dict[str, Any]], Awaitable[Message]],
+        max_concurrency: int = MAX_CONCURRENCY,
+    ) -> None:
+        self._send = send
+        self._encode = encode
+        self._send_lock = asyncio.Lock()
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.tasks: Set[asyncio.Task[None]] = set()
+        # The last ordered request, which later requests start after.
+        self.barrier: Optional[asyncio.Task[None]] = None
+        self.streams: Dict[str, ResultStream] = {}
+
+    async def send(self, frame: Dict[str, Any]) -> int:
+        """Sends `frame`; returns the size of the message put on the wire."""
+        # Encode outside the lock so a large frame being compressed does not
+        # delay small frames from other requests.
+        message = await self._encode(frame)
+        async with self._send_lock:
+            await self._send(message)
+        return len(message)
+
+    async def spawn(
+        self, coro: Coroutine[Any, Any, None], concurrent: bool = False
+    ) -> None:
+        """
+        Runs `coro` in the background once a concurrency slot is free and
+        the requests it is ordered after have finished.
+        """
+        await self.slots.acquire()
+        if concurrent:
+            after = {self.barrier} if self.barrier is not None else set()
+        else:
+            after = set(self.tasks)
+        task = asyncio.ensure_future(self._after(after, coro))
+        if not concurrent:
+            self.barrier = task
+        self.tasks.add(task)
+        task.add_done_callback(self._done)
+
+    @staticmethod
+    async def _after(
+        after: Set[asyncio.Task[None]], coro: Coroutine[Any, Any, None]
+    ) -> None:
+        try:
+            if after:
+                await asyncio.wait(after)
+        except BaseException:
+            coro.close()
+            raise
+        await coro
+
+    def _done(self, task: asyncio.Task[None]) -> None:
+        self.tasks.discard(task)
+        if task is self.barrier:
+            self.barrier = None
+        self.slots.release()
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Request task failed: %s", task.exception())
+
+    async def close(self) -> None:
+        for stream in list(self.streams.values()):
+            stream.cancel()
+        for task in list(self.tasks):
+            task.cancel()
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
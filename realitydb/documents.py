@@ -4,6 +4,7 @@ from datetime import datetime, date, time, timedelta
 from decimal import Decimal
 from pathlib import Path
 from dataclasses import dataclass
+from typing import Optional
 from PyPDF2 import PdfReader
 from docx import Document as init_docx
 from docx.document import Document as DocxDocument
@@ -69,15 +70,18 @@ class PDFFile(DocumentFile[PDFDocument]):
     def __load__(self):
         return open_pdf(self.name)
 
-    def extract_text(self):  # type: ignore
+    def pages(self):
+        return self.file.page_count
+
+    def extract_text(self, start: int = 0, stop: Optional[int] = None):  # type: ignore
         text_doc = PdfReader(self.name)
-        for page_number in range(len(text_doc.pages)):
+        for page_number in range(len(text_doc.pages))[start:stop]:
             page = text_doc.pages[page_number]
             yield page.extract_text()
 
-    def extract_images(self):
+    def extract_images(self, start: int = 0, stop: Optional[int] = None):
         img_doc = open_pdf(Path(self.name).as_posix())  # type: ignore
-        for page in img_doc:  # type: ignore
+        for page in img_doc.pages(start, stop):  # type: ignore
             for img in page.get_images():  # type: ignore
                 xref = img[0]  # type: ignore
                 base_image = img_doc.extract_image(xref)  # type: ignore
@@ -118,9 +122,13 @@ class ExcelFile(DocumentFile[Workbook]):
 class PPTXFile(DocumentFile[PPTXDocument]):
     def __load__(self):
         return init_pptx(self.name)
-    def extract_text(self):
+
+    def pages(self):
+        return len(self.file.slides)
+
+    def extract_text(self, start: int = 0, stop: Optional[int] = None):
         prs = self.__load__()
-        for slide in prs.slides:  # type: ignore
+        for slide in list(prs.slides)[start:stop]:  # type: ignore
             for shape in slide.shapes:  # type: ignore
                 if shape.has_text_frame:  # type: ignore
                     text_frame = shape.text_frame  # type: ignore
@@ -130,9 +138,9 @@ class PPTXFile(DocumentFile[PPTXDocument]):
                         else:
                             continue
 
-    def extract_images(self):
+    def extract_images(self, start: int = 0, stop: Optional[int] = None):
         prs = self.__load__()
-        for slide in prs.slides:  # type: ignore
+        for slide in list(prs.slides)[start:stop]:  # type: ignore
             for shape in slide.shapes:  # type: ignore
                 if shape.shape_type == 13:  # type: ignore
                     image = shape.image  # type: ignore
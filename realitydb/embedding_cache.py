@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import atexit
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from rocksdict import Options, Rdict, WriteBatch  # pylint: disable=E0611
+
+from .metrics import metrics
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+CACHE_PATH = os.environ.get(
+    "REALITYDB_EMBEDDING_CACHE_PATH", "/tmp/.realitydb/embeddings"
+)
+# Embeddings kept in memory in front of RocksDB; 0 disables the front.
+CACHE_ENTRIES = int(os.environ.get("REALITYDB_EMBEDDING_CACHE_ENTRIES", 10_000))
+# Key of the model the persisted entries were computed with; entry keys are
+# content digests, which never start with a NUL byte.
+MODEL = "\x00model"
+
+LOOKUPS = metrics.counter(
+    "realitydb_embedding_cache_lookups_total",
+    "Embedding cache lookups, by result (memory, disk or miss).",
+    ("result",),
+)
+
+
+def digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embeddings keyed by (model, content digest): an LRU of `max_entries`
+    vectors in front of a RocksDB store at `path`.
+
+    The store holds the entries of one model at a time. Using the cache with
+    another model than the one its entries were computed with drops them, so
+    a model change never serves stale vectors. If the store cannot be opened,
+    e.g. because another process holds it, the cache runs in memory only.
+    """
+
+    def __init__(
+        self, path: Optional[str] = CACHE_PATH, max_entries: int = CACHE_ENTRIES
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.model: Optional[str] = None
+        self.lock = threading.Lock()
+        self._db: Optional[Rdict] = None
+        self._opened = False
+        self._entries: OrderedDict[str, np.ndarray] = OrderedDict()
+
+    def _open(self) -> Optional[Rdict]:
+        if not self._opened:
+            self._opened = True
+            if self.path is not None:
+                try:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    self._db = Rdict(self.path, Options())
+                except Exception as e:
+                    logger.warning(
+                        "Embedding cache %s unavailable, keeping it in memory: %s",
+                        self.path,
+                        e,
+                    )
+                else:
+                    self.model = self._db.get(MODEL)
+        return self._db
+
+    def _use(self, model: str) -> Optional[Rdict]:
+        """Opens the store and invalidates it if it belongs to another model."""
+        db = self._open()
+        if model != self.model:
+            if self.model is not None:
+                logger.info(
+                    "Embedding model changed from %s to %s, dropping cached embeddings",
+                    self.model,
+                    model,
+                )
+            self._entries.clear()
+            if db is not None:
+                db.delete_range("", "\xff")
+                db.put(MODEL, model)
+            self.model = model
+        return db
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """The cached embeddings of `texts` with `model`, None where missing."""
+        keys = [digest(text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self.lock:
+            db = self._use(model)
+            missing = []
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is None:
+                    missing.append(key)
+                else:
+                    self._entries.move_to_end(key)
+                    found[key] = vector
+            hits = len(keys) - len(missing)
+            if db is not None and missing:
+                for key, value in zip(missing, db.get(missing)):
+                    if value is not None:
+                        vector = np.frombuffer(value, dtype=np.float32)
+                        self._remember(key, vector)
+                        found[key] = vector
+        LOOKUPS.labels("memory").inc(hits)
+        LOOKUPS.labels("disk").inc(len(found) - hits)
+        LOOKUPS.labels("miss").inc(len(keys) - len(found))
+        return [found.get(key) for key in keys]
+
+    def put(self, model: str, texts: Iterable[str], vectors: np.ndarray) -> None:
+        batch = WriteBatch()
+        with self.lock:
+            db = self._use(model)
+            for text, vector in zip(texts, vectors):
+                vector = np.ascontiguousarray(vector, dtype=np.float32)
+                key = digest(text)
+                self._remember(key, vector)
+                batch.put(key, vector.tobytes())
+            if db is not None and len(batch):
+                db.write(batch)
+
+    def close(self) -> None:
+        with self.lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+            self._opened = False
+            self.model = None
+            self._entries.clear()
+
+
+def _hit_rate() -> Iterable[Tuple[Dict[str, str], float]]:
+    counts = {
+        result: LOOKUPS.labels(result).value for result in ("memory", "disk", "miss")
+    }
+    total = sum(counts.values())
+    if total:
+        yield {}, (counts["memory"] + counts["disk"]) / total
+
+
+embedding_cache = EmbeddingCache()
+atexit.register(embedding_cache.close)
+
+metrics.collector(
+    "realitydb_embedding_cache_hit_rate",
+    "Share of embedding lookups answered from the cache since start.",
+    _hit_rate,
+)
+metrics.collector(
+    "realitydb_embedding_cache_entries",
+    "Embeddings held in memory by the embedding cache.",
+    lambda: [({}, float(len(embedding_cache._entries)))],
+)
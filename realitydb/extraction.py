@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import asyncio
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, List, Optional, Tuple
+
+from . import _extraction
+from .metrics import metrics
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+EXTRACT_WORKERS = int(
+    os.environ.get("REALITYDB_EXTRACT_WORKERS", min(os.cpu_count() or 1, 8))
+)
+# Pages (or slides) of a document extracted by one task.
+PAGES_PER_TASK = int(os.environ.get("REALITYDB_EXTRACT_PAGES_PER_TASK", 8))
+# Seconds a document may take to extract before its response is aborted.
+EXTRACT_TIMEOUT = float(os.environ.get("REALITYDB_EXTRACT_TIMEOUT", 300))
+# Workers fork from a server process that preloaded only the document
+# parsers (realitydb._extraction), rather than from the threaded server.
+START_METHOD = os.environ.get("REALITYDB_EXTRACT_START_METHOD", "forkserver")
+# Ends a response whose extraction failed or timed out after streaming began.
+INCOMPLETE = "<p class='realitydb-error'>%s; the output is incomplete.</p>"
+
+EXTRACTIONS = metrics.counter(
+    "realitydb_extractions_total",
+    "Document extractions, by outcome (ok, failed, timeout or cancelled).",
+    ("outcome",),
+)
+EXTRACT_TASKS = metrics.counter(
+    "realitydb_extract_tasks_total", "Page ranges submitted to extraction workers."
+)
+
+
+def kind_of(content_type: str) -> Optional[str]:
+    """The document kind of an upload's content type, None if unsupported."""
+    if "office" in content_type:
+        if "word" in content_type:
+            return "docx"
+        if "excel" in content_type:
+            return "excel"
+        if "powerpoint" in content_type:
+            return "pptx"
+        return None
+    if "pdf" in content_type:
+        return "pdf"
+    return None
+
+
+class Extractor:
+    """
+    Extracts documents on a pool of `workers` processes. PDFs and
+    presentations are split into tasks of `pages_per_task` pages or slides
+    that run in parallel; their results are streamed back in document order,
+    all text first, then all images.
+
+    A document not extracted within `timeout` seconds, or whose response is
+    cancelled, has its pending tasks cancelled. Tasks already running finish
+    their pages, as worker processes cannot be interrupted. A timeout or a
+    failure ends the output with an `INCOMPLETE` fragment.
+    """
+
+    def __init__(
+        self,
+        workers: int = EXTRACT_WORKERS,
+        pages_per_task: int = PAGES_PER_TASK,
+        timeout: float = EXTRACT_TIMEOUT,
+        start_method: str = START_METHOD,
+    ) -> None:
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+        self.timeout = timeout
+        self.start_method = start_method
+        self.lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def pool(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self._pool is None:
+                context = multiprocessing.get_context(self.start_method)
+                if self.start_method == "forkserver":
+                    context.set_forkserver_preload([_extraction.__name__])
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=context)
+            return self._pool
+
+    def _broken(self, pool: ProcessPoolExecutor) -> None:
+        """Replaces a pool whose worker died, e.g. on a malformed document."""
+        with self.lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def pages(self, kind: str, path: str) -> Optional[int]:
+        """
+        Opens the document in a worker, raising if it cannot be read, and
+        returns its number of pages if it can be split.
+        """
+        pool = self.pool()
+        try:
+            return await asyncio.wrap_future(pool.submit(_extraction.pages, kind, path))
+        except BrokenProcessPool:
+            self._broken(pool)
+            raise
+
+    def _spans(self, pages: Optional[int]) -> List[Tuple[Optional[int], Optional[int]]]:
+        if pages is None:
+            return [(None, None)]
+        step = max(self.pages_per_task, 1)
+        return [(start, min(start + step, pages)) for start in range(0, pages, step)]
+
+    async def extract(
+        self, kind: str, path: str, pages: Optional[int]
+    ) -> AsyncIterator[str]:
+        """The HTML of the text, then the images, of the document at `path`."""
+        pool = self.pool()
+        spans = self._spans(pages)
+        futures: List[Future[List[str]]] = [
+            pool.submit(_extraction.extract, kind, path, images, start, stop)
+            for images in (False, True)
+            for start, stop in spans
+        ]
+        EXTRACT_TASKS.inc(len(futures))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        outcome = "failed"
+        error: Optional[str] = None
+        try:
+            for future in futures:
+                remaining = max(deadline - loop.time(), 0)
+                try:
+                    fragments = await asyncio.wait_for(
+                        asyncio.wrap_future(future), remaining
+                    )
+                except asyncio.TimeoutError:
+                    outcome = "timeout"
+                    error = f"Extraction timed out after {self.timeout:g}s"
+                    logger.warning("Extracting %s timed out", path)
+                    break
+                for fragment in fragments:
+                    yield fragment
+            else:
+                outcome = "ok"
+        except BrokenProcessPool:
+            self._broken(pool)
+            error = "Extraction failed"
+            logger.error("Extraction worker died while extracting %s", path)
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            error = "Extraction failed"
+            logger.error("Extracting %s failed: %s", path, e)
+        finally:
+            for future in futures:
+                future.cancel()
+            EXTRACTIONS.labels(outcome).inc()
+        if error is not None:
+            # The response is already under way as a 200; say it is cut short.
+            yield INCOMPLETE % error
+
+    def close(self) -> None:
+        with self.lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+extractor = Extractor()
+atexit.register(extractor.close)
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+from rocksdict import Rdict, WriteBatch  # pylint: disable=E0611
+
+from .vector_index import BACKFILLED, LEXICAL_DOCS, LEXICAL_LENGTH, Labels, migrated
+
+# Key prefixes in the `vector_ids` column family: term postings map to the
+# term frequency, document lengths to the number of tokens. LEXICAL_DOCS and
+# LEXICAL_LENGTH hold the table-wide totals BM25 normalizes by.
+TERM = "\x00t\x00"
+LENGTH = "\x00l\x00"
+BACKFILL_CHUNK = 1024
+
+K1 = 1.2
+B = 0.75
+
+# Identifiers, SKUs, paths and filenames are kept whole ("ab-123.pdf") and
+# also split into their parts ("ab", "123", "pdf").
+_TOKEN = re.compile(r"\w+(?:[-./:#@+]\w+)*")
+_PART = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens: List[str] = []
+    for token in _TOKEN.findall(text.casefold()):
+        tokens.append(token)
+        parts = _PART.findall(token)
+        if parts != [token]:
+            tokens.extend(parts)
+    return tokens
+
+
+class Lexical:
+    """
+    A BM25 inverted index over the `content` of a table's documents, stored
+    with its labels so postings are written in the same WriteBatch as the
+    documents. Changes to the statistics are collected while staging and
+    written by `stage_totals`; hold `Labels.allocating` until the batch is.
+    """
+
+    def __init__(self, labels: Labels) -> None:
+        self.cf = labels.cf
+        self.handle = labels.handle
+        self.docs = 0
+        self.length = 0
+
+    @staticmethod
+    def _posting(term: str, label: int) -> str:
+        return "%s%s\x00%016x" % (TERM, term, label)
+
+    @staticmethod
+    def _length(label: int) -> str:
+        return "%s%016x" % (LENGTH, label)
+
+    def indexed(self, label: int) -> bool:
+        return self.cf.get(self._length(label)) is not None
+
+    def index(self, batch: WriteBatch, label: int, content: str) -> None:
+        tokens = tokenize(content)
+        for term, frequency in Counter(tokens).items():
+            batch.put(self._posting(term, label), frequency, self.handle)
+        batch.put(self._length(label), len(tokens), self.handle)
+        self.docs += 1
+        self.length += len(tokens)
+
+    def unindex(self, batch: WriteBatch, label: int, content: str) -> None:
+        if not self.indexed(label):
+            return
+        tokens = tokenize(content)
+        for term in set(tokens):
+            batch.delete(self._posting(term, label), self.handle)
+        batch.delete(self._length(label), self.handle)
+        self.docs -= 1
+        self.length -= len(tokens)
+
+    def stage_totals(self, batch: WriteBatch) -> None:
+        if self.docs or self.length:
+            batch.put(
+                LEXICAL_DOCS, self.cf.get(LEXICAL_DOCS, 0) + self.docs, self.handle
+            )
+            batch.put(
+                LEXICAL_LENGTH,
+                self.cf.get(LEXICAL_LENGTH, 0) + self.length,
+                self.handle,
+            )
+            self.docs = self.length = 0
+
+    def search(
+        self, query: str, k: int, candidates: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        The `k` best (label, BM25 score) pairs for `query`, best first,
+        among the `candidates` labels if given.
+        """
+        terms = set(tokenize(query))
+        docs = self.cf.get(LEXICAL_DOCS, 0)
+        if not terms or docs <= 0:
+            return []
+        average = max(self.cf.get(LEXICAL_LENGTH, 0) / docs, 1.0)
+        labels: List[np.ndarray] = []
+        weights: List[np.ndarray] = []
+        frequencies: List[np.ndarray] = []
+        it = self.cf.iter()
+        for term in terms:
+            prefix = "%s%s\x00" % (TERM, term)
+            found: List[int] = []
+            tf: List[int] = []
+            it.seek(prefix)
+            while it.valid():
+                key = it.key()
+                if not isinstance(key, str) or not key.startswith(prefix):
+                    break
+                found.append(int(key[len(prefix) :], 16))
+                tf.append(it.value())
+                it.next()
+            if not found:
+                continue
+            df = len(found)
+            term_labels = np.asarray(found, dtype=np.int64)
+            term_tf = np.asarray(tf, dtype=np.float64)
+            if candidates is not None:
+                keep = np.isin(term_labels, candidates)
+                term_labels, term_tf = term_labels[keep], term_tf[keep]
+            idf = math.log(1 + (docs - df + 0.5) / (df + 0.5))
+            labels.append(term_labels)
+            frequencies.append(term_tf)
+            weights.append(np.full(len(term_labels), idf))
+        del it
+        if not labels or not sum(map(len, labels)):
+            return []
+        all_labels = np.concatenate(labels)
+        unique, inverse = np.unique(all_labels, return_inverse=True)
+        lengths = np.asarray(
+            [
+                length or 0
+                for length in self.cf.get(
+                    [self._length(int(label)) for label in unique]
+                )
+            ],
+            dtype=np.float64,
+        )[inverse]
+        tf = np.concatenate(frequencies)
+        term_scores = (
+            np.concatenate(weights)
+            * tf
+            * (K1 + 1)
+            / (tf + K1 * (1 - B + B * lengths / average))
+        )
+        scores = np.bincount(inverse, weights=term_scores, minlength=len(unique))
+        best = np.argsort(-scores, kind="stable")[:k]
+        return [(int(unique[i]), float(scores[i])) for i in best]
+
+
+def backfill(db: Rdict) -> None:
+    """
+    Indexes the content and metadata of labelled documents stored before
+    the inverted index existed, labelling documents stored before labels
+    first. Runs once per table.
+    """
+    labels = migrated(db)
+    if labels.cf.get(BACKFILLED):
+        return
+    with labels.allocating:
+        if labels.cf.get(BACKFILLED):
+            return
+        lexical = Lexical(labels)
+
+        def flush(documents: List[Dict]) -> None:
+            batch = WriteBatch()
+            found = labels.labels([document["id"] for document in documents])
+            for label, document in zip(found, documents):
+                if label is not None and not lexical.indexed(label):
+                    lexical.index(batch, label, document.get("content") or "")
+                    labels.index_metadata(batch, label, document.get("metadata") or {})
+            lexical.stage_totals(batch)
+            if len(batch):
+                db.write(batch)
+
+        documents: List[Dict] = []
+        it = db.iter()
+        it.seek_to_first()
+        while it.valid():
+            document = orjson.loads(it.value())
+            if isinstance(document, dict) and "id" in document:
+                documents.append(document)
+            if len(documents) >= BACKFILL_CHUNK:
+                flush(documents)
+                documents = []
+            it.next()
+        del it
+        if documents:
+            flush(documents)
+        labels.cf[BACKFILLED] = 1
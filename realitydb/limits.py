@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from .metrics import metrics
+from .utils import RPCError, executor, queue_latency
+
+RATE_LIMITED = 429
+OVERLOADED = 503
+# Token buckets kept per limiter; the least recently used are dropped first.
+MAX_BUCKETS = int(os.environ.get("REALITYDB_LIMIT_MAX_BUCKETS", 10_000))
+# Metric label shared by tenants without their own entry in `tenants`, as
+# tenant names come from client-chosen WebSocket paths.
+OTHER_TENANTS = "other"
+
+
+class Limit(BaseModel):
+    """
+    Token-bucket rate (requests/second), burst size and concurrency cap.
+    Unset fields are unlimited.
+    """
+
+    rate: Optional[float] = Field(default=None, gt=0)
+    burst: Optional[float] = Field(default=None, gt=0)
+    concurrency: Optional[int] = Field(default=None, gt=0)
+
+
+class Admission(BaseModel):
+    """Global load shedding based on the storage thread pool backlog."""
+
+    target_queue_latency: Optional[float] = Field(default=0.25, gt=0)
+    max_queue_depth: Optional[int] = Field(default=None, gt=0)
+    retry_after: float = Field(default=0.5, ge=0)
+
+
+class LimitsConfig(BaseModel):
+    """
+    Limits applied to every top-level request.
+
+    `tenant` applies to each tenant separately unless overridden in `tenants`;
+    `methods` applies per method, shared by all tenants.
+    """
+
+    tenant: Limit = Field(default_factory=Limit)
+    tenants: Dict[str, Limit] = Field(default_factory=dict)
+    methods: Dict[str, Limit] = Field(default_factory=dict)
+    admission: Admission = Field(default_factory=Admission)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1.0) -> float:
+        """
+        Takes `cost` tokens; returns 0 on success or seconds until available,
+        infinite if `cost` exceeds the burst size.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if cost > self.burst:
+            return math.inf
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def refund(self, cost: float = 1.0) -> None:
+        self.tokens = min(self.burst, self.tokens + cost)
+
+    def idle(self, now: float) -> bool:
+        """Whether the bucket has refilled, so dropping it changes nothing."""
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+REJECTED = metrics.counter(
+    "realitydb_rejected_requests_total",
+    "Requests rejected by rate limits, concurrency caps or admission control; "
+    f"tenants not configured in `tenants` are counted as {OTHER_TENANTS!r}.",
+    ("tenant", "method", "reason"),
+)
+
+
+class Limiter:
+    """
+    Per-tenant and per-method token buckets and concurrency caps, plus a
+    global admission controller that sheds load while the storage thread
+    pool has a standing queue.
+
+    Rejections raise `RPCError` with code 429 (rate or concurrency limit) or
+    503 (overload) and `data={"retryable": True, "retry_after": seconds}`.
+    A request costs one token, a `Batch` one per sub-request; one costing
+    more than a bucket's burst can never be admitted and is rejected with
+    429 and `data={"retryable": False}`.
+    """
+
+    def __init__(
+        self,
+        config: Optional[LimitsConfig] = None,
+        queue_depth: Callable[[], int] = lambda: executor._work_queue.qsize(),
+        max_buckets: int = MAX_BUCKETS,
+    ) -> None:
+        self.queue_depth = queue_depth
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Tuple[str, str], int] = {}
+        self.configure(config or LimitsConfig())
+        _limiters.add(self)
+
+    def configure(self, config: LimitsConfig) -> None:
+        """Replaces the active limits; buckets restart full."""
+        with self._lock:
+            self.config = config
+            self._buckets: OrderedDict[Tuple[str, str], TokenBucket] = OrderedDict()
+
+    def _limit(self, scope: str, key: str) -> Limit:
+        if scope == "method":
+            return self.config.methods.get(key) or _UNLIMITED
+        return self.config.tenants.get(key) or self.config.tenant
+
+    def _bucket(self, scope: str, key: str, limit: Limit) -> Optional[TokenBucket]:
+        if limit.rate is None:
+            return None
+        bucket = self._buckets.get((scope, key))
+        if bucket is None:
+            self._evict()
+            bucket = self._buckets[(scope, key)] = TokenBucket(
+                limit.rate, limit.burst or max(limit.rate, 1.0)
+            )
+        else:
+            self._buckets.move_to_end((scope, key))
+        return bucket
+
+    def _tenant_label(self, tenant: str) -> str:
+        return tenant if tenant in self.config.tenants else OTHER_TENANTS
+
+    def _evict(self) -> None:
+        """
+        Makes room for a new bucket by dropping the least recently used
+        buckets that have refilled, and any beyond `max_buckets`, so tenants
+        seen once do not accumulate.
+        """
+        now = time.monotonic()
+        while self._buckets:
+            bucket = next(iter(self._buckets.values()))
+            if len(self._buckets) < self.max_buckets and not bucket.idle(now):
+                break
+            self._buckets.popitem(last=False)
+
+    def _reject(self, tenant: str, method: str, reason: str, code: int, retry: float):
+        REJECTED.labels(self._tenant_label(tenant), method, reason).inc()
+        message = {
+            "rate": "Rate limit exceeded",
+            "concurrency": "Too many concurrent requests",
+            "overload": "Server overloaded",
+            "cost": "Request cost exceeds the burst size",
+        }[reason]
+        data = (
+            {"retryable": False}
+            if math.isinf(retry)
+            else {"retryable": True, "retry_after": round(retry, 3)}
+        )
+        return RPCError(
+            code=code, message=f"{message} for {tenant}/{method}", data=data
+        )
+
+    def admit(self, tenant: str, method: str) -> None:
+        admission = self.config.admission
+        if (
+            admission.target_queue_latency is not None
+            and queue_latency.value > admission.target_queue_latency
+        ) or (
+            admission.max_queue_depth is not None
+            and self.queue_depth() >= admission.max_queue_depth
+        ):
+            raise self._reject(
+                tenant, method, "overload", OVERLOADED, admission.retry_after
+            )
+
+    def acquire(
+        self, tenant: str, method: str, cost: float = 1.0
+    ) -> Callable[[], None]:
+        """
+        Admits one request, returning the callable that releases its
+        concurrency slots.
+        """
+        self.admit(tenant, method)
+        scopes = (("tenant", tenant), ("method", method))
+        with self._lock:
+            limits = [self._limit(scope, key) for scope, key in scopes]
+            for (scope, key), limit in zip(scopes, limits):
+                if (
+                    limit.concurrency is not None
+                    and self._in_flight.get((scope, key), 0) >= limit.concurrency
+                ):
+                    raise self._reject(tenant, method, "concurrency", RATE_LIMITED, 0)
+            taken = []
+            for (scope, key), limit in zip(scopes, limits):
+                bucket = self._bucket(scope, key, limit)
+                if bucket is None:
+                    continue
+                wait = bucket.take(cost)
+                if wait:
+                    for previous in taken:
+                        previous.refund(cost)
+                    reason = "cost" if math.isinf(wait) else "rate"
+                    raise self._reject(tenant, method, reason, RATE_LIMITED, wait)
+                taken.append(bucket)
+            for scope_key in scopes:
+                self._in_flight[scope_key] = self._in_flight.get(scope_key, 0) + 1
+
+        def release() -> None:
+            with self._lock:
+                for scope_key in scopes:
+                    self._in_flight[scope_key] -= 1
+                    if not self._in_flight[scope_key]:
+                        del self._in_flight[scope_key]
+
+        return release
+
+
+_UNLIMITED = Limit()
+_limiters: weakref.WeakSet[Limiter] = weakref.WeakSet()
+
+
+def _collect_in_flight() -> Iterable[Tuple[Dict[str, str], float]]:
+    totals: Dict[Tuple[str, str], int] = {}
+    for limiter in list(_limiters):
+        for (scope, key), count in list(limiter._in_flight.items()):
+            if scope == "tenant":
+                key = limiter._tenant_label(key)
+            totals[(scope, key)] = totals.get((scope, key), 0) + count
+    for (scope, key), count in totals.items():
+        yield {"scope": scope, "key": key}, float(count)
+
+
+def tenant_of(prefix: str) -> str:
+    """The tenant is the first segment of the WebSocket path."""
+    return prefix.split("/", 1)[0]
+
+
+metrics.collector(
+    "realitydb_limited_in_flight",
+    "In-flight requests counted against concurrency caps.",
+    _collect_in_flight,
+)
+metrics.collector(
+    "realitydb_queue_latency_seconds",
+    "Standing queue latency of the storage thread pool.",
+    lambda: [({}, queue_latency.value)],
+)
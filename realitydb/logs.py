@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import random
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from .metrics import metrics
+from .utils import dropped_log_records, get_logger
+
+access_logger = get_logger("realitydb.access")
+slow_logger = get_logger("realitydb.slow")
+
+REDACTED = "[redacted]"
+
+metrics.collector(
+    "realitydb_log_records_dropped",
+    "Log records dropped because the background writer fell behind.",
+    lambda: [({}, float(dropped_log_records()))],
+)
+
+
+class LogConfig(BaseModel):
+    """
+    Request logging. Each completed request is logged to `realitydb.access`
+    with probability `sample_rate` (overridable per method in `methods`);
+    requests slower than `slow_threshold` seconds are always logged to
+    `realitydb.slow` with their timing breakdown.
+    """
+
+    sample_rate: float = Field(default=0.01, ge=0, le=1)
+    methods: Dict[str, float] = Field(default_factory=dict)
+    slow_threshold: Optional[float] = Field(default=0.5, ge=0)
+    max_string: int = Field(default=128, ge=0)
+    max_items: int = Field(default=10, ge=0)
+    max_depth: int = Field(default=4, ge=1)
+    # Keys containing any of these, ignoring case, are masked.
+    redact: List[str] = Field(
+        default_factory=lambda: [
+            "key",
+            "password",
+            "token",
+            "secret",
+            "authorization",
+            "embedding",
+        ]
+    )
+
+
+def redacted(key: str, config: LogConfig) -> bool:
+    key = key.lower()
+    return any(word.lower() in key for word in config.redact)
+
+
+def summarize(value: Any, config: LogConfig, depth: int = 0) -> Any:
+    """
+    Returns a bounded copy of `value` for logging: long strings and lists are
+    truncated, redacted keys are masked and deep nesting is elided.
+    """
+    if isinstance(value, str):
+        if len(value) > config.max_string:
+            return "%s...(+%d chars)" % (
+                value[: config.max_string],
+                len(value) - config.max_string,
+            )
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return "<%d bytes>" % len(value)
+    if isinstance(value, dict):
+        if depth >= config.max_depth:
+            return "{...%d keys}" % len(value)
+        summary = {}
+        for k, v in list(value.items())[: config.max_items]:
+            summary[k] = (
+                REDACTED
+                if isinstance(k, str) and redacted(k, config)
+                else summarize(v, config, depth + 1)
+            )
+        if len(value) > config.max_items:
+            summary["..."] = "+%d keys" % (len(value) - config.max_items)
+        return summary
+    if isinstance(value, (list, tuple)):
+        if depth >= config.max_depth:
+            return "[...%d items]" % len(value)
+        summary_list = [
+            summarize(v, config, depth + 1) for v in value[: config.max_items]
+        ]
+        if len(value) > config.max_items:
+            summary_list.append("+%d items" % (len(value) - config.max_items))
+        return summary_list
+    return value
+
+
+class RequestLog:
+    """Sampled access log and slow-request log for RPC requests."""
+
+    def __init__(self, config: Optional[LogConfig] = None) -> None:
+        self.config = config or LogConfig()
+        self._random = random.random
+
+    def configure(self, config: LogConfig) -> None:
+        self.config = config
+
+    def record(
+        self,
+        *,
+        method: str,
+        properties: Any,
+        prefix: str,
+        request_id: Any,
+        code: Optional[int],
+        request_bytes: int,
+        response_bytes: Optional[int],
+        queued: float,
+        handled: float,
+        sent: float,
+    ) -> None:
+        """
+        Logs a completed request. `queued`, `handled` and `sent` are the
+        seconds spent waiting for a slot, running the method and encoding
+        and sending the response.
+        """
+        config = self.config
+        total = queued + handled + sent
+        slow = config.slow_threshold is not None and total >= config.slow_threshold
+        sampled = self._random() < config.methods.get(method, config.sample_rate)
+        if not slow and not sampled:
+            return
+        table_name = (
+            properties.get("table_name") if isinstance(properties, dict) else None
+        )
+        fields: Dict[str, Any] = {
+            "method": method,
+            "prefix": prefix,
+            "table": table_name,
+            "request_id": str(request_id),
+            "code": code,
+            "request_bytes": request_bytes,
+            "response_bytes": response_bytes,
+            "duration_ms": round(total * 1000, 3),
+            "properties": summarize(properties, config),
+        }
+        message = "%s %s/%s %s %.1fms"
+        args = (method, prefix, table_name, code or "ok", total * 1000)
+        if sampled:
+            access_logger.info(message, *args, extra={"fields": fields})
+        if slow:
+            timing = {
+                "queued": round(queued * 1000, 3),
+                "handled": round(handled * 1000, 3),
+                "sent": round(sent * 1000, 3),
+            }
+            slow_logger.warning(
+                message, *args, extra={"fields": dict(fields, timing_ms=timing)}
+            )
@@ -0,0 +1,298 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, cast
+
+from pydantic import Field, ValidationError
+from typing_extensions import Annotated, Literal, Required, TypedDict
+
+from .models import QUERY_LIMIT, DocumentObject
+from .registry import methods
+from .utils import INVALID_PARAMS, RPCError
+from .vector_index import IndexSpec, indexes
+from .vectorstore import EMBED_BATCH_SIZE, HYBRID_BUDGET, MAX_QUERIES, VectorStore
+
+
+class TableProperties(TypedDict, total=False):
+    table_name: Required[str]
+
+
+class ItemProperties(TableProperties, total=False):
+    id: Required[str]
+
+
+class ReadProperties(TypedDict, total=False):
+    # Only meaningful on read replicas: "strong" catches the table up with
+    # the primary before reading.
+    consistency: Literal["eventual", "strong"]
+
+
+class EmbeddingProperties(TypedDict, total=False):
+    # Vector store tables keep embeddings out of their items: attach them.
+    embeddings: bool
+
+
+class GetItemProperties(
+    ItemProperties, ReadProperties, EmbeddingProperties, total=False
+):
+    pass
+
+
+class PutItemProperties(TableProperties, total=False):
+    item: Required[Dict[str, Any]]
+
+
+class StreamProperties(TypedDict, total=False):
+    stream: bool
+    chunk_size: Annotated[int, Field(gt=0)]
+    max_frame_bytes: Annotated[int, Field(gt=0)]
+    credits: Annotated[int, Field(gt=0)]
+
+
+class ScanProperties(TableProperties, StreamProperties, ReadProperties, total=False):
+    pass
+
+
+class QueryProperties(TableProperties, StreamProperties, ReadProperties, total=False):
+    filters: Dict[str, Any]
+    limit: int
+    offset: int
+
+
+class BatchGetItemProperties(
+    TableProperties, ReadProperties, EmbeddingProperties, total=False
+):
+    ids: Required[List[str]]
+
+
+class BatchWriteItemProperties(TableProperties, total=False):
+    items: Required[List[Dict[str, Any]]]
+
+
+class UpdateItemProperties(ItemProperties, total=False):
+    updates: List[Dict[str, Any]]
+
+
+class VectorDocument(TypedDict, total=False):
+    content: Required[str]
+    metadata: Dict[str, Any]
+
+
+class AddToVectorStoreProperties(TableProperties, total=False):
+    documents: List[VectorDocument]
+    batch_size: Annotated[int, Field(gt=0, le=1024)]
+
+
+class VectorQuery(TypedDict, total=False):
+    # A text to embed or a precomputed embedding, which skips inference.
+    query: str
+    vector: List[float]
+    k: Annotated[int, Field(gt=0)]
+    filters: Dict[str, Any]
+
+
+class SearchVectorStoreProperties(TableProperties, total=False):
+    # Either a single query or several, answered in one pass.
+    query: str
+    queries: Annotated[List[VectorQuery], Field(min_length=1, max_length=MAX_QUERIES)]
+    combine: Literal["separate", "dedupe", "merge"]
+    k: Annotated[int, Field(gt=0)]
+    # Override the table's IndexSpec for this search.
+    nprobe: Annotated[int, Field(gt=0)]
+    ef_search: Annotated[int, Field(gt=0)]
+    # Top-level metadata values to match; a list matches any of its values.
+    # The default of `queries` that set no filters of their own.
+    filters: Dict[str, Any]
+    # "hybrid" fuses the vector and BM25 rankings, weighted per leg, within
+    # `budget` seconds.
+    mode: Literal["vector", "lexical", "hybrid"]
+    weights: Dict[Literal["vector", "lexical"], Annotated[float, Field(ge=0)]]
+    budget: Annotated[float, Field(gt=0)]
+
+
+class ConfigureVectorIndexProperties(TableProperties, total=False):
+    index: Required[IndexSpec]
+
+
+class UpdateInVectorStoreProperties(ItemProperties, total=False):
+    content: Required[str]
+    metadata: Optional[Dict[str, Any]]
+
+
+def _document(item: Dict[str, Any]) -> DocumentObject:
+    """The item as a DocumentObject; an invalid item is an INVALID_PARAMS error."""
+    try:
+        return DocumentObject(**item)
+    except ValidationError as e:
+        raise RPCError(
+            code=INVALID_PARAMS,
+            message="Invalid item",
+            data=e.errors(
+                include_url=False, include_context=False, include_input=False
+            ),
+        ) from e
+
+
+@methods.register("CreateTable", TableProperties)
+async def create_table(properties: TableProperties, prefix: str):
+    return await DocumentObject.create_table(
+        prefix=prefix, table_name=properties["table_name"]
+    )
+
+
+@methods.register("DeleteTable", TableProperties)
+async def delete_table(properties: TableProperties, prefix: str):
+    indexes.drop(prefix, properties["table_name"], purge=True)
+    return await DocumentObject.delete_table(
+        prefix=prefix, table_name=properties["table_name"]
+    )
+
+
+@methods.register("GetItem", GetItemProperties)
+async def get_item(properties: GetItemProperties, prefix: str):
+    item = await DocumentObject.get_item(
+        prefix=prefix, table_name=properties["table_name"], item_id=properties["id"]
+    )
+    if properties.get("embeddings"):
+        await VectorStore.attach_embeddings(
+            prefix=prefix, table_name=properties["table_name"], items=[item]
+        )
+    return item
+
+
+@methods.register("PutItem", PutItemProperties)
+async def put_item(properties: PutItemProperties, prefix: str):
+    item = _document(properties["item"])
+    return await item.put_item(prefix=prefix, table_name=properties["table_name"])
+
+
+@methods.register("DeleteItem", ItemProperties)
+async def delete_item(properties: ItemProperties, prefix: str):
+    return await DocumentObject.delete_item(
+        prefix=prefix, table_name=properties["table_name"], item_id=properties["id"]
+    )
+
+
+@methods.register("Scan", ScanProperties)
+async def scan(properties: ScanProperties, prefix: str):
+    return await DocumentObject.scan(prefix=prefix, table_name=properties["table_name"])
+
+
+@methods.register("Query", QueryProperties)
+async def query(properties: QueryProperties, prefix: str):
+    return await DocumentObject.query(
+        prefix=prefix,
+        table_name=properties["table_name"],
+        filters=properties.get("filters", {}),
+        limit=properties.get("limit", QUERY_LIMIT),
+        offset=properties.get("offset", 0),
+    )
+
+
+@methods.register("BatchGetItem", BatchGetItemProperties)
+async def batch_get_item(properties: BatchGetItemProperties, prefix: str):
+    items = await DocumentObject.batch_get_item(
+        prefix=prefix, table_name=properties["table_name"], ids=properties["ids"]
+    )
+    if properties.get("embeddings"):
+        await VectorStore.attach_embeddings(
+            prefix=prefix, table_name=properties["table_name"], items=items
+        )
+    return items
+
+
+@methods.register("BatchWriteItem", BatchWriteItemProperties)
+async def batch_write_item(properties: BatchWriteItemProperties, prefix: str):
+    items = [_document(item) for item in properties["items"]]
+    return await DocumentObject.batch_write_item(
+        prefix=prefix, table_name=properties["table_name"], items=items
+    )
+
+
+@methods.register("UpdateItem", UpdateItemProperties)
+async def update_item(properties: UpdateItemProperties, prefix: str):
+    return await DocumentObject.update_item(
+        prefix=prefix,
+        table_name=properties["table_name"],
+        item_id=properties["id"],
+        updates=properties.get("updates", []),
+    )
+
+
+@methods.register("AddToVectorStore", AddToVectorStoreProperties)
+async def add_to_vector_store(properties: AddToVectorStoreProperties, prefix: str):
+    return await VectorStore.add_documents(
+        properties.get("documents", []),
+        prefix,
+        properties["table_name"],
+        batch_size=properties.get("batch_size", EMBED_BATCH_SIZE),
+    )
+
+
+@methods.register("SearchVectorStore", SearchVectorStoreProperties)
+async def search_vector_store(properties: SearchVectorStoreProperties, prefix: str):
+    if "queries" in properties:
+        if "query" in properties:
+            raise RPCError(
+                code=INVALID_PARAMS, message="Pass either query or queries, not both"
+            )
+        return await VectorStore.search_many(
+            cast(List[Dict[str, Any]], properties["queries"]),
+            prefix=prefix,
+            table_name=properties["table_name"],
+            k=properties.get("k", 5),
+            nprobe=properties.get("nprobe"),
+            ef_search=properties.get("ef_search"),
+            mode=properties.get("mode", "vector"),
+            weights=properties.get("weights"),
+            budget=properties.get("budget", HYBRID_BUDGET),
+            combine=properties.get("combine", "separate"),
+            filters=properties.get("filters"),
+        )
+    if "query" not in properties:
+        raise RPCError(code=INVALID_PARAMS, message="query or queries is required")
+    if "combine" in properties:
+        raise RPCError(code=INVALID_PARAMS, message="combine applies to queries only")
+    return await VectorStore.search(
+        query=properties["query"],
+        k=properties.get("k", 5),
+        prefix=prefix,
+        table_name=properties["table_name"],
+        nprobe=properties.get("nprobe"),
+        ef_search=properties.get("ef_search"),
+        filters=properties.get("filters"),
+        mode=properties.get("mode", "vector"),
+        weights=properties.get("weights"),
+        budget=properties.get("budget", HYBRID_BUDGET),
+    )
+
+
+@methods.register("ConfigureVectorIndex", ConfigureVectorIndexProperties)
+async def configure_vector_index(
+    properties: ConfigureVectorIndexProperties, prefix: str
+):
+    table_name = properties["table_name"]
+    await indexes.configure(prefix, table_name, properties["index"])
+    return {
+        "message": f"Vector index of '{table_name}' configured",
+        "id": table_name,
+    }
+
+
+@methods.register("DeleteFromVectorStore", ItemProperties)
+async def delete_from_vector_store(properties: ItemProperties, prefix: str):
+    return await VectorStore.delete_document(
+        doc_id=properties["id"], prefix=prefix, table_name=properties["table_name"]
+    )
+
+
+@methods.register("UpdateInVectorStore", UpdateInVectorStoreProperties)
+async def update_in_vector_store(
+    properties: UpdateInVectorStoreProperties, prefix: str
+):
+    return await VectorStore.update_document(
+        doc_id=properties["id"],
+        new_content=properties["content"],
+        new_metadata=properties.get("metadata"),
+        prefix=prefix,
+        table_name=properties["table_name"],
+    )
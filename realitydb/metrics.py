@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, cast
+
+from .utils import executor
+
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+SIZE_BUCKETS: Tuple[float, ...] = tuple(float(64 * 4**i) for i in range(11))
+QUANTILES: Tuple[float, ...] = (0.5, 0.95, 0.99)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '%s="%s"'
+        % (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self) -> object:
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    "%s expects labels %s" % (self.name, ", ".join(self.labelnames))
+                )
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _label_dict(self, values: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterable[Sample]:
+        for values, child in self._children.items():
+            yield self.name, self._label_dict(values), child.value  # type: ignore
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimates the `q` quantile by linear interpolation within buckets."""
+        if self.count == 0:
+            return math.nan
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for i, upper in enumerate(self.buckets):
+            bucket = self.counts[i]
+            if cumulative + bucket >= rank and bucket:
+                return lower + (upper - lower) * (rank - cumulative) / bucket
+            cumulative += bucket
+            lower = upper
+        return self.buckets[-1]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self) -> Iterable[Sample]:
+        for values, child in self._children.items():
+            labels = self._label_dict(values)
+            cumulative = 0
+            for upper, count in zip(self.buckets, child.counts):  # type: ignore
+                cumulative += count
+                le = dict(labels, le=_format_value(upper))
+                yield self.name + "_bucket", le, cumulative
+            inf = dict(labels, le="+Inf")
+            yield self.name + "_bucket", inf, child.count  # type: ignore
+            yield self.name + "_sum", labels, child.sum  # type: ignore
+            yield self.name + "_count", labels, child.count  # type: ignore
+
+
+class Quantiles(_Metric):
+    """Exposes precomputed quantiles of a histogram as a gauge family."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        histogram: Histogram,
+        quantiles: Sequence[float] = QUANTILES,
+    ):
+        super().__init__(name, documentation, histogram.labelnames + ("quantile",))
+        self.histogram = histogram
+        self.quantiles = tuple(quantiles)
+
+    def samples(self) -> Iterable[Sample]:
+        for values, child in self.histogram._children.items():
+            labels = self.histogram._label_dict(values)
+            for q in self.quantiles:
+                value = child.quantile(q)  # type: ignore
+                if not math.isnan(value):
+                    yield self.name, dict(labels, quantile=str(q)), value
+
+
+class Collector(_Metric):
+    """A gauge family whose samples are produced at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], Iterable[Tuple[Dict[str, str], float]]],
+    ):
+        super().__init__(name, documentation)
+        self.collect = collect
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in self.collect():
+            yield self.name, labels, value
+
+
+class MetricsRegistry:
+    """
+    Holds metric families and renders them in the Prometheus text format.
+
+    Metrics are updated from the event loop without locking; scrape-time
+    collectors read shared state that is cheap to sample.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError("Metric %s already registered" % metric.name)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Counter:
+        return cast(Counter, self.register(Counter(name, documentation, labelnames)))
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Gauge:
+        return cast(Gauge, self.register(Gauge(name, documentation, labelnames)))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return cast(
+            Histogram,
+            self.register(Histogram(name, documentation, labelnames, buckets)),
+        )
+
+    def collector(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], Iterable[Tuple[Dict[str, str], float]]],
+    ) -> Collector:
+        return cast(Collector, self.register(Collector(name, documentation, collect)))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append("# HELP %s %s" % (metric.name, metric.documentation))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append(name + _format_labels(labels) + " " + _format_value(value))
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+REQUESTS = metrics.counter(
+    "realitydb_requests_total", "RPC requests handled.", ("method",)
+)
+ERRORS = metrics.counter(
+    "realitydb_request_errors_total", "RPC requests that failed.", ("method", "code")
+)
+LATENCY = metrics.histogram(
+    "realitydb_request_duration_seconds", "RPC request latency.", ("method",)
+)
+metrics.register(
+    Quantiles(
+        "realitydb_request_duration_quantile_seconds",
+        "Estimated p50/p95/p99 RPC latency.",
+        LATENCY,
+    )
+)
+REQUEST_SIZE = metrics.histogram(
+    "realitydb_request_size_bytes", "Size of request frames.", buckets=SIZE_BUCKETS
+)
+RESPONSE_SIZE = metrics.histogram(
+    "realitydb_response_size_bytes", "Size of response frames.", buckets=SIZE_BUCKETS
+)
+CONNECTIONS = metrics.gauge(
+    "realitydb_websocket_connections", "Open WebSocket connections."
+)
+IN_FLIGHT = metrics.gauge("realitydb_requests_in_flight", "Requests being processed.")
+THREAD_POOL_QUEUE = metrics.collector(
+    "realitydb_thread_pool_queue_depth",
+    "Calls waiting for a storage worker thread.",
+    lambda: [({}, float(executor._work_queue.qsize()))],
+)
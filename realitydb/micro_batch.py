@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+from typing import (
+    Awaitable,
+    Callable,
+    Generic,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from .metrics import metrics
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+MAX_WAIT = float(os.environ.get("REALITYDB_SEARCH_BATCH_WAIT", 0.002))
+MAX_BATCH = int(os.environ.get("REALITYDB_SEARCH_BATCH_MAX", 32))
+
+BATCH_SIZE = metrics.histogram(
+    "realitydb_micro_batch_size",
+    "Items processed together by a micro-batcher, by batcher.",
+    ("batcher",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collects items submitted within `max_wait` seconds of the first, up to
+    `max_batch`, and hands them to `process` at once, which returns one
+    result per item. 0 batches the items submitted in the same event loop
+    iteration.
+
+    `process` may return an exception in place of an item's result, which
+    fails that item's submitter only; an exception it raises fails the
+    whole batch.
+
+    Batches run outside of the submitters' contexts, so their work is not
+    traced as part of whichever request happened to arrive first.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        process: Callable[[List[T]], Awaitable[List[Union[R, BaseException]]]],
+        max_wait: float = MAX_WAIT,
+        max_batch: int = MAX_BATCH,
+    ) -> None:
+        self.name = name
+        self.process = process
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.queued: List[Tuple[T, asyncio.Future[R]]] = []
+        self.timer: Optional[asyncio.Handle] = None
+        self.tasks: Set[asyncio.Task[None]] = set()
+
+    def submit(self, item: T) -> asyncio.Future[R]:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[R] = loop.create_future()
+        self.queued.append((item, future))
+        if len(self.queued) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = (
+                loop.call_later(self.max_wait, self.flush)
+                if self.max_wait > 0
+                else loop.call_soon(self.flush)
+            )
+        return future
+
+    def flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        queued, self.queued = self.queued, []
+        # Submitters that gave up, e.g. a dropped hybrid search leg.
+        queued = [(item, future) for item, future in queued if not future.done()]
+        if queued:
+            task = contextvars.Context().run(asyncio.ensure_future, self._run(queued))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, queued: List[Tuple[T, asyncio.Future[R]]]) -> None:
+        BATCH_SIZE.labels(self.name).observe(len(queued))
+        try:
+            results = await self.process([item for item, _ in queued])
+        except BaseException as e:
+            for _, future in queued:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        for (_, future), result in zip(queued, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -1,15 +1,25 @@
 from __future__ import annotations
 
-import asyncio
+import os
+import threading
+import time
 import uuid
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union, cast
 
 import base64c as base64  # type: ignore
 from pydantic import BaseModel, Field
-from rocksdict import Rdict as Rdict  # pylint: disable=E0611
+from rocksdict import AccessType, Options, Rdict, WriteBatch  # pylint: disable=E0611
 from typing_extensions import Literal, Required, Self, TypeAlias, TypedDict
 
-from .utils import RPCError, asyncify
+from .metrics import metrics
+from .tracing import tracer
+from .utils import RPCError, asyncify, get_logger
+
+logger = get_logger(__name__)
+
+# Documents returned by a Query that sets no `limit`, streamed or not.
+QUERY_LIMIT = 25
+_MISSING = object()
 
 JsonObject: TypeAlias = Union[
     Dict[str, Any], List[Dict[str, Any]], str, int, float, bool, None
@@ -29,6 +39,8 @@ GlowMethod: TypeAlias = Literal[
     "DeleteFromVectorStore",
     "SearchVectorStore",
     "UpdateInVectorStore",
+    "ConfigureVectorIndex",
+    "Batch",
 ]
 
 
@@ -57,8 +69,187 @@ class SuccessResponse(TypedDict, total=False):
     id: Required[str]
 
 
+ROCKSDB_STATISTICS = os.environ.get("REALITYDB_ROCKSDB_STATISTICS", "1") == "1"
+
+_tables: Dict[str, Tuple[Rdict, Options]] = {}
+_tables_lock = threading.Lock()
+
+
+class Secondary:
+    """
+    Read-replica mode: tables are opened as RocksDB secondary instances that
+    follow the primary process's WAL.
+
+    A background thread catches every open table up each `catchup_interval`
+    seconds, and `get_db` catches a table up synchronously before handing it
+    out if it is older than `max_staleness`.
+    """
+
+    def __init__(
+        self, root: str, catchup_interval: float = 0.1, max_staleness: float = 1.0
+    ) -> None:
+        self.root = root
+        self.catchup_interval = catchup_interval
+        self.max_staleness = max_staleness
+        self.caught_up: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="realitydb-catchup", daemon=True
+        )
+        self._thread.start()
+
+    def open(self, path: str, options: Options) -> Rdict:
+        if not os.path.exists(os.path.join(path, "CURRENT")):
+            raise RPCError(code=404, message=f"Table '{path}' not found on primary")
+        secondary_path = os.path.join(self.root, path.lstrip("/"))
+        os.makedirs(secondary_path, exist_ok=True)
+        db = Rdict(path, options, access_type=AccessType.secondary(secondary_path))
+        self.caught_up[path] = time.monotonic()
+        return db
+
+    def is_fresh(self, path: str) -> bool:
+        return time.monotonic() - self.caught_up.get(path, 0.0) <= self.max_staleness
+
+    def catch_up(self, path: str, db: Rdict) -> None:
+        started = time.monotonic()
+        db.try_catch_up_with_primary()
+        self.caught_up[path] = started
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.catchup_interval):
+            for path, (db, _) in list(_tables.items()):
+                try:
+                    self.catch_up(path, db)
+                except Exception as e:
+                    if os.path.exists(os.path.join(path, "CURRENT")):
+                        logger.warning("Catch-up of %s failed: %s", path, e)
+                        continue
+                    # Dropped on the primary: forget the stale handle.
+                    with _tables_lock:
+                        _tables.pop(path, None)
+                    self.caught_up.pop(path, None)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+_secondary: Optional[Secondary] = None
+
+
+def open_as_secondary(
+    root: Optional[str] = None,
+    catchup_interval: float = 0.1,
+    max_staleness: float = 1.0,
+) -> Secondary:
+    """Switches this process to read-replica mode. Call before opening tables."""
+    global _secondary
+    if _tables:
+        raise RuntimeError("open_as_secondary must run before any table is opened")
+    _secondary = Secondary(
+        root or "/tmp/.secondary/%d" % os.getpid(), catchup_interval, max_staleness
+    )
+    return _secondary
+
+
+def table_path(prefix: str, table_name: str) -> str:
+    return "/tmp/" + prefix + "/" + table_name
+
+
+def table_exists(prefix: str, table_name: str) -> bool:
+    return os.path.exists(os.path.join(table_path(prefix, table_name), "CURRENT"))
+
+
 def get_db(prefix: str, table_name: str) -> Rdict:
-    return Rdict("/tmp/" + prefix + "/" + table_name)
+    """
+    Returns the open handle for a table, opening it on first use.
+
+    RocksDB allows a single handle per directory and process, so handles are
+    shared by every caller instead of being reopened per operation.
+    """
+    path = table_path(prefix, table_name)
+    table = _tables.get(path)
+    if table is None:
+        with tracer.span("get_db.open", table=path), _tables_lock:
+            table = _tables.get(path)
+            if table is None:
+                options = Options()
+                if ROCKSDB_STATISTICS:
+                    options.enable_statistics()
+                db = (
+                    _secondary.open(path, options)
+                    if _secondary is not None
+                    else Rdict(path, options)
+                )
+                table = _tables[path] = (db, options)
+    if _secondary is not None and not _secondary.is_fresh(path):
+        with tracer.span("get_db.catch_up", table=path):
+            _secondary.catch_up(path, table[0])
+    return table[0]
+
+
+def catch_up(prefix: str, table_name: str) -> None:
+    """Makes a read replica reflect every write acknowledged by the primary."""
+    if _secondary is not None:
+        _secondary.catch_up(table_path(prefix, table_name), get_db(prefix, table_name))
+
+
+def get_open_db(prefix: str, table_name: str) -> Optional[Rdict]:
+    """
+    Returns the table's handle if it is already open and, on a replica, fresh
+    enough to use without blocking.
+    """
+    path = table_path(prefix, table_name)
+    table = _tables.get(path)
+    if table is None or (_secondary is not None and not _secondary.is_fresh(path)):
+        return None
+    return table[0]
+
+
+def close_db(prefix: str, table_name: str) -> None:
+    with _tables_lock:
+        table = _tables.pop(table_path(prefix, table_name), None)
+    if table is not None:
+        table[0].close()
+
+
+def _parse_statistics(options: Options) -> Dict[str, int]:
+    stats: Dict[str, int] = {}
+    for line in (options.get_statistics() or "").splitlines():
+        name, _, rest = line.partition(" COUNT : ")
+        if rest:
+            stats[name] = int(rest.split(" ", 1)[0])
+    return stats
+
+
+def _collect_rocksdb_stats() -> Iterable[Tuple[Dict[str, str], float]]:
+    for path, (db, options) in list(_tables.items()):
+        table = path[len("/tmp/") :]
+        for stat in (
+            "compaction-pending",
+            "cur-size-all-mem-tables",
+            "estimate-num-keys",
+            "block-cache-usage",
+        ):
+            value = db.property_int_value("rocksdb." + stat)
+            if value is not None:
+                yield {"table": table, "stat": stat}, float(value)
+        tickers = _parse_statistics(options)
+        hits = tickers.get("rocksdb.block.cache.hit", 0)
+        misses = tickers.get("rocksdb.block.cache.miss", 0)
+        if hits + misses:
+            yield {"table": table, "stat": "block-cache-hit-rate"}, hits / (
+                hits + misses
+            )
+
+
+metrics.collector(
+    "realitydb_rocksdb", "RocksDB statistics per open table.", _collect_rocksdb_stats
+)
+metrics.collector(
+    "realitydb_rocksdb_open_tables",
+    "RocksDB tables currently open.",
+    lambda: [({}, float(len(_tables)))],
+)
 
 
 class DocumentObject(BaseModel):
@@ -86,8 +277,8 @@ class DocumentObject(BaseModel):
     @asyncify
     def delete_table(cls, *, prefix: str, table_name: str) -> SuccessResponse:
         try:
-            db = get_db(prefix, table_name)
-            db.destroy(prefix + table_name)
+            close_db(prefix, table_name)
+            Rdict.destroy(table_path(prefix, table_name))
             return {
                 "message": f"Table '{table_name}' deleted successfully",
                 "id": table_name,
@@ -111,7 +302,8 @@ class DocumentObject(BaseModel):
         return self
 
     @classmethod
-    async def scan(cls, *, prefix: str, table_name: str) -> List[Self]:
+    @asyncify
+    def scan(cls, *, prefix: str, table_name: str) -> List[Self]:
         db = get_db(prefix, table_name)
         items: List[Self] = []
         iterable = db.iter()
@@ -130,9 +322,13 @@ class DocumentObject(BaseModel):
         prefix: str,
         table_name: str,
         filters: Optional[Dict[str, Any]] = None,
-        limit: int = 25,
+        limit: int = QUERY_LIMIT,
         offset: int = 0,
     ) -> List[Self]:
+        """
+        Up to `limit` documents after the first `offset`, keeping those whose
+        fields equal every value in `filters`; a missing field never matches.
+        """
         db = get_db(prefix, table_name)
         items: List[Self] = []
         count = 0
@@ -145,7 +341,7 @@ class DocumentObject(BaseModel):
                 continue
             item = cls.model_validate_json(iterable.value().decode("utf-8"))
             if filters:
-                if all(getattr(item, k) == v for k, v in filters.items()):
+                if all(getattr(item, k, _MISSING) == v for k, v in filters.items()):
                     items.append(item)
             else:
                 items.append(item)
@@ -154,24 +350,87 @@ class DocumentObject(BaseModel):
             iterable.next()  # Advance the iterator
         return items
 
+    @classmethod
+    @asyncify
+    def multi_get(
+        cls, *, prefix: str, table_name: str, ids: List[str]
+    ) -> List[Optional[Self]]:
+        """Fetches `ids` with a single RocksDB multi-get; missing ids map to None."""
+        db = get_db(prefix, table_name)
+        return [
+            None if value is None else cls.model_validate_json(value.decode("utf-8"))
+            for value in db.get(ids)
+        ]
+
     @classmethod
     async def batch_get_item(
         cls, *, prefix: str, table_name: str, ids: List[str]
     ) -> List[Self]:
-        return await asyncio.gather(
-            *[
-                cls.get_item(prefix=prefix, table_name=table_name, item_id=id)
-                for id in ids
-            ]
-        )
+        items = await cls.multi_get(prefix=prefix, table_name=table_name, ids=ids)
+        for item_id, item in zip(ids, items):
+            if item is None:
+                raise RPCError(
+                    code=404, message="Item with id '%s' not found" % item_id
+                )
+        return cast("List[Self]", items)
+
+    @classmethod
+    @asyncify
+    def write_batch(
+        cls,
+        *,
+        prefix: str,
+        table_name: str,
+        operations: List[Tuple[str, Union[Self, str]]],
+    ) -> List[Union[Self, SuccessResponse, RPCError]]:
+        """
+        Applies ("put", item) and ("delete", item_id) operations atomically in
+        a single WriteBatch, in order.
+
+        Deletes of ids that neither exist nor are put earlier in the batch
+        yield a 404 `RPCError` in their slot and are left out of the batch.
+        """
+        db = get_db(prefix, table_name)
+        deleted = [op[1] for op in operations if op[0] == "delete"]
+        existing = {
+            item_id
+            for item_id, value in zip(deleted, db.get(deleted) if deleted else [])
+            if value is not None
+        }
+        batch = WriteBatch()
+        results: List[Union[Self, SuccessResponse, RPCError]] = []
+        for action, target in operations:
+            if action == "put":
+                item = cast("Self", target)
+                batch.put(item.id, item.model_dump_json().encode("utf-8"))
+                existing.add(item.id)
+                results.append(item)
+                continue
+            item_id = cast(str, target)
+            if item_id not in existing:
+                results.append(
+                    RPCError(code=404, message=f"Item with id '{item_id}' not found")
+                )
+                continue
+            batch.delete(item_id)
+            existing.discard(item_id)
+            results.append(
+                {"message": f"Item '{item_id}' deleted successfully", "id": item_id}
+            )
+        if not batch.is_empty():
+            db.write(batch)
+        return results
 
     @classmethod
     async def batch_write_item(
         cls, *, prefix: str, table_name: str, items: List[Self]
     ) -> List[Self]:
-        return await asyncio.gather(
-            *[item.put_item(prefix=prefix, table_name=table_name) for item in items]
+        results = await cls.write_batch(
+            prefix=prefix,
+            table_name=table_name,
+            operations=[("put", item) for item in items],
         )
+        return cast("List[Self]", results)
 
     @classmethod
     @asyncify
@@ -184,7 +443,7 @@ class DocumentObject(BaseModel):
         updates: List[Dict[str, Any]],
     ) -> Self | SuccessResponse:
         db = get_db(prefix, table_name)
-        key = item_id.encode("utf-8")
+        key = item_id
         item_data = db.get(key)
         if item_data is None:
             raise RPCError(message="Item with id '%s' not found" % item_id)
@@ -210,7 +469,7 @@ class DocumentObject(BaseModel):
         cls, *, prefix: str, table_name: str, item_id: str
     ) -> SuccessResponse:
         db = get_db(prefix, table_name)
-        key = item_id.encode("utf-8")
+        key = item_id
         if key not in db:
             raise RPCError(code=404, message=f"Item with id '{item_id}' not found")
         del db[key]
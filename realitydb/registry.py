@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Type
+
+from pydantic import TypeAdapter, ValidationError
+
+from .tracing import tracer
+from .utils import INVALID_PARAMS, METHOD_NOT_FOUND, RPCError
+
+Handler = Callable[[Any, str], Awaitable[Any]]
+
+
+@dataclass(frozen=True)
+class MethodSpec:
+    """A registered RPC method: its handler and the precompiled validator
+    for its `properties`."""
+
+    name: str
+    handler: Handler
+    adapter: TypeAdapter[Any]
+
+    def validate(self, properties: Any) -> Any:
+        try:
+            with tracer.span("validate", method=self.name):
+                return self.adapter.validate_python(properties)
+        except ValidationError as e:
+            raise RPCError(
+                code=INVALID_PARAMS,
+                message=f"Invalid properties for method '{self.name}'",
+                data=e.errors(
+                    include_url=False, include_context=False, include_input=False
+                ),
+            ) from e
+
+    async def __call__(self, properties: Any, prefix: str) -> Any:
+        return await self.handler(self.validate(properties), prefix)
+
+
+class MethodRegistry:
+    """
+    Maps method names to their handlers.
+
+    Handlers are coroutines taking the validated properties and the tenant
+    prefix. Plugins add methods with `register`, either directly or as a
+    decorator:
+
+        @app.registry.register("Echo", EchoProperties)
+        async def echo(properties: EchoProperties, prefix: str):
+            return properties
+    """
+
+    def __init__(self, methods: Optional[Dict[str, MethodSpec]] = None) -> None:
+        self._methods: Dict[str, MethodSpec] = dict(methods or {})
+
+    def register(
+        self, name: str, schema: Type[Any], handler: Optional[Handler] = None
+    ) -> Any:
+        """
+        Registers `handler` under `name`, validating properties against `schema`.
+
+        :param name: Method name as sent by clients.
+        :param schema: TypedDict or pydantic model describing the properties.
+        :param handler: Coroutine function; when omitted a decorator is returned.
+        """
+
+        def decorator(func: Handler) -> Handler:
+            self._methods[name] = MethodSpec(
+                name=name, handler=func, adapter=TypeAdapter(schema)
+            )
+            return func
+
+        if handler is not None:
+            return decorator(handler)
+        return decorator
+
+    def unregister(self, name: str) -> None:
+        self._methods.pop(name, None)
+
+    def get(self, name: str) -> MethodSpec:
+        spec = self._methods.get(name)
+        if spec is None:
+            raise RPCError(code=METHOD_NOT_FOUND, message=f"Method not found: {name}")
+        return spec
+
+    def copy(self) -> MethodRegistry:
+        return MethodRegistry(self._methods)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._methods
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._methods)
+
+    def __len__(self) -> int:
+        return len(self._methods)
+
+
+methods = MethodRegistry()
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import os
+import signal
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+import click
+
+from .client import RPCClient
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+# Methods a read replica serves from its secondary instances; everything
+# else, including plugin methods, is forwarded to the primary.
+LOCAL_METHODS = frozenset({"GetItem", "BatchGetItem", "Query", "Scan"})
+
+
+def served_locally(method: str, properties: Any) -> bool:
+    if method in LOCAL_METHODS:
+        return True
+    if method == "Batch" and isinstance(properties, dict):
+        requests = properties.get("requests")
+        return isinstance(requests, list) and all(
+            isinstance(request, dict) and request.get("method") in LOCAL_METHODS
+            for request in requests
+        )
+    return False
+
+
+def tables_of(method: str, properties: Any) -> List[str]:
+    """Tables a (possibly batched) request touches."""
+    if not isinstance(properties, dict):
+        return []
+    if method == "Batch":
+        return sorted(
+            {
+                request["properties"]["table_name"]
+                for request in properties.get("requests") or ()
+                if isinstance(request, dict)
+                and isinstance(request.get("properties"), dict)
+                and isinstance(request["properties"].get("table_name"), str)
+            }
+        )
+    table_name = properties.get("table_name")
+    return [table_name] if isinstance(table_name, str) else []
+
+
+class PrimaryClient:
+    """Forwards requests from a read replica to the primary process."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url.rstrip("/")
+        self._clients: Dict[str, RPCClient] = {}
+
+    async def call(self, method: str, properties: Any, prefix: str) -> Any:
+        client = self._clients.get(prefix)
+        if client is None:
+            # Coalescing already happened on the replica's own connection.
+            client = self._clients[prefix] = RPCClient(
+                f"{self.url}/{prefix}", pool_size=1, batch_window=None
+            )
+        return await client.call(method, properties)
+
+    async def close(self) -> None:
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
+
+
+@click.command()
+@click.option("--app", default="main:app", show_default=True)
+@click.option("--host", default="0.0.0.0", show_default=True)
+@click.option("--port", default=8000, show_default=True)
+@click.option("--readers", default=os.cpu_count() or 1, show_default=True)
+@click.option("--primary-port", default=8001, show_default=True)
+@click.option("--max-staleness", default=1.0, show_default=True)
+def serve(
+    app: str,
+    host: str,
+    port: int,
+    readers: int,
+    primary_port: int,
+    max_staleness: float,
+) -> None:
+    """
+    Runs one primary writer on 127.0.0.1:PRIMARY_PORT and READERS replica
+    workers on HOST:PORT. Replicas open tables as RocksDB secondaries, serve
+    reads locally and forward writes to the primary.
+    """
+    uvicorn = [sys.executable, "-m", "uvicorn", app]
+    primary = subprocess.Popen(
+        uvicorn + ["--host", "127.0.0.1", "--port", str(primary_port)],
+        env=dict(os.environ, REALITYDB_ROLE="primary"),
+    )
+    replicas = subprocess.Popen(
+        uvicorn + ["--host", host, "--port", str(port), "--workers", str(readers)],
+        env=dict(
+            os.environ,
+            REALITYDB_ROLE="replica",
+            REALITYDB_PRIMARY_URL=f"ws://127.0.0.1:{primary_port}",
+            REALITYDB_MAX_STALENESS=str(max_staleness),
+        ),
+    )
+    processes = [primary, replicas]
+
+    def stop(*_: Any) -> None:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        while all(process.poll() is None for process in processes):
+            try:
+                primary.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                continue
+    finally:
+        stop()
+        for process in processes:
+            process.wait()
+
+
+def replica_settings() -> Optional[Dict[str, Any]]:
+    """Replica configuration from the environment set by `serve`."""
+    if os.environ.get("REALITYDB_ROLE") != "replica":
+        return None
+    return {
+        "primary_url": os.environ["REALITYDB_PRIMARY_URL"],
+        "max_staleness": float(os.environ.get("REALITYDB_MAX_STALENESS", 1.0)),
+    }
+
+
+if __name__ == "__main__":
+    serve()
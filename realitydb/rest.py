@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import sys
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import orjson
+from fastapi import APIRouter, Query, Request, Response
+from fastapi.responses import JSONResponse
+from rocksdict import Rdict  # pylint: disable=E0611
+
+from .models import QUERY_LIMIT, catch_up, get_db, get_open_db, table_exists
+from .streaming import Cursor
+from .utils import INVALID_PARAMS, RPCError, asyncify
+
+CACHE_CONTROL = "no-cache"
+CACHE_MAX_BYTES = 64 << 20
+# Prefixes and table names become directory names; anything else is refused
+# rather than letting an unauthenticated GET reach outside the data root.
+NAME = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_-]*")
+
+
+class CachedResponse:
+    __slots__ = ("sequence", "etag", "body")
+
+    def __init__(self, sequence: int, etag: str, body: bytes) -> None:
+        self.sequence = sequence
+        self.etag = etag
+        self.body = body
+
+
+class ResponseCache:
+    """
+    LRU of serialized REST responses, bounded by total body size.
+
+    Entries are tagged with the table's RocksDB sequence number when they
+    were read and are only served while it is unchanged, so any write to the
+    table, from this process or another, invalidates them.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[Tuple[Any, ...], CachedResponse] = OrderedDict()
+
+    def get(self, key: Tuple[Any, ...], sequence: int) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None or entry.sequence != sequence:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: Tuple[Any, ...], sequence: int, body: bytes) -> CachedResponse:
+        entry = CachedResponse(sequence, etag_of(body), body)
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous.body)
+        if len(body) <= self.max_bytes:
+            self._entries[key] = entry
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+        return entry
+
+
+def etag_of(body: bytes) -> str:
+    return '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Weak comparison as required for If-None-Match."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag for candidate in header.split(",")
+    )
+
+
+def _error(error: RPCError) -> JSONResponse:
+    status = error.code if 400 <= error.code < 600 else 400
+    return JSONResponse({"error": error.to_dict()}, status_code=status)
+
+
+def create_router(cache: Optional[ResponseCache] = None) -> APIRouter:
+    """
+    Read-only HTTP routes mirroring GetItem, BatchGetItem, Query and Scan.
+
+    Bodies are assembled from the stored JSON without decoding it, carry a
+    strong ETag over their bytes, and `If-None-Match` revalidation answers
+    304 from the cache without touching storage while the table is unchanged.
+    On a read replica, `?consistency=strong` catches the table up first.
+    """
+    cache = cache or ResponseCache()
+    router = APIRouter()
+
+    async def respond(
+        request: Request,
+        prefix: str,
+        table_name: str,
+        key: Tuple[Any, ...],
+        read: Callable[[Rdict], Optional[bytes]],
+    ) -> Response:
+        if not (NAME.fullmatch(prefix) and NAME.fullmatch(table_name)):
+            return _error(RPCError(code=400, message="Invalid prefix or table name"))
+        strong = request.query_params.get("consistency") == "strong"
+        try:
+            db = get_open_db(prefix, table_name)
+            if db is None or strong:
+                # get_db would create a table that does not exist.
+                if db is None and not await asyncify(table_exists)(prefix, table_name):
+                    return _error(
+                        RPCError(code=404, message=f"Table '{table_name}' not found")
+                    )
+                if strong:
+                    await asyncify(catch_up)(prefix, table_name)
+                db = await asyncify(get_db)(prefix, table_name)
+        except RPCError as e:
+            return _error(e)
+        # Read the sequence number first: a concurrent write then only makes
+        # the entry look older than it is.
+        sequence = db.latest_sequence_number()
+        cache_key = (prefix, table_name) + key
+        entry = cache.get(cache_key, sequence)
+        if entry is None:
+            try:
+                body = await asyncify(read)(db)
+            except RPCError as e:
+                return _error(e)
+            if body is None:
+                return _error(RPCError(code=404, message="Item not found"))
+            entry = cache.put(cache_key, sequence, body)
+        headers = {"ETag": entry.etag, "Cache-Control": CACHE_CONTROL}
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(entry.body, media_type="application/json", headers=headers)
+
+    @router.get("/{prefix}/{table_name}/items/{item_id}")
+    async def get_item(
+        request: Request, prefix: str, table_name: str, item_id: str
+    ) -> Response:
+        def read(db: Rdict) -> Optional[bytes]:
+            return db.get(item_id)
+
+        return await respond(request, prefix, table_name, ("item", item_id), read)
+
+    @router.get("/{prefix}/{table_name}/items")
+    async def batch_get_item(
+        request: Request,
+        prefix: str,
+        table_name: str,
+        ids: List[str] = Query(...),
+    ) -> Response:
+        def read(db: Rdict) -> Optional[bytes]:
+            values = db.get(ids)
+            for item_id, value in zip(ids, values):
+                if value is None:
+                    raise RPCError(
+                        code=404, message="Item with id '%s' not found" % item_id
+                    )
+            return b"[" + b",".join(values) + b"]"
+
+        return await respond(request, prefix, table_name, ("items", tuple(ids)), read)
+
+    def read_all(**kwargs: Any) -> Callable[[Rdict], bytes]:
+        def read(db: Rdict) -> bytes:
+            cursor = Cursor(
+                chunk_size=sys.maxsize, max_frame_bytes=sys.maxsize, **kwargs
+            )
+            chunk, _ = cursor.read_raw()
+            return b"[" + b",".join(chunk) + b"]"
+
+        return read
+
+    @router.get("/{prefix}/{table_name}/query")
+    async def query(
+        request: Request,
+        prefix: str,
+        table_name: str,
+        filters: Optional[str] = None,
+        limit: int = Query(QUERY_LIMIT, ge=0),
+        offset: int = Query(0, ge=0),
+    ) -> Response:
+        try:
+            parsed: Dict[str, Any] = orjson.loads(filters) if filters else {}
+        except orjson.JSONDecodeError as e:
+            return _error(RPCError(code=400, message=f"Invalid filters: {e}"))
+        if not isinstance(parsed, dict):
+            return _error(
+                RPCError(code=INVALID_PARAMS, message="filters must be an object")
+            )
+        read = read_all(
+            prefix=prefix,
+            table_name=table_name,
+            filters=parsed,
+            offset=offset,
+            limit=limit,
+        )
+        key = (
+            "query",
+            orjson.dumps(parsed, option=orjson.OPT_SORT_KEYS),
+            limit,
+            offset,
+        )
+        return await respond(request, prefix, table_name, key, read)
+
+    @router.get("/{prefix}/{table_name}/scan")
+    async def scan(request: Request, prefix: str, table_name: str) -> Response:
+        read = read_all(prefix=prefix, table_name=table_name)
+        return await respond(request, prefix, table_name, ("scan",), read)
+
+    return router
@@ -1,44 +1,65 @@
-from typing import Any, Dict, List, TypeVar
-from uuid import UUID, uuid4
+from typing import Any, Dict, Optional, TypeVar
+from uuid import uuid4
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File
-from typing_extensions import Required, TypedDict
-from fastapi.responses import StreamingResponse
-import tempfile
-import base64c
-from realitydb.models import DocumentObject, GlowMethod, JsonObject
-from realitydb.utils import RPCError, get_logger
-from realitydb.documents import DocxFile, PDFFile, PPTXFile, ExcelFile
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, UploadFile, File
+from fastapi.responses import PlainTextResponse
+import orjson
+import time
+from realitydb.models import (
+    DocumentObject,
+    catch_up,
+    close_db,
+    open_as_secondary,
+)
+from realitydb.utils import (
+    INTERNAL_ERROR,
+    INVALID_REQUEST,
+    PARSE_ERROR,
+    RPCError,
+    asyncify,
+    get_logger,
+)
 
-from .vectorstore import VectorStore
+from . import methods as _builtin_methods  # noqa: F401  (registers built-ins)
+from .batch import BatchProperties, execute_batch
+from .extraction import extractor, kind_of
+from .compression import Codec, CompressionConfig, Message
+from .connection import Connection
+from .limits import Limiter, LimitsConfig, tenant_of
+from .logs import LogConfig, RequestLog
+from .metrics import (
+    CONNECTIONS,
+    ERRORS,
+    IN_FLIGHT,
+    LATENCY,
+    REQUEST_SIZE,
+    REQUESTS,
+    RESPONSE_SIZE,
+    metrics,
+)
+from .registry import MethodRegistry, methods
+from .replication import PrimaryClient, replica_settings, served_locally, tables_of
+from .rest import _error, create_router
+from .streaming import CONTROL, STREAMABLE, control, stream_results
+from .tracing import tracer
+from .uploads import UploadResponse, Uploads
 
 logger = get_logger(__name__)
 
 T = TypeVar("T", bound=DocumentObject)
 
 
-class Property(TypedDict, total=False):
-    id: str
-    item: JsonObject
-    items: List[JsonObject]
-    filters: Dict[str, Any]
-    limit: int
-    offset: int
-    updates: List[Dict[str, Any]]
-
-
-class RPCRequest(TypedDict, total=False):
-    method: Required[GlowMethod]
-    properties: Required[Property]
-    id: Required[UUID]
-
-
 class RPCServer(FastAPI):
     def __init__(
         self,
         title: str = "RealityDB",
         description: str = "RealityDB",
         version: str = "0.1.0",
+        registry: Optional[MethodRegistry] = None,
+        limits: Optional[LimitsConfig] = None,
+        primary_url: Optional[str] = None,
+        max_staleness: float = 1.0,
+        logging: Optional[LogConfig] = None,
     ):
         super().__init__(
             title=title,
@@ -46,214 +67,380 @@ class RPCServer(FastAPI):
             version=version,
             debug=True,
         )
+        self.registry = (registry or methods).copy()
+        self.registry.register("Batch", BatchProperties, self.batch)
+        self.limiter = Limiter(limits)
+        self.request_log = RequestLog(logging)
+        settings = replica_settings()
+        if primary_url is None and settings is not None:
+            primary_url = settings["primary_url"]
+            max_staleness = settings["max_staleness"]
+        # On a read replica, reads are served from RocksDB secondary
+        # instances and everything else is forwarded to the primary.
+        self.primary: Optional[PrimaryClient] = None
+        if primary_url is not None:
+            open_as_secondary(max_staleness=max_staleness)
+            self.primary = PrimaryClient(primary_url)
 
         @self.websocket("/{path:path}")
         async def _(ws: WebSocket, path: str):
             await self.handler(ws, path)
 
+        self.include_router(create_router())
+
+        self.uploads = Uploads()
+        self.extractor = extractor
+
         @self.post("/upload")
-        async def _(file: UploadFile = File(...)):
-            return await self.upload_file(file)
+        async def _(request: Request, file: UploadFile = File(...)):
+            return await self.upload_file(request, file)
 
         @self.get("/health")
         async def _():
             return {"status": "ok"}
 
+        @self.get("/metrics")
+        async def _():
+            return PlainTextResponse(
+                metrics.render(), media_type="text/plain; version=0.0.4"
+            )
+
+        @self.get("/limits")
+        async def _() -> LimitsConfig:
+            return self.limiter.config
+
+        @self.put("/limits")
+        async def _(config: LimitsConfig) -> LimitsConfig:
+            self.limiter.configure(config)
+            return self.limiter.config
+
+        @self.get("/logging")
+        async def _() -> LogConfig:
+            return self.request_log.config
+
+        @self.put("/logging")
+        async def _(config: LogConfig) -> LogConfig:
+            self.request_log.configure(config)
+            return self.request_log.config
+
     async def handler(self, ws: WebSocket, path: str):
         await ws.accept()
-        logger.info(f"New WebSocket connection: {path}")
+        logger.info("New WebSocket connection: %s", path)
+        try:
+            codec = Codec(CompressionConfig.from_query(ws.query_params))
+        except RPCError as e:
+            await self.send(ws, orjson.dumps(self.error_frame(None, e)).decode())
+            await ws.close(code=1008)
+            return
+        CONNECTIONS.inc()
+        connection = Connection(lambda message: self.send(ws, message), codec.encode)
 
         try:
             while True:
-                data_dict: RPCRequest = await ws.receive_json()
-                logger.info(f"Received: {data_dict}")
-
-                method = data_dict.get("method", "PutItem")
-                properties = data_dict.get("properties", {})
-                request_id = data_dict.get("id", uuid4())
-
+                received = await ws.receive()
+                if received["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(received.get("code", 1000))
+                received_ns = time.time_ns()
+                message: Message = received.get("text")
+                if message is None:
+                    message = received.get("bytes") or b""
+                REQUEST_SIZE.observe(len(message))
                 try:
-                    response = await self.dispatch(method, properties, path)
-                    await ws.send_json(
-                        {
-                            "id": str(request_id),
-                            "result": response,
-                            "status": "success",
-                        }
+                    data_dict: Dict[str, Any] = await codec.decode(message)
+                    decoded_ns = time.time_ns()
+                except orjson.JSONDecodeError as e:
+                    await connection.send(
+                        self.error_frame(
+                            None,
+                            RPCError(code=PARSE_ERROR, message=f"Parse error: {e}"),
+                        )
                     )
+                    continue
                 except RPCError as e:
-                    await ws.send_json(
-                        {
-                            "id": str(request_id),
-                            "error": {"code": e.code, "message": e.message},
-                            "status": "error",
-                        }
+                    await connection.send(self.error_frame(None, e))
+                    continue
+                if not isinstance(data_dict, dict):
+                    await connection.send(
+                        self.error_frame(
+                            None,
+                            RPCError(
+                                code=INVALID_REQUEST,
+                                message="Request must be a JSON object",
+                            ),
+                        )
                     )
+                    continue
+
+                method = data_dict.get("method", "PutItem")
+                if method in CONTROL:
+                    control(connection, method, data_dict)  # type: ignore
+                    continue
+                properties = data_dict.get("properties", {})
+                request_id = data_dict.get("id", uuid4())
+                await connection.spawn(
+                    self.serve(
+                        connection,
+                        method,
+                        properties,
+                        path,
+                        request_id,
+                        request_bytes=len(message),
+                        received_ns=received_ns,
+                        decoded_ns=decoded_ns,
+                        profile=data_dict.get("profile") is True,
+                    ),
+                    concurrent=data_dict.get("concurrent") is True,
+                )
 
         except WebSocketDisconnect:
-            logger.info(f"WebSocket disconnected: {path}")
+            logger.info("WebSocket disconnected: %s", path)
         except Exception as e:
-            logger.error(f"Error in WebSocket handler: {e}")
+            logger.error("Error in WebSocket handler: %s", e)
             await ws.close()
+        finally:
+            await connection.close()
+            CONNECTIONS.dec()
 
-    async def add_to_vector_store(
-        self, method: GlowMethod, properties: Property, prefix: str
-    ):
-        table_name: str = properties.get("table_name", str(uuid4()))
-        documents = properties.get("documents", [])
-        result = await VectorStore.add_documents(documents, prefix, table_name)
-        return result
+    async def serve(
+        self,
+        connection: Connection,
+        method: str,
+        properties: Dict[str, Any],
+        prefix: str,
+        request_id: Any,
+        request_bytes: int = 0,
+        received_ns: Optional[int] = None,
+        decoded_ns: Optional[int] = None,
+        profile: bool = False,
+    ) -> None:
+        """
+        Serves one request on `connection`, applying rate limits and admission
+        control first. Scan and Query with `stream: true` are streamed.
 
-    async def search_vector_store(
-        self, properties: Property, prefix: str
-    ):
-        table_name: str = properties.get("table_name", str(uuid4()))
-        query = properties.get("query", "")
-        k = properties.get("k", 5)
-        results = await VectorStore.search(
-            query=query,
-            k=k,
+        With `profile`, the response carries the request's timing breakdown.
+        """
+        started_ns = time.time_ns()
+        received_ns = received_ns or started_ns
+        decoded_ns = decoded_ns or received_ns
+        label = method if method in self.registry else "unknown"
+        cost = 1
+        if method == "Batch" and isinstance(properties, dict):
+            cost = max(len(properties.get("requests") or ()), 1)
+        code: Optional[int] = None
+        response_bytes: Optional[int] = None
+        handled_ns = started_ns
+        with tracer.trace(
+            f"rpc {label}",
+            force=profile,
+            start=received_ns,
+            method=label,
             prefix=prefix,
-            table_name=table_name,
-        )
-        return results
-
-    async def delete_from_vector_store(
-        self, properties: Property, prefix: str
-    ):
-        table_name: str = properties.get("table_name", str(uuid4()))
-        doc_id = properties.get("id")
-        if not doc_id:
-            raise RPCError(code=400, message="Document ID is required")
-        result = await VectorStore.delete_document(
-            doc_id=doc_id,
+            request_id=str(request_id),
+        ) as trace:
+            tracer.record("codec.decode", received_ns, decoded_ns, bytes=request_bytes)
+            tracer.record("connection.wait", decoded_ns, started_ns)
+            try:
+                release = self.limiter.acquire(tenant_of(prefix), label, cost)
+            except RPCError as e:
+                ERRORS.labels(label, str(e.code)).inc()
+                code = e.code
+                response_bytes = await connection.send(self.error_frame(request_id, e))
+            else:
+                try:
+                    if (
+                        method in STREAMABLE
+                        and isinstance(properties, dict)
+                        and properties.get("stream")
+                    ):
+                        await self.stream(
+                            connection, method, properties, prefix, request_id
+                        )
+                        handled_ns = time.time_ns()
+                    else:
+                        frame = await self.process(
+                            method, properties, prefix, request_id
+                        )
+                        handled_ns = time.time_ns()
+                        if frame["status"] == "error":
+                            code = frame["error"]["code"]
+                        if profile and trace is not None:
+                            frame["profile"] = trace.profile()
+                        response_bytes = await connection.send(frame)
+                finally:
+                    release()
+            if trace is not None and code is not None:
+                trace.root.set(code=code)  # type: ignore[union-attr]
+        self.request_log.record(
+            method=label,
+            properties=properties,
             prefix=prefix,
-            table_name=table_name,
+            request_id=request_id,
+            code=code,
+            request_bytes=request_bytes,
+            response_bytes=response_bytes,
+            queued=(started_ns - received_ns) / 1e9,
+            handled=(handled_ns - started_ns) / 1e9,
+            sent=(time.time_ns() - handled_ns) / 1e9,
         )
+
+    async def stream(
+        self,
+        connection: Connection,
+        method: str,
+        properties: Dict[str, Any],
+        prefix: str,
+        request_id: Any,
+    ) -> None:
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            validated = self.registry.get(method).validate(properties)
+            await self.synchronize(method, properties, prefix)
+            await stream_results(connection, method, validated, prefix, request_id)
+        except RPCError as e:
+            ERRORS.labels(method, str(e.code)).inc()
+            await connection.send(self.error_frame(request_id, e))
+        except Exception as e:
+            logger.error("%s stream failed: %s: %s", method, e.__class__.__name__, e)
+            ERRORS.labels(method, str(INTERNAL_ERROR)).inc()
+            await connection.send(
+                self.error_frame(
+                    request_id,
+                    RPCError(
+                        code=INTERNAL_ERROR,
+                        message=f"Internal error: {e.__class__.__name__}: {e}",
+                    ),
+                )
+            )
+        finally:
+            IN_FLIGHT.dec()
+            REQUESTS.labels(method).inc()
+            LATENCY.labels(method).observe(time.perf_counter() - start)
+
+    async def process(
+        self, method: str, properties: Dict[str, Any], prefix: str, request_id: Any
+    ) -> Dict[str, Any]:
+        """Dispatches one request and builds its response frame, recording metrics."""
+        label = method if method in self.registry else "unknown"
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            response = await self.dispatch(method, properties, prefix)
+            return self.success_frame(request_id, response)
+        except RPCError as e:
+            ERRORS.labels(label, str(e.code)).inc()
+            return self.error_frame(request_id, e)
+        finally:
+            IN_FLIGHT.dec()
+            REQUESTS.labels(label).inc()
+            LATENCY.labels(label).observe(time.perf_counter() - start)
+
+    async def send(self, ws: WebSocket, message: Message) -> None:
+        RESPONSE_SIZE.observe(len(message))
+        with tracer.span("ws.send", bytes=len(message)):
+            if isinstance(message, bytes):
+                await ws.send_bytes(message)
+            else:
+                await ws.send_text(message)
+
+    async def dispatch(self, method: str, properties: Dict[str, Any], prefix: str):
+        spec = self.registry.get(method)
+        try:
+            with tracer.span("dispatch", method=method):
+                if self.primary is not None and not served_locally(method, properties):
+                    return await self.forward(method, properties, prefix)
+                await self.synchronize(method, properties, prefix)
+                result = await spec(properties, prefix)
+        except RPCError:
+            raise
+        except Exception as e:
+            logger.error("%s failed: %s: %s", method, e.__class__.__name__, e)
+            raise RPCError(
+                code=INTERNAL_ERROR,
+                message=f"Internal error: {e.__class__.__name__}: {e}",
+            ) from e
+        with tracer.span("serialize"):
+            return self.serialize(result)
+
+    async def synchronize(self, method: str, properties: Any, prefix: str) -> None:
+        """Catches a replica up with the primary for `consistency: "strong"`."""
+        if self.primary is None or not isinstance(properties, dict):
+            return
+        if properties.get("consistency") == "strong":
+            for table_name in tables_of(method, properties):
+                await asyncify(catch_up)(prefix, table_name)
+
+    async def forward(self, method: str, properties: Any, prefix: str) -> Any:
+        """
+        Runs a write on the primary, then catches the touched tables up so
+        this connection reads its own writes.
+        """
+        assert self.primary is not None
+        result = await self.primary.call(method, properties, prefix)
+        for table_name in tables_of(method, properties):
+            try:
+                if method == "DeleteTable":
+                    await asyncify(close_db)(prefix, table_name)
+                else:
+                    await asyncify(catch_up)(prefix, table_name)
+            except Exception as e:
+                logger.warning("Catch-up of %s/%s failed: %s", prefix, table_name, e)
         return result
 
-    async def update_in_vector_store(
-        self, properties: Property, prefix: str
-    ):
-        table_name: str = properties.get("table_name", str(uuid4()))
-        doc_id = properties.get("id")
-        new_content = properties.get("content")
-        new_metadata = properties.get("metadata")
-        if not doc_id or not new_content:
-            raise RPCError(code=400, message="Document ID and new content are required")
-        result = await VectorStore.update_document(
-            doc_id=doc_id,
-            new_content=new_content,
-            new_metadata=new_metadata,
-            prefix=prefix,
-            table_name=table_name,
+    async def batch(self, properties: BatchProperties, prefix: str):
+        return await execute_batch(
+            self, properties["requests"], properties.get("ordered", True), prefix
         )
-        return result
 
-    async def dispatch(self, method: GlowMethod, properties: Property, prefix: str):
-        result = None
-        table_name: str = properties.get("table_name", str(uuid4()))
-
-        if method == "AddToVectorStore":
-            result = await self.add_to_vector_store(method, properties, prefix)
-        elif method == "SearchVectorStore":
-            result = await self.search_vector_store(properties=properties, prefix=prefix)
-        elif method == "DeleteFromVectorStore":
-            result = await self.delete_from_vector_store(properties=properties, prefix=prefix)
-        elif method == "UpdateInVectorStore":
-            result = await self.update_in_vector_store(properties=properties, prefix=prefix)
-        elif method == "CreateTable":
-            result = await DocumentObject.create_table(
-                prefix=prefix, table_name=table_name
-            )
-        elif method == "DeleteTable":
-            result = await DocumentObject.delete_table(
-                prefix=prefix, table_name=table_name
-            )
-        elif method == "GetItem":
-            assert "id" in properties, "id is required"
-            item_id = properties["id"]
-            result = await DocumentObject.get_item(
-                prefix=prefix, table_name=table_name, item_id=item_id
-            )
-        elif method == "PutItem":
-            item = DocumentObject(**properties["item"])  # type: ignore
-            result = await item.put_item(prefix=prefix, table_name=table_name)
-        elif method == "DeleteItem":
-            assert "id" in properties, "id is required"
-            item_id = properties["id"]
-            return await DocumentObject.delete_item(
-                prefix=prefix, table_name=table_name, item_id=item_id
-            )
-        elif method == "Scan":
-            result = await DocumentObject.scan(prefix=prefix, table_name=table_name)
-        elif method == "Query":
-            filters = properties.get("filters", {})
-            limit = properties.get("limit", 25)
-            offset = properties.get("offset", 0)
-            result = await DocumentObject.query(
-                prefix=prefix,
-                table_name=table_name,
-                filters=filters,
-                limit=limit,
-                offset=offset,
-            )
-        elif method == "BatchGetItem":
-            ids = properties["ids"]  # type: ignore
-            result = await DocumentObject.batch_get_item(
-                prefix=prefix, table_name=table_name, ids=ids
-            )
-        elif method == "BatchWriteItem":
-            items = [DocumentObject(**item) for item in properties["items"]]  # type: ignore
-            result = await DocumentObject.batch_write_item(
-                prefix=prefix, table_name=table_name, items=items
-            )
-        elif method == "UpdateItem":
-            item_id = properties.get("id", str(uuid4()))
-            updates = properties.get("updates", [])
-            result = await DocumentObject.update_item(
-                prefix=prefix,
-                table_name=table_name,
-                item_id=item_id,
-                updates=updates,
-            )
+    @staticmethod
+    def success_frame(request_id: Any, result: Any) -> Dict[str, Any]:
+        return {"id": str(request_id), "result": result, "status": "success"}
+
+    @staticmethod
+    def error_frame(request_id: Any, error: RPCError) -> Dict[str, Any]:
+        return {
+            "id": None if request_id is None else str(request_id),
+            "error": error.to_dict(),
+            "status": "error",
+        }
+
+    @staticmethod
+    def serialize(result: Any) -> Any:
         if result is None:
             return {}
-        if isinstance(result, dict):
-            return result
+        if isinstance(result, DocumentObject):
+            return result.model_dump()
         if isinstance(result, list):
             if all(isinstance(item, DocumentObject) for item in result):
                 return [item.model_dump() for item in result]  # type: ignore
-            return result
-        if isinstance(result, DocumentObject):
-            return result.model_dump()
-        raise RPCError(code=400, message=f"Unsupported method: {method}")
-
-    async def upload_file(self, file: UploadFile = File(...)):
-        content_type = file.content_type
-        assert content_type is not None
-        assert file.filename is not None
-        print(content_type)
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            temp_file.write(await file.read())
-            temp_file_path = temp_file.name
-            if "office" in content_type:
-                if "word" in content_type:
-                    document = DocxFile(name=temp_file_path)
-                elif "excel" in content_type:
-                    document = ExcelFile(name=temp_file_path)
-                elif "powerpoint" in content_type:
-                    document = PPTXFile(name=temp_file_path)
-                else:
-                    raise RPCError(code=400, message=f"Unsupported office file type: {content_type}")
-            elif "pdf" in content_type:
-                document = PDFFile(name=temp_file_path)
-            else:
-                raise RPCError(code=400, message=f"Unsupported file type: {content_type}")
-            def generator():
-                for chunk in document.extract_text():
-                    yield f"<p>{chunk}</p>"
-                for image in document.extract_images():
-                    yield f"<img src='data:image/jpeg;base64,{base64c.b64encode(image).decode()}'/>"
-            return StreamingResponse(generator(), media_type="text/html")
+        return result
 
+    async def upload_file(self, request: Request, file: UploadFile = File(...)):
+        """
+        Extracts the text and images of an uploaded office document or PDF
+        and streams them back as HTML. The upload is spooled to disk in
+        chunks and removed once the response ends.
+        """
+        content_type = file.content_type or ""
+        kind = kind_of(content_type)
+        if kind is None:
+            return _error(
+                RPCError(code=400, message=f"Unsupported file type: {content_type}")
+            )
+        try:
+            self.uploads.check_length(request.headers.get("content-length"))
+            upload = await self.uploads.receive(file)
+        except RPCError as e:
+            return _error(e)
+        try:
+            pages = await self.extractor.pages(kind, upload.path)
+        except Exception as e:
+            upload.close()
+            return _error(
+                RPCError(code=400, message=f"Could not read {file.filename}: {e}")
+            )
+        return UploadResponse(
+            self.extractor.extract(kind, upload.path, pages),
+            upload,
+            media_type="text/html",
+        )
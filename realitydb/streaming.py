@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+
+from .connection import Connection
+from .models import QUERY_LIMIT, get_db
+from .utils import INVALID_REQUEST, RPCError, asyncify
+
+STREAMABLE = frozenset({"Scan", "Query"})
+CONTROL = frozenset({"StreamCredit", "StreamCancel"})
+
+DEFAULT_CHUNK_SIZE = 100
+DEFAULT_MAX_FRAME_BYTES = 1 << 20
+DEFAULT_CREDITS = 8
+IDLE_TIMEOUT = 60.0
+STREAM_TIMEOUT = 408
+
+_MISSING = object()
+
+
+class ResultStream:
+    """
+    Credit-based flow control for one streamed response.
+
+    Every frame sent consumes a credit; the client grants more with
+    `StreamCredit` and stops the stream with `StreamCancel`.
+    """
+
+    def __init__(self, credits: int = DEFAULT_CREDITS) -> None:
+        self.credits = credits
+        self.cancelled = False
+        self._changed = asyncio.Event()
+
+    def grant(self, credits: int) -> None:
+        self.credits += credits
+        self._changed.set()
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        self._changed.set()
+
+    async def acquire(self, timeout: float = IDLE_TIMEOUT) -> bool:
+        """Waits for a credit; returns False once the stream is cancelled."""
+        while self.credits <= 0 and not self.cancelled:
+            self._changed.clear()
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        if self.cancelled:
+            return False
+        self.credits -= 1
+        return True
+
+
+class Cursor:
+    """
+    Reads a table in bounded chunks of raw stored documents.
+
+    Values are forwarded as `orjson.Fragment`s, so streamed documents are
+    never decoded into models and re-encoded.
+    """
+
+    def __init__(
+        self,
+        *,
+        prefix: str,
+        table_name: str,
+        filters: Optional[Dict[str, Any]] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_frame_bytes: int = DEFAULT_MAX_FRAME_BYTES,
+    ) -> None:
+        self.filters = filters or {}
+        self.remaining = limit
+        self.chunk_size = chunk_size
+        self.max_frame_bytes = max_frame_bytes
+        self._it = get_db(prefix, table_name).iter()
+        self._it.seek_to_first()
+        for _ in range(offset):
+            if not self._it.valid():
+                break
+            self._it.next()
+
+    def _matches(self, value: bytes) -> bool:
+        if not self.filters:
+            return True
+        document = orjson.loads(value)
+        return all(document.get(k, _MISSING) == v for k, v in self.filters.items())
+
+    def read_raw(self) -> Tuple[List[bytes], bool]:
+        """
+        Returns the next chunk of stored values and whether the cursor is
+        exhausted.
+        """
+        chunk: List[bytes] = []
+        size = 0
+        it = self._it
+        while (
+            it.valid()
+            and len(chunk) < self.chunk_size
+            and size < self.max_frame_bytes
+            and self.remaining != 0
+        ):
+            value = it.value()
+            if self._matches(value):
+                chunk.append(value)
+                size += len(value)
+                if self.remaining is not None:
+                    self.remaining -= 1
+            it.next()
+        return chunk, not it.valid() or self.remaining == 0
+
+    def read(self) -> Tuple[List[orjson.Fragment], bool]:
+        chunk, done = self.read_raw()
+        return [orjson.Fragment(value) for value in chunk], done
+
+
+async def stream_results(
+    connection: Connection,
+    method: str,
+    properties: Dict[str, Any],
+    prefix: str,
+    request_id: Any,
+) -> None:
+    """
+    Sends the result of a Scan or Query as `partial` frames followed by a
+    `complete` frame, all carrying the request id and a `seq` number. A
+    Query returns the same documents as when it is not streamed.
+    """
+    key = str(request_id)
+    if key in connection.streams:
+        raise RPCError(code=INVALID_REQUEST, message=f"Stream '{key}' is already open")
+    stream = ResultStream(properties.get("credits", DEFAULT_CREDITS))
+    connection.streams[key] = stream
+    try:
+        cursor = await asyncify(Cursor)(
+            prefix=prefix,
+            table_name=properties["table_name"],
+            filters=properties.get("filters") if method == "Query" else None,
+            offset=properties.get("offset", 0) if method == "Query" else 0,
+            limit=properties.get("limit", QUERY_LIMIT) if method == "Query" else None,
+            chunk_size=properties.get("chunk_size", DEFAULT_CHUNK_SIZE),
+            max_frame_bytes=properties.get("max_frame_bytes", DEFAULT_MAX_FRAME_BYTES),
+        )
+        seq = 0
+        while True:
+            chunk, done = await asyncify(cursor.read)()
+            try:
+                granted = await stream.acquire()
+            except asyncio.TimeoutError:
+                raise RPCError(
+                    code=STREAM_TIMEOUT,
+                    message=f"Stream '{key}' timed out waiting for credits",
+                )
+            if not granted:
+                await connection.send({"id": key, "status": "cancelled", "seq": seq})
+                return
+            await connection.send(
+                {
+                    "id": key,
+                    "status": "complete" if done else "partial",
+                    "seq": seq,
+                    "result": chunk,
+                }
+            )
+            if done:
+                return
+            seq += 1
+    finally:
+        connection.streams.pop(key, None)
+
+
+def control(connection: Connection, method: str, request: Dict[str, Any]) -> None:
+    """Applies a `StreamCredit` or `StreamCancel` frame; unknown ids are ignored."""
+    stream = connection.streams.get(str(request.get("id")))
+    if stream is None:
+        return
+    if method == "StreamCancel":
+        stream.cancel()
+        return
+    properties = request.get("properties") or {}
+    credits = properties.get("credits", 1) if isinstance(properties, dict) else 1
+    if isinstance(credits, int) and credits > 0:
+        stream.grant(credits)
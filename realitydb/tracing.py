@@ -0,0 +1,292 @@
+"""
+Lightweight request tracing.
+
+A trace is started per request by `Tracer.trace`; nested `Tracer.span`
+blocks record child spans, following the request across `await`s and
+`asyncify` thread hops through a context variable. When no trace is active,
+`span` costs a context variable lookup.
+
+Finished traces are exported as OTLP/JSON (`ExportTraceServiceRequest`), so
+the file output can be replayed into any OpenTelemetry collector.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Protocol
+
+import orjson
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    __slots__ = (
+        "trace",
+        "name",
+        "span_id",
+        "parent_id",
+        "kind",
+        "start",
+        "end",
+        "attributes",
+        "error",
+    )
+
+    def __init__(
+        self,
+        trace: Trace,
+        name: str,
+        parent_id: Optional[str],
+        attributes: Dict[str, Any],
+        start: Optional[int] = None,
+        kind: int = SPAN_KIND_INTERNAL,
+    ) -> None:
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start = time.time_ns() if start is None else start
+        self.end = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds."""
+        return (self.end - self.start) / 1e9
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "root")
+
+    def __init__(self) -> None:
+        self.trace_id = secrets.token_hex(16)
+        self.spans: List[Span] = []
+        self.root: Optional[Span] = None
+
+    def profile(self) -> Dict[str, Any]:
+        """Timing breakdown of the spans finished so far, relative to the root."""
+        assert self.root is not None
+        origin = self.root.start
+        end = self.root.end or time.time_ns()
+        names = {span.span_id: span.name for span in self.spans}
+        names[self.root.span_id] = self.root.name
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": round((end - origin) / 1e6, 3),
+            "spans": [
+                {
+                    "name": span.name,
+                    "parent": names.get(span.parent_id or ""),
+                    "start_ms": round((span.start - origin) / 1e6, 3),
+                    "duration_ms": round(span.duration * 1000, 3),
+                    **({"attributes": span.attributes} if span.attributes else {}),
+                }
+                for span in sorted(self.spans, key=lambda span: span.start)
+                if span is not self.root
+            ],
+        }
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("realitydb_span", default=None)
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def to_otlp(traces: List[Trace], service_name: str = "realitydb") -> Dict[str, Any]:
+    spans = []
+    for trace in traces:
+        for span in trace.spans:
+            otlp: Dict[str, Any] = {
+                "traceId": trace.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": span.kind,
+                "startTimeUnixNano": str(span.start),
+                "endTimeUnixNano": str(span.end),
+                "attributes": [_attribute(k, v) for k, v in span.attributes.items()],
+                "status": (
+                    {"code": STATUS_ERROR, "message": span.error}
+                    if span.error is not None
+                    else {"code": STATUS_OK}
+                ),
+            }
+            if span.parent_id:
+                otlp["parentSpanId"] = span.parent_id
+            spans.append(otlp)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [_attribute("service.name", service_name)]},
+                "scopeSpans": [{"scope": {"name": "realitydb"}, "spans": spans}],
+            }
+        ]
+    }
+
+
+class Exporter(Protocol):
+    def export(self, trace: Trace) -> None: ...
+
+
+class InMemoryExporter:
+    """Keeps finished traces, e.g. for tests or an in-process collector."""
+
+    def __init__(self, max_traces: int = 10_000) -> None:
+        self.max_traces = max_traces
+        self.traces: List[Trace] = []
+
+    def export(self, trace: Trace) -> None:
+        self.traces.append(trace)
+        if len(self.traces) > self.max_traces:
+            del self.traces[: len(self.traces) - self.max_traces]
+
+    def clear(self) -> None:
+        self.traces.clear()
+
+    def to_otlp(self) -> Dict[str, Any]:
+        return to_otlp(self.traces)
+
+
+class FileExporter:
+    """
+    Appends one OTLP/JSON `ExportTraceServiceRequest` per trace and line, the
+    format of the collector's file exporter. Writes happen on a background
+    thread; traces are dropped if it falls behind.
+    """
+
+    def __init__(self, path: str, max_queue: int = 10_000) -> None:
+        self.path = path
+        self.dropped = 0
+        self._queue: queue.Queue[Optional[Trace]] = queue.Queue(max_queue)
+        self._thread = threading.Thread(
+            target=self._run, name="realitydb-trace-export", daemon=True
+        )
+        self._thread.start()
+
+    def export(self, trace: Trace) -> None:
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        with open(self.path, "ab") as f:
+            while True:
+                trace = self._queue.get()
+                if trace is None:
+                    return
+                f.write(orjson.dumps(to_otlp([trace])) + b"\n")
+                if self._queue.empty():
+                    f.flush()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+
+class Tracer:
+    def __init__(self) -> None:
+        self.exporters: List[Exporter] = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    def add_exporter(self, exporter: Exporter) -> None:
+        self.exporters.append(exporter)
+
+    def remove_exporter(self, exporter: Exporter) -> None:
+        self.exporters.remove(exporter)
+
+    @contextmanager
+    def trace(
+        self,
+        name: str,
+        force: bool = False,
+        start: Optional[int] = None,
+        **attributes: Any,
+    ) -> Iterator[Optional[Trace]]:
+        """
+        Starts a trace with a root span, if an exporter is configured or
+        `force` is set (per-request profiling); yields None otherwise.
+        """
+        if not (force or self.exporters):
+            yield None
+            return
+        trace = Trace()
+        root = trace.root = Span(
+            trace, name, None, attributes, start=start, kind=SPAN_KIND_SERVER
+        )
+        token = _current.set(root)
+        try:
+            yield trace
+        except BaseException as e:
+            root.error = "%s: %s" % (e.__class__.__name__, e)
+            raise
+        finally:
+            root.end = time.time_ns()
+            _current.reset(token)
+            trace.spans.append(root)
+            for exporter in self.exporters:
+                exporter.export(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Records a child of the current span; a no-op outside a trace."""
+        parent = _current.get()
+        if parent is None:
+            yield None
+            return
+        span = Span(parent.trace, name, parent.span_id, attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = "%s: %s" % (e.__class__.__name__, e)
+            raise
+        finally:
+            span.end = time.time_ns()
+            _current.reset(token)
+            parent.trace.spans.append(span)
+
+    def record(self, name: str, start: int, end: int, **attributes: Any) -> None:
+        """Records an already finished child span of the current span."""
+        parent = _current.get()
+        if parent is None:
+            return
+        span = Span(parent.trace, name, parent.span_id, attributes, start=start)
+        span.end = end
+        parent.trace.spans.append(span)
+
+
+tracer = Tracer()
+
+if os.environ.get("REALITYDB_TRACE_FILE"):
+    _file_exporter = FileExporter(os.environ["REALITYDB_TRACE_FILE"])
+    tracer.add_exporter(_file_exporter)
+    atexit.register(_file_exporter.close)
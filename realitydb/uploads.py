@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import Any, BinaryIO, Optional
+
+from starlette.datastructures import UploadFile
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from .metrics import metrics
+from .utils import RPCError, asyncify, get_logger
+
+logger = get_logger(__name__)
+
+UPLOAD_MAX_BYTES = int(os.environ.get("REALITYDB_UPLOAD_MAX_BYTES", 512 << 20))
+UPLOAD_CHUNK_BYTES = int(os.environ.get("REALITYDB_UPLOAD_CHUNK_BYTES", 1 << 20))
+UPLOAD_CONCURRENCY = int(os.environ.get("REALITYDB_UPLOAD_CONCURRENCY", 4))
+# Seconds an upload waits for a free slot before it is turned away.
+UPLOAD_QUEUE_TIMEOUT = float(os.environ.get("REALITYDB_UPLOAD_QUEUE_TIMEOUT", 30))
+UPLOAD_DIR = os.environ.get("REALITYDB_UPLOAD_DIR") or None
+
+UPLOADS = metrics.counter(
+    "realitydb_uploads_total",
+    "File uploads, by outcome (ok, too_large, busy or failed).",
+    ("outcome",),
+)
+UPLOAD_BYTES = metrics.counter(
+    "realitydb_upload_bytes_total", "Bytes of uploaded files written to disk."
+)
+ACTIVE_UPLOADS = metrics.gauge(
+    "realitydb_uploads_active", "Uploads holding a slot, until their response ends."
+)
+
+
+class Upload:
+    """
+    An uploaded file spooled to `path`, with its size and SHA-256. It holds
+    one of the `Uploads` slots until `close`, which also removes the file.
+    """
+
+    def __init__(self, path: str, slots: asyncio.Semaphore) -> None:
+        self.path = path
+        self.size = 0
+        self.sha256 = ""
+        self._slots: Optional[asyncio.Semaphore] = slots
+        ACTIVE_UPLOADS.inc()
+
+    def close(self) -> None:
+        """Removes the file and frees the slot; safe to call more than once."""
+        if self._slots is None:
+            return
+        slots, self._slots = self._slots, None
+        slots.release()
+        ACTIVE_UPLOADS.dec()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Could not remove upload %s: %s", self.path, e)
+
+
+class Uploads:
+    """
+    Spools uploads to disk in `chunk_bytes` reads, hashing them on the way,
+    and rejects those above `max_bytes`. At most `concurrency` uploads are
+    received or processed at a time; others wait up to `queue_timeout`.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = UPLOAD_MAX_BYTES,
+        chunk_bytes: int = UPLOAD_CHUNK_BYTES,
+        concurrency: int = UPLOAD_CONCURRENCY,
+        queue_timeout: float = UPLOAD_QUEUE_TIMEOUT,
+        directory: Optional[str] = UPLOAD_DIR,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.chunk_bytes = chunk_bytes
+        self.queue_timeout = queue_timeout
+        self.directory = directory
+        self.slots = asyncio.Semaphore(concurrency)
+
+    def check_length(self, content_length: Optional[str]) -> None:
+        """Turns away a request whose declared length is already too large."""
+        if content_length and content_length.isdigit():
+            if int(content_length) > self.max_bytes:
+                UPLOADS.labels("too_large").inc()
+                raise RPCError(
+                    code=413, message=f"Upload exceeds {self.max_bytes} bytes"
+                )
+
+    async def receive(self, file: UploadFile) -> Upload:
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            UPLOADS.labels("busy").inc()
+            raise RPCError(code=503, message="Too many concurrent uploads")
+        suffix = os.path.splitext(file.filename or "")[1]
+        fd, path = tempfile.mkstemp(
+            prefix="realitydb-upload-", suffix=suffix, dir=self.directory
+        )
+        upload = Upload(path, self.slots)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                await self._copy(file, out, upload)
+        except BaseException as e:
+            upload.close()
+            UPLOADS.labels("too_large" if _too_large(e) else "failed").inc()
+            raise
+        UPLOADS.labels("ok").inc()
+        return upload
+
+    async def _copy(self, file: UploadFile, out: BinaryIO, upload: Upload) -> None:
+        digest = hashlib.sha256()
+        while True:
+            chunk = await file.read(self.chunk_bytes)
+            if not chunk:
+                break
+            upload.size += len(chunk)
+            if upload.size > self.max_bytes:
+                raise RPCError(
+                    code=413, message=f"Upload exceeds {self.max_bytes} bytes"
+                )
+            digest.update(chunk)
+            await asyncify(out.write)(chunk)
+            UPLOAD_BYTES.inc(len(chunk))
+        upload.sha256 = digest.hexdigest()
+
+
+def _too_large(error: BaseException) -> bool:
+    return isinstance(error, RPCError) and error.code == 413
+
+
+class UploadResponse(StreamingResponse):
+    """
+    Streams the result of processing an `Upload` and closes the upload once
+    the response ends: completed, failed or cancelled by a disconnect.
+    """
+
+    def __init__(self, content: Any, upload: Upload, **kwargs: Any) -> None:
+        super().__init__(content, **kwargs)
+        self.upload = upload
+        self.headers["X-Content-SHA256"] = upload.sha256
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.upload.close()
@@ -1,29 +1,108 @@
 from __future__ import annotations
 
 import asyncio
-import json
+import atexit
+import contextvars
 import logging
 import os
+import queue
 import shutil
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from functools import partial, reduce, wraps
+from logging.handlers import QueueHandler, QueueListener
 from typing import Any, Awaitable, Callable, Coroutine, Type, TypeVar, Union, cast
 from uuid import uuid4
 
 import base64c as base64  # type: ignore
+import orjson
 from cachetools import TTLCache, cached  # type: ignore
 from requests import get
 from typing_extensions import ParamSpec
 
+from .tracing import tracer
+
 T = TypeVar("T")
 P = ParamSpec("P")
 
+executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("REALITYDB_WORKERS", 0)) or None,
+    thread_name_prefix="realitydb",
+)
+
+
+class QueueLatency:
+    """
+    Tracks how long `asyncify` calls wait for a worker thread.
+
+    `value` is the minimum wait seen over the last full interval: a standing
+    queue keeps it high, while a short burst does not.
+    """
+
+    def __init__(self, interval: float = 0.1) -> None:
+        self.interval = interval
+        self.last = 0.0
+        self._minimum = 0.0
+        self._current = float("inf")
+        self._window_start = time.monotonic()
+        self._observed_at = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, wait: float) -> None:
+        # Called from every executor thread.
+        with self._lock:
+            now = time.monotonic()
+            self.last = wait
+            self._observed_at = now
+            if wait < self._current:
+                self._current = wait
+            if now - self._window_start >= self.interval:
+                self._minimum = self._current
+                self._current = float("inf")
+                self._window_start = now
+
+    @property
+    def value(self) -> float:
+        if time.monotonic() - self._observed_at > 2 * self.interval:
+            return 0.0
+        return self._minimum
+
+
+queue_latency = QueueLatency()
+
+
+def _run_queued(
+    submitted: float, func: Callable[..., T], *args: Any, **kwargs: Any
+) -> T:
+    wait = time.monotonic() - submitted
+    queue_latency.observe(wait)
+    now = time.time_ns()
+    tracer.record("asyncify.wait", now - int(wait * 1e9), now)
+    with tracer.span("asyncify.run", function=func.__name__):
+        return func(*args, **kwargs)
+
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
 
 @dataclass
 class RPCError(BaseException):
     code: int = field(default=-32000)
     message: str = field(default="Method not found or Malformed response")
+    data: Any = field(default=None)
+
+    def to_dict(self) -> dict[str, Any]:
+        error: dict[str, Any] = {"code": self.code, "message": self.message}
+        if self.data is not None:
+            error["data"] = self.data
+        return error
 
 
 def ttl_cache(
@@ -59,24 +138,101 @@ def chunker(seq: str, size: int):
     return (seq[pos : pos + size] for pos in range(0, len(seq), size))
 
 
+LOG_LEVEL = os.environ.get("REALITYDB_LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = 10_000
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line. Structured fields passed as
+    `extra={"fields": {...}}` are merged into the object.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "name": record.name,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return orjson.dumps(entry, default=str).decode("utf-8")
+
+
+class _StderrHandler(logging.StreamHandler):
+    """Writes to whatever `sys.stderr` is at emit time."""
+
+    def __init__(self) -> None:
+        super().__init__()
+
+    @property  # type: ignore[override]
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, _: Any) -> None:
+        pass
+
+
+class _QueueHandler(QueueHandler):
+    """
+    Hands records to the background writer without formatting them, so the
+    caller (usually the event loop) never pays for formatting or I/O. Records
+    are dropped and counted when the queue is full. Arguments are formatted
+    later on the writer thread, so they must not be mutated after logging.
+    """
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # Tracebacks cannot be formatted once the frames are gone.
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _QueueHandler.dropped += 1
+
+
+_log_queue: queue.Queue[logging.LogRecord] = queue.Queue(LOG_QUEUE_SIZE)
+_log_handler = _QueueHandler(_log_queue)
+_log_writer = _StderrHandler()
+_log_writer.setFormatter(JsonFormatter())
+_log_listener = QueueListener(_log_queue, _log_writer, respect_handler_level=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+
+def dropped_log_records() -> int:
+    return _QueueHandler.dropped
+
+
 def get_logger(
     name: str | None = None,
-    level: int = logging.DEBUG,
-    format_string: str = json.dumps(
-        {
-            "timestamp": "%(asctime)s",
-            "level": "%(levelname)s",
-            "name": "%(name)s",
-            "message": "%(message)s",
-        }
-    ),
+    level: int | str = LOG_LEVEL,
+    format_string: str | None = None,
 ) -> logging.Logger:
     """
     Configures and returns a logger with a specified name, level, and format.
 
+    Records go through a bounded queue to a background thread that formats
+    them as JSON and writes them to stderr.
+
     :param name: Name of the logger. If None, the root logger will be configured.
-    :param level: Logging level, e.g., logging.INFO, logging.DEBUG.
-    :param format_string: Format string for log messages.
+    :param level: Logging level, e.g., logging.INFO; defaults to
+        `REALITYDB_LOG_LEVEL` or INFO.
+    :param format_string: Format string for log messages. Opts the logger out
+        of the background writer and into a blocking stderr handler.
     :return: Configured logger.
     """
     if name is None:
@@ -84,11 +240,13 @@ def get_logger(
     logger_ = logging.getLogger(name)
     logger_.setLevel(level)
     if not logger_.handlers:
-        ch = logging.StreamHandler()
-        formatter = logging.Formatter(format_string)
-        ch.setFormatter(formatter)
-        logger_.addHandler(ch)
-    return logging.getLogger(name)
+        if format_string is None:
+            logger_.addHandler(_log_handler)
+        else:
+            ch = logging.StreamHandler()
+            ch.setFormatter(logging.Formatter(format_string))
+            logger_.addHandler(ch)
+    return logger_
 
 
 logger = get_logger()
@@ -194,14 +352,20 @@ def asyncify(func: Callable[P, T]) -> Callable[P, Coroutine[None, T, T]]:
     """
     Decorator to convert a synchronous function to an asynchronous function.
 
+    Calls run on the shared `executor` so its backlog can be observed.
+
     :param func: Synchronous function to be decorated.
     :return: Asynchronous function.
     """
 
     @wraps(func)
     async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
-        wrapper.__name__ = func.__name__
-        return await asyncio.to_thread(func, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(
+            executor,
+            partial(ctx.run, _run_queued, time.monotonic(), func, *args, **kwargs),
+        )
 
     return wrapper
 
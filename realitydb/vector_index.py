@@ -0,0 +1,977 @@
+from __future__ import annotations
+
+import asyncio
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import faiss  # type: ignore
+import numpy as np
+import orjson
+from pydantic import BaseModel, Field
+from rocksdict import Options, Rdict, WriteBatch  # pylint: disable=E0611
+from typing_extensions import Literal
+
+from .metrics import metrics
+from .models import get_db, table_path
+from .tracing import tracer
+from .utils import asyncify, executor, get_logger
+
+logger = get_logger(__name__)
+
+Key = Tuple[str, str]
+
+INDEX_BUDGET = int(os.environ.get("REALITYDB_VECTOR_INDEX_BYTES", 1 << 30))
+FLUSH_INTERVAL = float(os.environ.get("REALITYDB_VECTOR_INDEX_FLUSH_INTERVAL", 10))
+# Rough per-vector cost of the id maps next to the vectors themselves.
+ID_OVERHEAD = 64
+# Column family mapping document ids to int64 FAISS labels and back; it also
+# holds the label counter, the table's IndexSpec and the state of the
+# inverted index (see lexical.py) under negative keys, and postings of
+# top-level metadata values under POSTING-prefixed keys.
+LABELS = "vector_ids"
+POSTING = "\x00m\x00"
+NEXT_LABEL = -1
+SPEC = -2
+LEXICAL_DOCS = -3
+LEXICAL_LENGTH = -4
+# Set once labelled documents stored before the inverted index existed are
+# indexed; cleared when documents are labelled outside of `store`.
+BACKFILLED = -5
+# Set once embeddings stored inline in documents are moved to EMBEDDINGS.
+MIGRATED = -6
+# Column family of the embeddings: label -> the vector encoded as the
+# table's `IndexSpec.storage` says, so rebuilds decode them in bulk.
+EMBEDDINGS = "vector_embeddings"
+MIGRATE_CHUNK = 1024
+# Share of rows left behind by deletes (indexes without remove_ids, e.g.
+# HNSW) above which the index is rebuilt.
+MAX_ORPHANS = 0.25
+# Filtered searches with at most this many candidates are answered by exact
+# search over the candidates' stored embeddings.
+BRUTE_FORCE_MAX = int(os.environ.get("REALITYDB_VECTOR_BRUTE_FORCE_MAX", 4096))
+
+Filter = Dict[str, Any]
+
+LOADS = metrics.counter(
+    "realitydb_vector_index_loads_total",
+    "Vector indexes loaded, by source (disk, stale or build).",
+    ("source",),
+)
+LOAD_SECONDS = metrics.histogram(
+    "realitydb_vector_index_load_seconds", "Time to load or build a vector index."
+)
+EVICTIONS = metrics.counter(
+    "realitydb_vector_index_evictions_total",
+    "Vector indexes evicted to stay within the memory budget.",
+)
+SAVES = metrics.counter(
+    "realitydb_vector_index_saves_total", "Vector indexes written to disk."
+)
+TRAININGS = metrics.counter(
+    "realitydb_vector_index_trainings_total",
+    "Exact indexes replaced by a trained IVF index once large enough.",
+)
+
+_labels_lock = threading.Lock()
+
+
+def index_path(prefix: str, table_name: str) -> str:
+    """The FAISS index file of a table, next to its RocksDB directory."""
+    return table_path(prefix, table_name) + ".faiss"
+
+
+def remove_files(prefix: str, table_name: str) -> None:
+    path = index_path(prefix, table_name)
+    for name in (path, path + ".json"):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+class IndexSpec(BaseModel):
+    """
+    How a table's vectors are indexed, set with `ConfigureVectorIndex`.
+
+    `type` picks exact search (flat), a graph (hnsw) or inverted lists over
+    full vectors (ivf_flat), product-quantized codes (ivf_pq) or scalar
+    quantized codes (ivf_sq). `cosine` normalizes vectors and searches by
+    inner product. IVF indexes search exactly until the table holds
+    `min_train` vectors, then train on a sample of up to `train_size`.
+    `nprobe` and `ef_search` are defaults that searches may override.
+    `storage` is how embeddings are kept on disk: float32, float16, or int8
+    codes with a float32 scale per vector.
+    """
+
+    type: Literal["flat", "hnsw", "ivf_flat", "ivf_pq", "ivf_sq"] = "flat"
+    metric: Literal["l2", "ip", "cosine"] = "l2"
+    hnsw_m: int = Field(default=32, ge=4, le=128)
+    ef_construction: int = Field(default=64, ge=8)
+    ef_search: int = Field(default=64, ge=1)
+    nlist: int = Field(default=1024, ge=1)
+    nprobe: int = Field(default=16, ge=1)
+    pq_m: int = Field(default=16, ge=1)
+    pq_bits: int = Field(default=8, ge=4, le=12)
+    sq: Literal["int8", "fp16"] = "int8"
+    train_size: int = Field(default=50_000, ge=1)
+    storage: Literal["float32", "float16", "int8"] = "float32"
+
+    model_config = {"extra": "forbid"}
+
+    @property
+    def trained(self) -> bool:
+        return self.type.startswith("ivf")
+
+    @property
+    def min_train(self) -> int:
+        """Vectors needed to train: FAISS wants about 39 per centroid."""
+        centroids = max(self.nlist, 1 << self.pq_bits if self.type == "ivf_pq" else 0)
+        return 39 * centroids
+
+    @property
+    def faiss_metric(self) -> int:
+        return faiss.METRIC_L2 if self.metric == "l2" else faiss.METRIC_INNER_PRODUCT
+
+    def sub_quantizers(self, dim: int) -> int:
+        """`pq_m`, lowered to the nearest divisor of `dim` as PQ requires."""
+        return next(m for m in range(min(self.pq_m, dim), 0, -1) if dim % m == 0)
+
+    def factory(self, dim: int) -> str:
+        if self.type == "flat":
+            return "IDMap2,Flat"
+        if self.type == "hnsw":
+            return f"IDMap2,HNSW{self.hnsw_m}"
+        codes = {
+            "ivf_flat": "Flat",
+            "ivf_pq": f"PQ{self.sub_quantizers(dim)}x{self.pq_bits}",
+            "ivf_sq": "SQ8" if self.sq == "int8" else "SQfp16",
+        }[self.type]
+        return f"IDMap2,IVF{self.nlist},{codes}"
+
+    def create(self, dim: int, exact: bool = False) -> faiss.Index:
+        """A new, untrained index; `exact` forces flat search."""
+        index = faiss.index_factory(
+            dim, "IDMap2,Flat" if exact else self.factory(dim), self.faiss_metric
+        )
+        if self.type == "hnsw" and not exact:
+            faiss.downcast_index(index.index).hnsw.efConstruction = self.ef_construction
+        return index
+
+    def parameters(
+        self,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        selector: Optional[faiss.IDSelector] = None,
+        exact: bool = False,
+    ) -> Optional[faiss.SearchParameters]:
+        if exact or self.type == "flat":
+            return None if selector is None else faiss.SearchParameters(sel=selector)
+        if self.type == "hnsw":
+            return faiss.SearchParametersHNSW(
+                efSearch=ef_search or self.ef_search, sel=selector
+            )
+        return faiss.SearchParametersIVF(nprobe=nprobe or self.nprobe, sel=selector)
+
+    def bytes_per_vector(self, dim: int, exact: bool = False) -> int:
+        if exact or self.type == "flat":
+            return 4 * dim
+        if self.type == "hnsw":
+            return 4 * dim + 8 * self.hnsw_m
+        # IVF lists store an int64 id next to each code.
+        if self.type == "ivf_flat":
+            return 4 * dim + 8
+        if self.type == "ivf_pq":
+            return (self.sub_quantizers(dim) * self.pq_bits + 7) // 8 + 8
+        return (dim if self.sq == "int8" else 2 * dim) + 8
+
+
+class Labels:
+    """
+    The persistent document id <-> int64 label mapping of a table, kept in
+    its `vector_ids` column family so it is written atomically with the
+    documents. Labels are allocated from a counter and never reused.
+    """
+
+    allocating = _labels_lock
+
+    def __init__(self, db: Rdict) -> None:
+        self.db = db
+        with _labels_lock:
+            try:
+                self.cf = db.get_column_family(LABELS)
+            except Exception:
+                self.cf = db.create_column_family(LABELS, Options())
+        self.handle = db.get_column_family_handle(LABELS)
+
+    def labels(self, ids: List[str]) -> List[Optional[int]]:
+        return self.cf.get(ids) if ids else []
+
+    def ids(self, labels: List[int]) -> List[Optional[str]]:
+        return self.cf.get(labels) if labels else []
+
+    def assign(
+        self, batch: WriteBatch, ids: List[str], fresh: bool = False
+    ) -> np.ndarray:
+        """
+        Returns the labels of `ids`, staging new ones in `batch`; `fresh`
+        relabels ids that already have one. Hold `allocating` until the
+        batch is written.
+        """
+        labels: List[Optional[int]] = [None] * len(ids) if fresh else self.labels(ids)
+        next_label = self.cf.get(NEXT_LABEL, 0)
+        for i, (item_id, label) in enumerate(zip(ids, labels)):
+            if label is None:
+                labels[i] = label = next_label
+                next_label += 1
+                batch.put(item_id, label, self.handle)
+                batch.put(label, item_id, self.handle)
+        batch.put(NEXT_LABEL, next_label, self.handle)
+        return np.asarray(labels, dtype=np.int64)
+
+    def relabel(
+        self, batch: WriteBatch, ids: List[str]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Stages fresh labels for `ids`, so rows an index cannot remove stop
+        resolving to a document. Returns the old and the new labels.
+        """
+        old = [label for label in self.labels(ids) if label is not None]
+        for label in old:
+            batch.delete(label, self.handle)
+        return np.asarray(old, dtype=np.int64), self.assign(batch, ids, fresh=True)
+
+    def unassign(self, batch: WriteBatch, item_id: str, label: int) -> None:
+        batch.delete(item_id, self.handle)
+        batch.delete(label, self.handle)
+
+    @staticmethod
+    def _postings(label: int, metadata: Dict[str, Any]) -> Iterable[str]:
+        for field, value in metadata.items():
+            if value is None or isinstance(value, (str, int, float, bool)):
+                yield "%s%s\x00%s\x00%016x" % (
+                    POSTING,
+                    field,
+                    orjson.dumps(value).decode(),
+                    label,
+                )
+
+    def index_metadata(
+        self, batch: WriteBatch, label: int, metadata: Dict[str, Any]
+    ) -> None:
+        """Stages postings of `metadata`'s scalar values for `label`."""
+        for key in self._postings(label, metadata):
+            batch.put(key, None, self.handle)
+
+    def unindex_metadata(
+        self, batch: WriteBatch, label: int, metadata: Dict[str, Any]
+    ) -> None:
+        for key in self._postings(label, metadata):
+            batch.delete(key, self.handle)
+
+    def candidates(self, filters: Filter) -> np.ndarray:
+        """
+        Sorted labels of documents whose metadata matches every field of
+        `filters`; a list value matches any of its elements.
+        """
+        result: Optional[np.ndarray] = None
+        for field, expected in filters.items():
+            values = expected if isinstance(expected, list) else [expected]
+            found: List[int] = []
+            it = self.cf.iter()
+            for value in values:
+                prefix = "%s%s\x00%s\x00" % (
+                    POSTING,
+                    field,
+                    orjson.dumps(value).decode(),
+                )
+                it.seek(prefix)
+                while it.valid():
+                    key = it.key()
+                    if not isinstance(key, str) or not key.startswith(prefix):
+                        break
+                    found.append(int(key[len(prefix) :], 16))
+                    it.next()
+            del it
+            labels = np.unique(np.asarray(found, dtype=np.int64))
+            result = labels if result is None else np.intersect1d(result, labels)
+            if not len(result):
+                break
+        return np.zeros(0, dtype=np.int64) if result is None else result
+
+    def spec(self) -> IndexSpec:
+        value = self.cf.get(SPEC)
+        return IndexSpec() if value is None else IndexSpec.model_validate_json(value)
+
+    def set_spec(self, spec: IndexSpec) -> None:
+        self.cf[SPEC] = spec.model_dump_json()
+
+
+def encode_vectors(vectors: np.ndarray, storage: str) -> List[bytes]:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if storage == "float32":
+        rows = vectors
+    elif storage == "float16":
+        rows = vectors.astype(np.float16)
+    else:
+        scales = np.abs(vectors).max(axis=1, keepdims=True) / 127
+        scales[scales == 0] = 1
+        codes = np.rint(vectors / scales).astype(np.int8)
+        rows = np.hstack([codes.view(np.uint8), scales.view(np.uint8)])
+    return [row.tobytes() for row in rows]
+
+
+def decode_vectors(values: List[bytes], storage: str) -> np.ndarray:
+    """Decodes equally long values at once, without a copy for float32."""
+    if not values:
+        return np.zeros((0, 0), dtype=np.float32)
+    buffer = b"".join(values)
+    if storage == "float32":
+        return np.frombuffer(buffer, dtype=np.float32).reshape(len(values), -1)
+    if storage == "float16":
+        rows = np.frombuffer(buffer, dtype=np.float16).reshape(len(values), -1)
+        return rows.astype(np.float32)
+    rows = np.frombuffer(buffer, dtype=np.uint8).reshape(len(values), -1)
+    scales = rows[:, -4:].copy().view(np.float32)
+    return rows[:, :-4].view(np.int8).astype(np.float32) * scales
+
+
+class Embeddings:
+    """
+    The stored embeddings of a table, keyed by label in its
+    `vector_embeddings` column family and encoded as `storage` says (by
+    default, as the table's IndexSpec says). Do not create one while
+    holding `Labels.allocating`.
+    """
+
+    def __init__(self, labels: Labels, storage: Optional[str] = None) -> None:
+        self.db = db = labels.db
+        with _labels_lock:
+            try:
+                self.cf = db.get_column_family(EMBEDDINGS)
+            except Exception:
+                self.cf = db.create_column_family(EMBEDDINGS, Options())
+        self.handle = db.get_column_family_handle(EMBEDDINGS)
+        self.storage = storage or labels.spec().storage
+
+    def put(self, batch: WriteBatch, labels: np.ndarray, vectors: np.ndarray) -> None:
+        for label, value in zip(labels, encode_vectors(vectors, self.storage)):
+            batch.put(int(label), value, self.handle)
+
+    def delete(self, batch: WriteBatch, labels: Iterable[int]) -> None:
+        for label in labels:
+            batch.delete(int(label), self.handle)
+
+    def get(self, labels: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """The labels that have an embedding and their vectors."""
+        found = [
+            (label, value)
+            for label, value in zip(labels, self.cf.get(labels) if labels else [])
+            if value is not None
+        ]
+        return (
+            np.asarray([label for label, _ in found], dtype=np.int64),
+            decode_vectors([value for _, value in found], self.storage),
+        )
+
+    def scan(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Every label and its vector, in label order."""
+        labels: List[int] = []
+        values: List[bytes] = []
+        it = self.cf.iter()
+        it.seek_to_first()
+        while it.valid():
+            labels.append(it.key())
+            values.append(it.value())
+            it.next()
+        del it
+        return np.asarray(labels, dtype=np.int64), decode_vectors(values, self.storage)
+
+    def reencode(self, storage: str) -> None:
+        """Rewrites every embedding as `storage`; hold `Labels.allocating`."""
+        if storage == self.storage:
+            return
+        labels, vectors = self.scan()
+        self.storage = storage
+        for start in range(0, len(labels), MIGRATE_CHUNK):
+            batch = WriteBatch()
+            end = start + MIGRATE_CHUNK
+            self.put(batch, labels[start:end], vectors[start:end])
+            self.db.write(batch)
+
+
+def _selector(candidates: np.ndarray) -> faiss.IDSelector:
+    """
+    An ID selector over sorted labels: a bitmap when they are dense enough
+    to beat a hash set, since labels are allocated from a counter.
+    """
+    if len(candidates) * 64 < candidates[-1]:
+        return faiss.IDSelectorBatch(candidates)
+    bitmap = np.packbits(
+        np.bincount(candidates, minlength=int(candidates[-1]) + 1).astype(bool),
+        bitorder="little",
+    )
+    selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+    selector.referenced = bitmap  # keep the buffer alive with the selector
+    return selector
+
+
+class TableIndex:
+    """
+    The FAISS index of one (prefix, table), with rows labelled by the
+    table's `Labels` and built as its `IndexSpec` says.
+
+    `sequence` is the table's RocksDB sequence number the index reflects, or
+    None once a write it did not see may have happened. Indexes loaded from
+    disk are memory-mapped read-only and copied into memory on first write.
+
+    Indexes that cannot remove rows (HNSW) keep deleted rows as orphans,
+    which searches skip because their labels no longer map to a document.
+
+    Mutations and searches hold `lock`; FAISS releases the GIL while
+    searching, so they run on worker threads.
+    """
+
+    def __init__(self, spec: Optional[IndexSpec] = None) -> None:
+        self.spec = spec or IndexSpec()
+        self.index: Optional[faiss.Index] = None
+        # IVF specs search a flat index until there is enough data to train.
+        self.exact = self.spec.trained
+        self.orphans = 0
+        self.sequence: Optional[int] = None
+        self.mapped = False
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return 0 if self.index is None else self.index.ntotal
+
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self.index is None else self.index.d
+
+    @property
+    def nbytes(self) -> int:
+        """Estimated resident bytes; mapped vectors live in the page cache."""
+        if self.index is None:
+            return 0
+        codes = (
+            0 if self.mapped else self.spec.bytes_per_vector(self.index.d, self.exact)
+        )
+        return self.index.ntotal * (codes + ID_OVERHEAD)
+
+    @property
+    def needs_rebuild(self) -> bool:
+        return self.orphans > MAX_ORPHANS * max(self.size, 1)
+
+    def _writable(self, dim: int) -> faiss.Index:
+        if self.index is None:
+            self.index = self.spec.create(dim, exact=self.exact)
+        elif self.mapped:
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            self.mapped = False
+        return self.index
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.spec.metric == "cosine":
+            vectors = vectors.copy()
+            faiss.normalize_L2(vectors)
+        return vectors
+
+    def _train(self) -> None:
+        exact = self.index
+        labels = faiss.vector_to_array(exact.id_map)
+        vectors = exact.index.reconstruct_n(0, exact.ntotal)
+        sample = vectors
+        if len(vectors) > self.spec.train_size:
+            rows = np.random.default_rng(0).choice(
+                len(vectors), self.spec.train_size, replace=False
+            )
+            sample = vectors[rows]
+        with tracer.span("vector_index.train", vectors=len(sample)):
+            index = self.spec.create(exact.d)
+            index.train(sample)
+            index.add_with_ids(vectors, labels)
+        self.index = index
+        self.exact = False
+        TRAININGS.inc()
+        logger.info(
+            "Trained %s index on %d of %d vectors",
+            self.spec.factory(exact.d),
+            len(sample),
+            len(vectors),
+        )
+
+    def _advance(self, sequence: Optional[Tuple[int, int]]) -> None:
+        # `sequence` is the table's sequence number just before and after the
+        # write being applied: the index stays in step with the table only if
+        # it was in step before.
+        self.dirty = True
+        if sequence is not None and self.sequence == sequence[0]:
+            self.sequence = sequence[1]
+        else:
+            self.sequence = None
+
+    def _remove(self, index: faiss.Index, labels: np.ndarray) -> None:
+        if not len(labels):
+            return
+        try:
+            index.remove_ids(labels)
+        except RuntimeError:
+            self.orphans += len(labels)
+
+    def add(
+        self,
+        labels: np.ndarray,
+        vectors: np.ndarray,
+        sequence: Optional[Tuple[int, int]] = None,
+        replaces: Optional[np.ndarray] = None,
+    ) -> None:
+        """Adds the rows of `labels`, after removing the rows of `replaces`."""
+        with self.lock:
+            index = self._writable(vectors.shape[1])
+            if replaces is not None:
+                self._remove(index, replaces)
+            index.add_with_ids(self._prepare(vectors), labels)
+            if self.exact and self.spec.trained and index.ntotal >= self.spec.min_train:
+                self._train()
+            self._advance(sequence)
+
+    def remove(
+        self, labels: np.ndarray, sequence: Optional[Tuple[int, int]] = None
+    ) -> None:
+        with self.lock:
+            if self.index is not None:
+                self._remove(self._writable(self.index.d), labels)
+            self._advance(sequence)
+
+    def _distances(self, scores: np.ndarray) -> np.ndarray:
+        # Lower is nearer for every metric: squared L2, negated inner
+        # product or cosine distance.
+        if self.spec.metric == "l2":
+            return scores
+        return -scores if self.spec.metric == "ip" else 1 - scores
+
+    def distances(self, vector: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        """Exact distances from `vector` to each row of `vectors`."""
+        query, rows = self._prepare(vector)[0], self._prepare(vectors)
+        if self.spec.metric == "l2":
+            return ((rows - query) ** 2).sum(axis=1)
+        return self._distances(rows @ query)
+
+    def search(
+        self,
+        vector: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        candidates: Optional[np.ndarray] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Returns (label, distance) pairs, nearest first, among the sorted
+        `candidates` labels if given. Orphaned rows are oversampled for, but
+        not filtered out here.
+        """
+        return self.search_many(vector, k, nprobe, ef_search, candidates)[0]
+
+    def search_many(
+        self,
+        vectors: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        candidates: Optional[np.ndarray] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """`search` for each row of `vectors`, in one FAISS call."""
+        with self.lock:
+            if not self.size:
+                return [[] for _ in range(len(vectors))]
+            limit = min(k + min(self.orphans, k), self.size)
+            selector = None
+            if candidates is not None:
+                limit = min(limit, len(candidates))
+                selector = _selector(candidates)
+            params = self.spec.parameters(nprobe, ef_search, selector, exact=self.exact)
+            with tracer.span(
+                "faiss.search", k=limit, queries=len(vectors), ntotal=self.index.ntotal
+            ):
+                distances, labels = self.index.search(
+                    self._prepare(vectors), limit, params=params
+                )
+        return [
+            [
+                (int(label), float(distance))
+                for label, distance in zip(row, self._distances(scores))
+                if label >= 0
+            ]
+            for row, scores in zip(labels, distances)
+        ]
+
+    def save(self, path: str) -> None:
+        """Atomically writes the index and its metadata next to the table."""
+        with self.lock:
+            if self.index is None or not self.dirty:
+                return
+            faiss.write_index(self.index, path + ".tmp")
+            meta = {
+                "sequence": self.sequence,
+                "ntotal": self.index.ntotal,
+                "spec": self.spec.model_dump(),
+                "exact": self.exact,
+                "orphans": self.orphans,
+            }
+            with open(path + ".json.tmp", "wb") as f:
+                f.write(orjson.dumps(meta))
+            os.replace(path + ".tmp", path)
+            os.replace(path + ".json.tmp", path + ".json")
+            self.dirty = False
+        SAVES.inc()
+
+    @classmethod
+    def open(cls, path: str, spec: IndexSpec) -> Optional[TableIndex]:
+        """
+        Memory-maps a saved index; None if it is missing, torn or was built
+        for another spec.
+        """
+        try:
+            with open(path + ".json", "rb") as f:
+                meta = orjson.loads(f.read())
+            index = faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC)
+        except (OSError, RuntimeError, orjson.JSONDecodeError):
+            return None
+        if (
+            not isinstance(index, faiss.IndexIDMap2)
+            or index.ntotal != meta.get("ntotal")
+            or meta.get("spec") != spec.model_dump()
+        ):
+            return None
+        table = cls(spec)
+        table.index = index
+        table.exact = meta["exact"]
+        table.orphans = meta["orphans"]
+        table.sequence = meta["sequence"]
+        table.mapped = True
+        return table
+
+
+def migrate(db: Rdict, labels: Labels, embeddings: Embeddings) -> None:
+    """
+    Moves embeddings stored inline in documents to the embeddings column
+    family, labelling documents stored before labels existed.
+    """
+
+    def move(documents: List[Dict[str, Any]]) -> None:
+        batch = WriteBatch()
+        ids = [document["id"] for document in documents]
+        found = labels.labels(ids)
+        assigned = labels.assign(batch, ids)
+        for label, old, document in zip(assigned, found, documents):
+            if old is None:
+                labels.index_metadata(batch, int(label), document.get("metadata") or {})
+        vectors = np.asarray(
+            [document.pop("embedding") for document in documents], dtype=np.float32
+        )
+        embeddings.put(batch, assigned, vectors)
+        for document in documents:
+            batch.put(document["id"], orjson.dumps(document))
+        # Newly labelled documents still need their content indexed.
+        batch.delete(BACKFILLED, labels.handle)
+        db.write(batch)
+
+    with labels.allocating:
+        if labels.cf.get(MIGRATED):
+            return
+        documents: List[Dict[str, Any]] = []
+        it = db.iter()
+        it.seek_to_first()
+        while it.valid():
+            document = orjson.loads(it.value())
+            if isinstance(document, dict) and document.get("embedding"):
+                documents.append(document)
+                if len(documents) >= MIGRATE_CHUNK:
+                    move(documents)
+                    documents = []
+            it.next()
+        del it
+        if documents:
+            move(documents)
+        labels.cf[MIGRATED] = 1
+
+
+def migrated(db: Rdict) -> Labels:
+    """
+    The table's labels, once documents stored before labels existed are
+    labelled and their metadata indexed. Call before resolving labels.
+    """
+    labels = Labels(db)
+    if not labels.cf.get(MIGRATED):
+        migrate(db, labels, Embeddings(labels))
+    return labels
+
+
+def build(prefix: str, table_name: str) -> TableIndex:
+    """Builds a table's index from its stored embeddings."""
+    db = get_db(prefix, table_name)
+    labels = migrated(db)
+    embeddings = Embeddings(labels)
+    # Read before scanning: a write racing the scan makes the index look
+    # stale, never fresh.
+    sequence = db.latest_sequence_number()
+    with tracer.span("vector_index.scan"):
+        found, vectors = embeddings.scan()
+    table = TableIndex(labels.spec())
+    if len(found):
+        table.add(found, vectors)
+    table.sequence = sequence
+    return table
+
+
+def load(prefix: str, table_name: str) -> Tuple[Optional[TableIndex], bool]:
+    """Opens a table's saved index and whether it matches the table."""
+    db = get_db(prefix, table_name)
+    table = TableIndex.open(index_path(prefix, table_name), Labels(db).spec())
+    if table is None:
+        return None, False
+    return table, table.sequence == db.latest_sequence_number()
+
+
+class IndexRegistry:
+    """
+    Vector indexes keyed by (prefix, table), loaded lazily on first use and
+    evicted least-recently-used once their total size exceeds `max_bytes`.
+
+    Indexes are saved next to their table every `flush_interval` seconds, on
+    eviction and at exit. A saved index that matches the table's sequence
+    number is memory-mapped; a stale one is served while a fresh one is
+    built in the background. Tables without a saved index are built inline.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = INDEX_BUDGET,
+        flush_interval: Optional[float] = FLUSH_INTERVAL,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self._indexes: OrderedDict[Key, TableIndex] = OrderedDict()
+        self._loading: Dict[Key, asyncio.Future[TableIndex]] = {}
+        # Bumped by `drop`, so a build that raced a write is not cached.
+        self._generations: Dict[Key, int] = {}
+        self._rebuilds: Dict[Key, asyncio.Task[None]] = {}
+        self._stop = threading.Event()
+        if flush_interval:
+            threading.Thread(
+                target=self._run,
+                args=(flush_interval,),
+                name="realitydb-vector-index-flush",
+                daemon=True,
+            ).start()
+
+    def __contains__(self, key: Key) -> bool:
+        return key in self._indexes
+
+    def __iter__(self) -> Iterator[Tuple[Key, TableIndex]]:
+        return iter(list(self._indexes.items()))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(table.nbytes for table in self._indexes.values())
+
+    def peek(self, prefix: str, table_name: str) -> Optional[TableIndex]:
+        """The table's index if it is loaded, without loading it."""
+        return self._indexes.get((prefix, table_name))
+
+    async def get(self, prefix: str, table_name: str) -> TableIndex:
+        """Returns the table's index, loading or building it if needed."""
+        key = (prefix, table_name)
+        table = self._indexes.get(key)
+        if table is not None:
+            self._indexes.move_to_end(key)
+            return table
+        loading = self._loading.get(key)
+        if loading is not None:
+            return await asyncio.shield(loading)
+        future = self._loading[key] = asyncio.get_running_loop().create_future()
+        generation = self._generations.get(key, 0)
+        try:
+            table = await self._load(key, generation)
+            future.set_result(table)
+            return table
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            self._loading.pop(key, None)
+
+    async def _load(self, key: Key, generation: int) -> TableIndex:
+        start = time.perf_counter()
+        with tracer.span("vector_index.load", table="%s/%s" % key) as span:
+            table, fresh = await asyncify(load)(*key)
+            if table is None:
+                source = "build"
+                table = await asyncify(build)(*key)
+            else:
+                source = "disk" if fresh else "stale"
+            if span is not None:
+                span.set(source=source)
+        elapsed = time.perf_counter() - start
+        LOADS.labels(source).inc()
+        LOAD_SECONDS.observe(elapsed)
+        logger.info(
+            "Loaded vector index %s/%s from %s: %d vectors, %d bytes in %.3fs",
+            key[0],
+            key[1],
+            source,
+            table.size,
+            table.nbytes,
+            elapsed,
+        )
+        self._install(key, generation, table)
+        if source == "stale" or table.needs_rebuild:
+            self.rebuild(*key)
+        return table
+
+    def rebuild(self, prefix: str, table_name: str) -> None:
+        """Rebuilds a table's index in the background, serving the old one."""
+        key = (prefix, table_name)
+        if key in self._rebuilds:
+            return
+        task = asyncio.create_task(self._rebuild(key, self._generations.get(key, 0)))
+        self._rebuilds[key] = task
+        task.add_done_callback(lambda _: self._rebuilds.pop(key, None))
+
+    def _install(self, key: Key, generation: int, table: TableIndex) -> None:
+        if self._generations.get(key, 0) != generation:
+            return
+        self._indexes[key] = table
+        self.fit(keep=key)
+        if table.dirty:
+            executor.submit(table.save, index_path(*key))
+
+    async def _rebuild(self, key: Key, generation: int, attempts: int = 3) -> None:
+        for _ in range(attempts):
+            try:
+                start = time.perf_counter()
+                table = await asyncify(build)(*key)
+            except Exception:
+                logger.exception("Rebuilding vector index %s/%s failed", *key)
+                return
+            # Writes during the build were added to the stale index, not to
+            # this one: only swap when none happened.
+            if table.sequence != get_db(*key).latest_sequence_number():
+                continue
+            logger.info(
+                "Rebuilt vector index %s/%s: %d vectors in %.3fs",
+                key[0],
+                key[1],
+                table.size,
+                time.perf_counter() - start,
+            )
+            table.dirty = True
+            self._install(key, generation, table)
+            return
+        logger.warning(
+            "Vector index %s/%s kept changing during %d rebuilds; serving the "
+            "stale index until it is next loaded",
+            key[0],
+            key[1],
+            attempts,
+        )
+
+    def fit(self, keep: Optional[Key] = None) -> None:
+        """Evicts least recently used indexes until within budget."""
+        total = self.nbytes
+        for key in list(self._indexes):
+            if total <= self.max_bytes:
+                return
+            if key == keep:
+                continue
+            evicted = self._indexes.pop(key)
+            total -= evicted.nbytes
+            EVICTIONS.inc()
+            logger.info(
+                "Evicted vector index %s/%s (%d bytes)", key[0], key[1], evicted.nbytes
+            )
+            if evicted.dirty:
+                executor.submit(evicted.save, index_path(*key))
+        if total > self.max_bytes:
+            logger.warning(
+                "Vector index %s/%s alone exceeds the %d byte budget",
+                *(keep or ("", "")),
+                self.max_bytes,
+            )
+
+    def flush(self) -> None:
+        """Saves every index with unsaved changes."""
+        for key, table in self:
+            if not table.dirty:
+                continue
+            try:
+                table.save(index_path(*key))
+            except Exception:
+                logger.exception("Saving vector index %s/%s failed", *key)
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def close(self) -> None:
+        self._stop.set()
+        self.flush()
+
+    async def configure(self, prefix: str, table_name: str, spec: IndexSpec) -> None:
+        """Stores a table's index spec; the index is rebuilt on next use."""
+
+        def store() -> None:
+            labels = Labels(get_db(prefix, table_name))
+            embeddings = Embeddings(labels)
+            with labels.allocating:
+                embeddings.reencode(spec.storage)
+                labels.set_spec(spec)
+
+        await asyncify(store)()
+        self.drop(prefix, table_name, purge=True)
+
+    def drop(self, prefix: str, table_name: str, purge: bool = False) -> None:
+        """
+        Forgets a table's index; the next use loads it again. `purge` also
+        removes the saved index, e.g. when the table is deleted.
+        """
+        key = (prefix, table_name)
+        self._indexes.pop(key, None)
+        self._generations[key] = self._generations.get(key, 0) + 1
+        if purge:
+            remove_files(prefix, table_name)
+
+
+indexes = IndexRegistry()
+atexit.register(indexes.close)
+
+
+def _collect(attribute: str) -> List[Tuple[Dict[str, str], float]]:
+    return [
+        ({"table": f"{prefix}/{table_name}"}, float(getattr(table, attribute)))
+        for (prefix, table_name), table in indexes
+    ]
+
+
+metrics.collector(
+    "realitydb_vector_index_bytes",
+    "Estimated memory of each loaded vector index.",
+    lambda: _collect("nbytes"),
+)
+metrics.collector(
+    "realitydb_vector_index_vectors",
+    "Vectors in each loaded vector index.",
+    lambda: _collect("size"),
+)
+metrics.collector(
+    "realitydb_vector_index_budget_bytes",
+    "Memory budget shared by all vector indexes.",
+    lambda: [({}, float(indexes.max_bytes))],
+)
@@ -1,97 +1,821 @@
-from typing import List, Dict, Any, Optional
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Any, Optional, Tuple, Union
+from typing_extensions import Literal
+from rocksdict import Rdict, WriteBatch  # pylint: disable=E0611
 from sentence_transformers import SentenceTransformer
-import faiss
 import numpy as np
-from .models import DocumentObject
+import orjson
+from .embedding_cache import embedding_cache
+from .lexical import Lexical, backfill
+from .metrics import metrics
+from .micro_batch import MicroBatcher
+from .models import DocumentObject, get_db
+from .tracing import tracer
+from .utils import INVALID_PARAMS, RPCError, asyncify
+from .vector_index import (
+    BRUTE_FORCE_MAX,
+    Embeddings,
+    Filter,
+    Labels,
+    TableIndex,
+    indexes,
+    migrated,
+)
 
+MODEL_NAME = os.environ.get("REALITYDB_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBED_BATCH_SIZE = int(os.environ.get("REALITYDB_EMBED_BATCH_SIZE", 64))
 
+# Hybrid search: each leg ranks at least HYBRID_DEPTH documents, fused with
+# reciprocal rank fusion; legs slower than the budget (seconds) are dropped.
+HYBRID_DEPTH = int(os.environ.get("REALITYDB_HYBRID_DEPTH", 50))
+HYBRID_BUDGET = float(os.environ.get("REALITYDB_HYBRID_BUDGET", 1.0))
+RRF_K = 60
+# Queries accepted by one multi-query search.
+MAX_QUERIES = int(os.environ.get("REALITYDB_MAX_QUERIES", 64))
+
+SearchMode = Literal["vector", "lexical", "hybrid"]
+Combine = Literal["separate", "dedupe", "merge"]
+
+DROPPED_LEGS = metrics.counter(
+    "realitydb_hybrid_search_dropped_total",
+    "Hybrid search legs dropped for exceeding the latency budget.",
+    ("leg",),
+)
+
+# Inference runs on its own threads so a large ingest does not hold up the
+# storage calls queued on the shared executor.
+inference_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("REALITYDB_INFERENCE_WORKERS", 1)),
+    thread_name_prefix="realitydb-inference",
+)
 
 
 class VectorStore(DocumentObject):
     content: str
-    embedding: List[float]
+    # Kept out of the stored document, in the table's `Embeddings`.
+    embedding: Optional[List[float]] = None
     metadata: Dict[str, Any]
 
     @classmethod
-    def initialize(cls, model_name: str = "all-MiniLM-L6-v2"):
+    def initialize(cls, model_name: str = MODEL_NAME):
         cls.model = SentenceTransformer(model_name)
-        cls.index = None
-        cls.id_to_object: Dict[str, VectorStore] = {}
+        cls.model_name = model_name
 
     @classmethod
-    async def add_documents(cls, documents: List[Dict[str, Any]], prefix: str, table_name: str):
-        if cls.index is None:
+    def embed(cls, texts: List[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+        if getattr(cls, "model", None) is None:
             cls.initialize()
+        with tracer.span("embed", texts=len(texts), batch_size=batch_size):
+            embeddings = cls.model.encode(texts, batch_size=batch_size)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
 
-        for doc in documents:
-            content = doc.get('content', '')
-            metadata = doc.get('metadata', {})
-            embedding = cls.model.encode([content])[0].tolist()
+    @classmethod
+    async def embed_async(
+        cls, texts: List[str], batch_size: int = EMBED_BATCH_SIZE
+    ) -> np.ndarray:
+        """Runs `embed` on the inference executor."""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(
+            inference_executor, ctx.run, cls.embed, texts, batch_size
+        )
 
-            vector_doc = cls(
-                content=content,
-                embedding=embedding,
-                metadata=metadata
+    @classmethod
+    async def embed_cached(
+        cls, texts: List[str], batch_size: int = EMBED_BATCH_SIZE
+    ) -> np.ndarray:
+        """
+        `embed_async` through the embedding cache: only texts not cached for
+        the current model are encoded, each of them once.
+        """
+        model_name = getattr(cls, "model_name", MODEL_NAME)
+        embeddings = await asyncify(embedding_cache.get)(model_name, texts)
+        missing = list(
+            dict.fromkeys(
+                text for text, embedding in zip(texts, embeddings) if embedding is None
             )
-            await vector_doc.put_item(prefix=prefix, table_name=table_name)
+        )
+        if missing:
+            encoded = await cls.embed_async(missing, batch_size)
+            await asyncify(embedding_cache.put)(model_name, missing, encoded)
+            fresh = dict(zip(missing, encoded))
+            embeddings = [
+                fresh[text] if embedding is None else embedding
+                for text, embedding in zip(texts, embeddings)
+            ]
+        return np.ascontiguousarray(np.stack(embeddings), dtype=np.float32)
 
-            if cls.index is None:
-                cls.index = faiss.IndexFlatL2(len(embedding))
-            
-            cls.index.add(np.array([embedding], dtype=np.float32))
-            cls.id_to_object[vector_doc.id] = vector_doc
+    @classmethod
+    @asyncify
+    def store(
+        cls,
+        *,
+        prefix: str,
+        table_name: str,
+        docs: List["VectorStore"],
+        embeddings: Optional[np.ndarray] = None,
+        relabel: bool = False,
+    ) -> Tuple[np.ndarray, Optional[np.ndarray], Optional[Tuple[int, int]]]:
+        """
+        Writes `docs`, their labels and their `embeddings` (by default, each
+        doc's `embedding`) in one WriteBatch. Returns the labels,
+        the labels they replace when `relabel` is set, and the table's
+        sequence number just before and after the write (None if another
+        write interleaved).
+        """
+        db = get_db(prefix, table_name)
+        labels = Labels(db)
+        ids = [doc.id for doc in docs]
+        lexical = Lexical(labels)
+        stored = Embeddings(labels)
+        if embeddings is None:
+            embeddings = np.asarray([doc.embedding for doc in docs], dtype=np.float32)
+        with labels.allocating:
+            batch = WriteBatch()
+            # Drop the postings of the versions being overwritten.
+            for label, previous in zip(labels.labels(ids), db.get(ids)):
+                if label is not None and previous is not None:
+                    previous = orjson.loads(previous)
+                    labels.unindex_metadata(
+                        batch, label, previous.get("metadata") or {}
+                    )
+                    lexical.unindex(batch, label, previous.get("content") or "")
+            for doc in docs:
+                batch.put(
+                    doc.id, doc.model_dump_json(exclude={"embedding"}).encode("utf-8")
+                )
+            replaced = None
+            if relabel:
+                replaced, assigned = labels.relabel(batch, ids)
+                stored.delete(batch, replaced)
+            else:
+                assigned = labels.assign(batch, ids)
+            stored.put(batch, assigned, embeddings)
+            for doc, label in zip(docs, assigned):
+                labels.index_metadata(batch, int(label), doc.metadata)
+                lexical.index(batch, int(label), doc.content)
+            lexical.stage_totals(batch)
+            return assigned, replaced, cls._write(db, batch)
+
+    @staticmethod
+    def _write(db: Rdict, batch: WriteBatch) -> Optional[Tuple[int, int]]:
+        writes = len(batch)
+        before = db.latest_sequence_number()
+        db.write(batch)
+        after = db.latest_sequence_number()
+        return (before, after) if after - before == writes else None
+
+    @classmethod
+    @asyncify
+    def remove(
+        cls, *, prefix: str, table_name: str, doc_id: str
+    ) -> Optional[Tuple[int, Optional[Tuple[int, int]]]]:
+        """
+        Deletes a document and its label in one WriteBatch; None if it does
+        not exist. Returns the label and the sequence numbers as `store`.
+        """
+        db = get_db(prefix, table_name)
+        value = db.get(doc_id)
+        if value is None:
+            return None
+        labels = Labels(db)
+        lexical = Lexical(labels)
+        stored = Embeddings(labels)
+        with labels.allocating:
+            batch = WriteBatch()
+            batch.delete(doc_id)
+            label = labels.labels([doc_id])[0]
+            if label is not None:
+                document = orjson.loads(value)
+                labels.unassign(batch, doc_id, label)
+                stored.delete(batch, [label])
+                labels.unindex_metadata(batch, label, document.get("metadata") or {})
+                lexical.unindex(batch, label, document.get("content") or "")
+                lexical.stage_totals(batch)
+            return label, cls._write(db, batch)
+
+    @classmethod
+    @asyncify
+    def by_labels(
+        cls, *, prefix: str, table_name: str, labels: List[int]
+    ) -> List[Optional["VectorStore"]]:
+        """Fetches the documents of `labels` with two multi-gets."""
+        db = get_db(prefix, table_name)
+        ids = Labels(db).ids(labels)
+        found = [doc_id for doc_id in ids if doc_id is not None]
+        docs = dict(zip(found, db.get(found))) if found else {}
+        return [
+            (
+                None
+                if doc_id is None or docs.get(doc_id) is None
+                else cls.model_validate_json(docs[doc_id].decode("utf-8"))
+            )
+            for doc_id in ids
+        ]
+
+    @staticmethod
+    @asyncify
+    def attach_embeddings(
+        *, prefix: str, table_name: str, items: List[DocumentObject]
+    ) -> None:
+        """Sets the stored `embedding` of each of `items` that has one."""
+        labels = Labels(get_db(prefix, table_name))
+        found, vectors = Embeddings(labels).get(
+            [
+                label
+                for label in labels.labels([item.id for item in items])
+                if label is not None
+            ]
+        )
+        embeddings = dict(zip(labels.ids(found.tolist()), vectors.tolist()))
+        for item in items:
+            if item.id in embeddings:
+                item.embedding = embeddings[item.id]
+
+    @classmethod
+    @asyncify
+    def candidates(cls, *, prefix: str, table_name: str, filters: Filter) -> np.ndarray:
+        return migrated(get_db(prefix, table_name)).candidates(filters)
+
+    @classmethod
+    @asyncify
+    def brute_force(
+        cls,
+        *,
+        prefix: str,
+        table_name: str,
+        table: TableIndex,
+        vector: np.ndarray,
+        labels: np.ndarray,
+        k: int,
+    ) -> List[Dict[str, Any]]:
+        """Exact top-k among `labels`, scored against their stored embeddings."""
+        db = get_db(prefix, table_name)
+        mapping = Labels(db)
+        found, vectors = Embeddings(mapping).get(labels.tolist())
+        if not len(found):
+            return []
+        with tracer.span("vector_search.brute_force", candidates=len(found)):
+            distances = table.distances(vector, vectors)
+            nearest = np.argsort(distances)[:k]
+        ids = mapping.ids(found[nearest].tolist())
+        results = []
+        for i, doc_id, value in zip(nearest, ids, db.get(ids)):
+            if value is None:
+                continue
+            doc = orjson.loads(value)
+            results.append(
+                {
+                    "id": doc_id,
+                    "content": doc["content"],
+                    "metadata": doc["metadata"],
+                    "distance": float(distances[i]),
+                }
+            )
+        return results
+
+    @classmethod
+    async def add_documents(
+        cls,
+        documents: List[Dict[str, Any]],
+        prefix: str,
+        table_name: str,
+        batch_size: int = EMBED_BATCH_SIZE,
+    ):
+        if not documents:
+            return {"message": "Added 0 documents to the vector store"}
+
+        embeddings = await cls.embed_cached(
+            [doc.get("content", "") for doc in documents], batch_size
+        )
+        vector_docs = [
+            cls(content=doc.get("content", ""), metadata=doc.get("metadata", {}))
+            for doc in documents
+        ]
+        labels, _, sequence = await cls.store(
+            prefix=prefix,
+            table_name=table_name,
+            docs=vector_docs,
+            embeddings=embeddings,
+        )
+        await cls._apply(
+            prefix, table_name, lambda table: table.add(labels, embeddings, sequence)
+        )
 
         return {"message": f"Added {len(documents)} documents to the vector store"}
 
+    @staticmethod
+    async def _apply(
+        prefix: str, table_name: str, change: Callable[[TableIndex], None]
+    ) -> None:
+        table = indexes.peek(prefix, table_name)
+        if table is None:
+            # An index that is not loaded (or still loading) is revalidated on load.
+            indexes.drop(prefix, table_name)
+            return
+        await asyncify(change)(table)
+        indexes.fit(keep=(prefix, table_name))
+        if table.needs_rebuild:
+            indexes.rebuild(prefix, table_name)
+
     @classmethod
-    async def search(cls, query: str, prefix: str, table_name: str, k: int = 5) -> List[Dict[str, Any]]:
-        if cls.index is None:
-            cls.initialize()
-            # Rebuild index from stored documents
-            stored_docs = await cls.scan(prefix=prefix, table_name=table_name)
-            for doc in stored_docs:
-                cls.index.add(np.array([doc.embedding], dtype=np.float32))
-                cls.id_to_object[doc.id] = doc
-
-        query_embedding = cls.model.encode([query])
-        distances, indices = cls.index.search(query_embedding, k)
-        
+    @asyncify
+    def lexical_hits(
+        cls,
+        *,
+        prefix: str,
+        table_name: str,
+        query: str,
+        k: int,
+        candidates: Optional[np.ndarray] = None,
+    ) -> List[Tuple[int, float]]:
+        db = get_db(prefix, table_name)
+        backfill(db)
+        with tracer.span("vector_search.bm25", k=k):
+            return Lexical(Labels(db)).search(query, k, candidates)
+
+    @classmethod
+    async def search(
+        cls,
+        query: str,
+        prefix: str,
+        table_name: str,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filters: Optional[Filter] = None,
+        mode: SearchMode = "vector",
+        weights: Optional[Dict[str, float]] = None,
+        budget: float = HYBRID_BUDGET,
+    ) -> List[Dict[str, Any]]:
+        candidates = None
+        if filters:
+            # Pre-filter: resolve the metadata filter to labels first, so the
+            # top-k is taken among matching documents only.
+            candidates = await cls.candidates(
+                prefix=prefix, table_name=table_name, filters=filters
+            )
+            if not len(candidates):
+                return []
+
+        if mode == "lexical":
+            return await cls._lexical_search(query, prefix, table_name, k, candidates)
+        if mode == "hybrid":
+            return await cls._hybrid_search(
+                query,
+                prefix,
+                table_name,
+                k,
+                nprobe,
+                ef_search,
+                candidates,
+                weights or {},
+                budget,
+            )
+        return await cls._vector_search(
+            query, prefix, table_name, k, nprobe, ef_search, candidates
+        )
+
+    @classmethod
+    async def _vector_search(
+        cls,
+        query: str,
+        prefix: str,
+        table_name: str,
+        k: int,
+        nprobe: Optional[int],
+        ef_search: Optional[int],
+        candidates: Optional[np.ndarray],
+    ) -> List[Dict[str, Any]]:
+        table = await indexes.get(prefix, table_name)
+        if not table.size:
+            return []
+
+        query_embedding = (await query_embeddings.submit(query))[None, :]
+        return await cls._nearest(
+            prefix, table_name, table, query_embedding, k, nprobe, ef_search, candidates
+        )
+
+    @classmethod
+    async def _nearest(
+        cls,
+        prefix: str,
+        table_name: str,
+        table: TableIndex,
+        query_embedding: np.ndarray,
+        k: int,
+        nprobe: Optional[int],
+        ef_search: Optional[int],
+        candidates: Optional[np.ndarray],
+        hits: Optional[List[Tuple[int, float]]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        The `k` documents nearest to `query_embedding`; `hits` are the
+        index's, if already searched.
+        """
+        if candidates is not None and len(candidates) <= BRUTE_FORCE_MAX:
+            return await cls.brute_force(
+                prefix=prefix,
+                table_name=table_name,
+                table=table,
+                vector=query_embedding,
+                labels=candidates,
+                k=k,
+            )
+        if hits is None and candidates is None:
+            hits = await index_searches.submit(
+                (table, query_embedding, k, nprobe, ef_search)
+            )
+        elif hits is None:
+            hits = await asyncify(table.search)(
+                query_embedding, k, nprobe, ef_search, candidates
+            )
+        docs = await cls.by_labels(
+            prefix=prefix, table_name=table_name, labels=[label for label, _ in hits]
+        )
+
         results = []
-        for i, idx in enumerate(indices[0]):
-            doc = cls.id_to_object[list(cls.id_to_object.keys())[idx]]
-            results.append({
+        for (_, distance), doc in zip(hits, docs):
+            if doc is None:
+                continue
+            results.append(
+                {
+                    "id": doc.id,
+                    "content": doc.content,
+                    "metadata": doc.metadata,
+                    "distance": distance,
+                }
+            )
+
+        if candidates is not None and len(results) < min(k, len(candidates)):
+            # A graph search can miss sparse candidates: fall back to exact.
+            return await cls.brute_force(
+                prefix=prefix,
+                table_name=table_name,
+                table=table,
+                vector=query_embedding,
+                labels=candidates,
+                k=k,
+            )
+
+        # Oversampled for orphaned rows
+        return results[:k]
+
+    @classmethod
+    async def search_many(
+        cls,
+        queries: List[Dict[str, Any]],
+        prefix: str,
+        table_name: str,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        mode: SearchMode = "vector",
+        weights: Optional[Dict[str, float]] = None,
+        budget: float = HYBRID_BUDGET,
+        combine: Combine = "separate",
+        filters: Optional[Filter] = None,
+    ) -> Union[List[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """
+        Runs several queries, each a `query` text or a precomputed `vector`
+        with its own `k` and `filters` (by default, `filters`), and combines
+        their results as `combine_rankings` does. Vector searches encode all
+        texts in one pass and search the index once for all unfiltered
+        queries.
+        """
+        if filters:
+            queries = [
+                query if "filters" in query else dict(query, filters=filters)
+                for query in queries
+            ]
+        for query in queries:
+            if "vector" in query and mode != "vector":
+                raise RPCError(
+                    code=INVALID_PARAMS,
+                    message=f"{mode} search needs query texts, not vectors",
+                )
+            if "vector" not in query and "query" not in query:
+                raise RPCError(
+                    code=INVALID_PARAMS,
+                    message="Each query needs a query text or a vector",
+                )
+        ks = [query.get("k", k) for query in queries]
+        if mode == "vector":
+            rankings = await cls._vector_search_many(
+                queries, ks, prefix, table_name, nprobe, ef_search
+            )
+        else:
+            rankings = list(
+                await asyncio.gather(
+                    *(
+                        cls.search(
+                            query["query"],
+                            prefix,
+                            table_name,
+                            k=query_k,
+                            nprobe=nprobe,
+                            ef_search=ef_search,
+                            filters=query.get("filters"),
+                            mode=mode,
+                            weights=weights,
+                            budget=budget,
+                        )
+                        for query, query_k in zip(queries, ks)
+                    )
+                )
+            )
+        return combine_rankings(rankings, ks, combine)
+
+    @classmethod
+    async def _vector_search_many(
+        cls,
+        queries: List[Dict[str, Any]],
+        ks: List[int],
+        prefix: str,
+        table_name: str,
+        nprobe: Optional[int],
+        ef_search: Optional[int],
+    ) -> List[List[Dict[str, Any]]]:
+        table = await indexes.get(prefix, table_name)
+        if not table.size:
+            return [[] for _ in queries]
+
+        texts = [query["query"] for query in queries if "vector" not in query]
+        encoded = iter(await cls.embed_async(texts) if texts else [])
+        vectors = [
+            (
+                np.asarray(query["vector"], dtype=np.float32)
+                if "vector" in query
+                else next(encoded)
+            )
+            for query in queries
+        ]
+        if any(vector.shape != (table.dim,) for vector in vectors):
+            raise RPCError(
+                code=INVALID_PARAMS,
+                message=f"Query vectors must have {table.dim} dimensions",
+            )
+
+        async def resolve(query: Dict[str, Any]) -> Optional[np.ndarray]:
+            if not query.get("filters"):
+                return None
+            return await cls.candidates(
+                prefix=prefix, table_name=table_name, filters=query["filters"]
+            )
+
+        candidates = list(await asyncio.gather(*(resolve(query) for query in queries)))
+        # One index search for every unfiltered query, at the largest k.
+        unfiltered = [i for i, labels in enumerate(candidates) if labels is None]
+        hits: List[Optional[List[Tuple[int, float]]]] = [None] * len(queries)
+        if unfiltered:
+            found = await asyncify(table.search_many)(
+                np.stack([vectors[i] for i in unfiltered]),
+                max(ks[i] for i in unfiltered),
+                nprobe,
+                ef_search,
+            )
+            for i, query_hits in zip(unfiltered, found):
+                hits[i] = query_hits
+
+        async def nearest(i: int) -> List[Dict[str, Any]]:
+            labels = candidates[i]
+            if labels is not None and not len(labels):
+                return []
+            return await cls._nearest(
+                prefix,
+                table_name,
+                table,
+                vectors[i][None, :],
+                ks[i],
+                nprobe,
+                ef_search,
+                labels,
+                hits[i],
+            )
+
+        return list(await asyncio.gather(*(nearest(i) for i in range(len(queries)))))
+
+    @classmethod
+    async def _lexical_search(
+        cls,
+        query: str,
+        prefix: str,
+        table_name: str,
+        k: int,
+        candidates: Optional[np.ndarray],
+    ) -> List[Dict[str, Any]]:
+        hits = await cls.lexical_hits(
+            prefix=prefix,
+            table_name=table_name,
+            query=query,
+            k=k,
+            candidates=candidates,
+        )
+        docs = await cls.by_labels(
+            prefix=prefix, table_name=table_name, labels=[label for label, _ in hits]
+        )
+        return [
+            {
                 "id": doc.id,
                 "content": doc.content,
                 "metadata": doc.metadata,
-                "distance": float(distances[0][i])
-            })
-        
-        return results
+                "bm25": score,
+            }
+            for (_, score), doc in zip(hits, docs)
+            if doc is not None
+        ]
+
+    @classmethod
+    async def _hybrid_search(
+        cls,
+        query: str,
+        prefix: str,
+        table_name: str,
+        k: int,
+        nprobe: Optional[int],
+        ef_search: Optional[int],
+        candidates: Optional[np.ndarray],
+        weights: Dict[str, float],
+        budget: float,
+    ) -> List[Dict[str, Any]]:
+        """
+        Runs the vector and lexical searches concurrently and fuses their
+        rankings with weighted reciprocal rank fusion. A leg still running
+        after `budget` seconds is dropped, unless neither has finished.
+        """
+        depth = max(k, HYBRID_DEPTH)
+        searches = {
+            "vector": lambda: cls._vector_search(
+                query, prefix, table_name, depth, nprobe, ef_search, candidates
+            ),
+            "lexical": lambda: cls._lexical_search(
+                query, prefix, table_name, depth, candidates
+            ),
+        }
+        # A leg weighted 0 cannot change the ranking: skip it.
+        legs = {
+            name: asyncio.ensure_future(search())
+            for name, search in searches.items()
+            if weights.get(name, 1.0) > 0
+        }
+        if not legs:
+            return []
+        done, pending = await asyncio.wait(legs.values(), timeout=budget)
+        if not done:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+        for task in pending:
+            task.cancel()
+
+        fused: Dict[str, Dict[str, Any]] = {}
+        for name, task in legs.items():
+            if task not in done:
+                DROPPED_LEGS.labels(name).inc()
+                continue
+            weight = weights.get(name, 1.0)
+            for rank, result in enumerate(task.result(), 1):
+                entry = fused.setdefault(
+                    result["id"],
+                    {
+                        "id": result["id"],
+                        "content": result["content"],
+                        "metadata": result["metadata"],
+                        "score": 0.0,
+                    },
+                )
+                entry["score"] += weight / (RRF_K + rank)
+                for key in ("distance", "bm25"):
+                    if key in result:
+                        entry[key] = result[key]
+        return sorted(fused.values(), key=lambda entry: -entry["score"])[:k]
 
     @classmethod
     async def delete_document(cls, doc_id: str, prefix: str, table_name: str):
-        if doc_id in cls.id_to_object:
-            del cls.id_to_object[doc_id]
-            # Note: FAISS doesn't support direct deletion, so we need to rebuild the index
-            cls.index = None
-            await cls.delete_item(prefix=prefix, table_name=table_name, item_id=doc_id)
-            return {"message": f"Document {doc_id} deleted from vector store"}
-        else:
+        removed = await cls.remove(prefix=prefix, table_name=table_name, doc_id=doc_id)
+        if removed is None:
             return {"message": f"Document {doc_id} not found in vector store"}
+        label, sequence = removed
+        labels = np.asarray([] if label is None else [label], dtype=np.int64)
+        await cls._apply(
+            prefix, table_name, lambda table: table.remove(labels, sequence)
+        )
+        return {"message": f"Document {doc_id} deleted from vector store"}
 
     @classmethod
-    async def update_document(cls, doc_id: str, new_content: str, new_metadata: Optional[Dict[str, Any]], prefix: str, table_name: str):
-        if doc_id in cls.id_to_object:
-            doc = cls.id_to_object[doc_id]
-            doc.content = new_content
-            if new_metadata:
-                doc.metadata = new_metadata
-            doc.embedding = cls.model.encode([new_content])[0].tolist()
-            
-            await doc.put_item(prefix=prefix, table_name=table_name)
-            
-            # Update the index
-            cls.index = None  # Force rebuild on next search
-            return {"message": f"Document {doc_id} updated in vector store"}
-        else:
+    async def update_document(
+        cls,
+        doc_id: str,
+        new_content: str,
+        new_metadata: Optional[Dict[str, Any]],
+        prefix: str,
+        table_name: str,
+    ):
+        docs = await cls.multi_get(prefix=prefix, table_name=table_name, ids=[doc_id])
+        doc = docs[0]
+        if doc is None:
             return {"message": f"Document {doc_id} not found in vector store"}
+        doc.content = new_content
+        if new_metadata:
+            doc.metadata = new_metadata
+        embeddings = await cls.embed_cached([new_content])
+
+        # A fresh label keeps indexes that cannot remove rows from returning
+        # the old vector under the new content.
+        labels, replaced, sequence = await cls.store(
+            prefix=prefix,
+            table_name=table_name,
+            docs=[doc],
+            embeddings=embeddings,
+            relabel=True,
+        )
+        await cls._apply(
+            prefix,
+            table_name,
+            lambda table: table.add(labels, embeddings, sequence, replaced),
+        )
+        return {"message": f"Document {doc_id} updated in vector store"}
+
+
+async def _embed_queries(texts: List[str]) -> List[np.ndarray]:
+    return list(await VectorStore.embed_async(texts))
+
+
+SearchRequest = Tuple[TableIndex, np.ndarray, int, Optional[int], Optional[int]]
+
+
+@asyncify
+def _search_indexes(
+    requests: List[SearchRequest],
+) -> List[Union[List[Tuple[int, float]], Exception]]:
+    """
+    Runs one multi-query search per index and search parameters. A group
+    that fails only fails its own requests.
+    """
+    groups: Dict[Tuple[int, int, Optional[int], Optional[int]], List[int]] = {}
+    for i, (table, _, k, nprobe, ef_search) in enumerate(requests):
+        groups.setdefault((id(table), k, nprobe, ef_search), []).append(i)
+    results: List[Union[List[Tuple[int, float]], Exception]] = [[] for _ in requests]
+    for indices in groups.values():
+        table, _, k, nprobe, ef_search = requests[indices[0]]
+        try:
+            vectors = np.concatenate([requests[i][1] for i in indices])
+            found = table.search_many(vectors, k, nprobe, ef_search)
+        except Exception as e:
+            for i in indices:
+                results[i] = e
+            continue
+        for i, hits in zip(indices, found):
+            results[i] = hits
+    return results
+
+
+# Concurrent searches share one inference call and one FAISS call per index.
+query_embeddings: MicroBatcher[str, np.ndarray] = MicroBatcher("embed", _embed_queries)
+index_searches: MicroBatcher[SearchRequest, List[Tuple[int, float]]] = MicroBatcher(
+    "search", _search_indexes
+)
+
+
+def combine_rankings(
+    rankings: List[List[Dict[str, Any]]], ks: List[int], combine: Combine
+) -> Union[List[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+    """
+    "separate" returns each query's results; "dedupe" keeps a document only
+    in the results of the query that ranks it highest (the first on ties);
+    "merge" fuses all results into one list of up to max(ks) documents by
+    reciprocal rank fusion, noting the queries that found each.
+    """
+    if combine == "separate":
+        return rankings
+    if combine == "dedupe":
+        best: Dict[str, Tuple[int, int]] = {}
+        for i, results in enumerate(rankings):
+            for rank, result in enumerate(results):
+                if result["id"] not in best or rank < best[result["id"]][0]:
+                    best[result["id"]] = (rank, i)
+        return [
+            [result for result in results if best[result["id"]][1] == i]
+            for i, results in enumerate(rankings)
+        ]
+    fused: Dict[str, Dict[str, Any]] = {}
+    for i, results in enumerate(rankings):
+        for rank, result in enumerate(results, 1):
+            entry = fused.setdefault(
+                result["id"],
+                {
+                    "id": result["id"],
+                    "content": result["content"],
+                    "metadata": result["metadata"],
+                    "score": 0.0,
+                    "queries": [],
+                },
+            )
+            entry["score"] += 1 / (RRF_K + rank)
+            entry["queries"].append(i)
+    return sorted(fused.values(), key=lambda entry: -entry["score"])[
+        : max(ks, default=0)
+    ]
@@ -0,0 +1,106 @@
+import asyncio
+import gc
+import unittest
+from unittest.mock import patch
+from uuid import uuid4
+
+import uvicorn
+
+from realitydb.client import RPCClient, _Socket
+from realitydb.metrics import REQUESTS
+from realitydb.rpc_server import RPCServer
+from realitydb.utils import RPCError
+
+
+class TestRPCClient(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        config = uvicorn.Config(
+            RPCServer(), port=0, log_level="warning", lifespan="off"
+        )
+        self.server = uvicorn.Server(config)
+        self.serving = asyncio.ensure_future(self.server.serve())
+        while not self.server.started:
+            await asyncio.sleep(0.01)
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        self.url = f"ws://127.0.0.1:{port}/test"
+        self.table = f"client_{uuid4().hex}"
+
+    async def asyncTearDown(self):
+        async with RPCClient(self.url) as client:
+            await client.delete_table(self.table)
+        self.server.should_exit = True
+        await self.serving
+
+    async def test_methods(self):
+        async with RPCClient(self.url) as client:
+            await client.put_item(self.table, {"id": "a", "data": "1"})
+            self.assertEqual(
+                await client.get_item(self.table, "a"), {"id": "a", "data": "1"}
+            )
+            await client.update_item(
+                self.table, "a", [{"action": "put", "data": {"data": "2"}}]
+            )
+            self.assertEqual(
+                await client.query(self.table, {"data": "2"}),
+                [{"id": "a", "data": "2"}],
+            )
+            await client.delete_item(self.table, "a")
+            with self.assertRaises(RPCError) as error:
+                await client.get_item(self.table, "a")
+            self.assertEqual(error.exception.code, 404)
+
+    async def test_coalescing(self):
+        batches = REQUESTS.labels("Batch").value
+        async with RPCClient(self.url, pool_size=2) as client:
+            items = [{"id": str(i), "data": str(i)} for i in range(50)]
+            await asyncio.gather(*(client.put_item(self.table, i) for i in items))
+            results = await asyncio.gather(
+                *(client.get_item(self.table, str(i)) for i in range(51)),
+                return_exceptions=True,
+            )
+        self.assertEqual(results[:50], items)
+        # Only the missing item fails
+        self.assertIsInstance(results[50], RPCError)
+        self.assertEqual(REQUESTS.labels("Batch").value - batches, 2)
+
+    async def test_stream(self):
+        async with RPCClient(self.url, compression=True) as client:
+            await client.batch_write_item(
+                self.table, [{"id": "%03d" % i, "data": "x" * 100} for i in range(300)]
+            )
+            ids = [
+                item["id"]
+                async for item in client.stream(
+                    "Scan", {"table_name": self.table, "chunk_size": 50}, credits=1
+                )
+            ]
+            self.assertEqual(ids, ["%03d" % i for i in range(300)])
+            async for _ in client.stream(
+                "Scan", {"table_name": self.table, "chunk_size": 10}
+            ):
+                break
+            # The connection stays usable after cancelling a stream
+            self.assertEqual(len(await client.scan(self.table)), 300)
+
+            # A stream dropped without aclose() still cancels on the server
+            sent = []
+            send = _Socket.send
+
+            async def record(socket, frame):
+                sent.append(frame.get("method"))
+                await send(socket, frame)
+
+            with patch.object(_Socket, "send", record):
+                stream = client.stream(
+                    "Scan", {"table_name": self.table, "chunk_size": 10}
+                )
+                await stream.__anext__()
+                del stream
+                gc.collect()
+                await asyncio.sleep(0.1)
+            self.assertEqual(sent[-1], "StreamCancel")
+            self.assertFalse(any(socket.streams for socket in client._sockets))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,13 +1,33 @@
+import asyncio
+import base64
+import hashlib
+import os
+import re
+import tempfile
+import time
 import unittest
 from unittest.mock import AsyncMock, patch
 from uuid import uuid4
 
 # Import TestClient from starlette
+import orjson
+import zstandard
 from starlette.testclient import TestClient
+from typing_extensions import TypedDict
 
-from realitydb.models import DocumentObject
+from rocksdict import Options, Rdict  # pylint: disable=E0611
+
+from realitydb.logs import LogConfig, summarize
+from realitydb.models import DocumentObject, Secondary
+from realitydb.tracing import InMemoryExporter, tracer
+from realitydb.replication import served_locally
 from realitydb.rpc_server import RPCServer
-from realitydb.utils import RPCError
+from realitydb.utils import (
+    INVALID_PARAMS,
+    METHOD_NOT_FOUND,
+    PARSE_ERROR,
+    RPCError,
+)
 
 
 # Rename the class to avoid PytestCollectionWarning
@@ -92,6 +112,32 @@ class TestRPCServer(unittest.IsolatedAsyncioTestCase):
                 prefix="test", table_name="TestTable", item_id="item1"
             )
 
+    @patch("realitydb.models.DocumentObject.get_item", new_callable=AsyncMock)
+    async def test_pipelined_requests_keep_order(self, mock_get_item):
+        async def get_item(prefix, table_name, item_id):
+            if item_id == "slow":
+                await asyncio.sleep(0.05)
+            return TestDocument(id=item_id, data="")
+
+        mock_get_item.side_effect = get_item
+
+        def responses(concurrent):
+            with self.client.websocket_connect("/test") as websocket:
+                for item_id in ("slow", "fast"):
+                    websocket.send_json(
+                        {
+                            "method": "GetItem",
+                            "properties": {"table_name": "TestTable", "id": item_id},
+                            "id": item_id,
+                            "concurrent": concurrent,
+                        }
+                    )
+                return [websocket.receive_json()["id"] for _ in range(2)]
+
+        # Requests on a connection are served in order unless marked concurrent
+        self.assertEqual(responses(False), ["slow", "fast"])
+        self.assertEqual(responses(True), ["fast", "slow"])
+
     @patch("realitydb.models.DocumentObject.delete_item", new_callable=AsyncMock)
     async def test_delete_item(self, mock_delete_item):
         # Set up the mock return value
@@ -271,6 +317,717 @@ class TestRPCServer(unittest.IsolatedAsyncioTestCase):
                 prefix="test", table_name="TestTable", item_id="nonexistent"
             )
 
+    def test_missing_required_property(self):
+        with self.client.websocket_connect("/test") as websocket:
+            request_id = str(uuid4())
+            websocket.send_json(
+                {
+                    "method": "GetItem",
+                    "properties": {"table_name": "TestTable"},
+                    "id": request_id,
+                }
+            )
+            response = websocket.receive_json()
+            self.assertEqual(response["status"], "error")
+            self.assertEqual(response["id"], request_id)
+            self.assertEqual(response["error"]["code"], INVALID_PARAMS)
+            self.assertEqual(response["error"]["data"][0]["loc"], ["id"])
+            # Malformed items and non-positive k are invalid params too
+            for method, properties in (
+                ("PutItem", {"table_name": "TestTable", "item": {"id": 5}}),
+                ("BatchWriteItem", {"table_name": "TestTable", "items": [{"id": []}]}),
+                (
+                    "SearchVectorStore",
+                    {"table_name": "TestTable", "query": "a", "k": 0},
+                ),
+            ):
+                websocket.send_json(
+                    {"method": method, "properties": properties, "id": request_id}
+                )
+                response = websocket.receive_json()
+                self.assertEqual(response["error"]["code"], INVALID_PARAMS, method)
+            # The connection survives malformed input
+            websocket.send_text("not json")
+            response = websocket.receive_json()
+            self.assertEqual(response["error"]["code"], PARSE_ERROR)
+
+    def test_unknown_method(self):
+        with self.client.websocket_connect("/test") as websocket:
+            websocket.send_json(
+                {"method": "DropEverything", "properties": {}, "id": str(uuid4())}
+            )
+            response = websocket.receive_json()
+            self.assertEqual(response["status"], "error")
+            self.assertEqual(response["error"]["code"], METHOD_NOT_FOUND)
+
+    def test_register_plugin_method(self):
+        class EchoProperties(TypedDict):
+            message: str
+
+        @self.app.registry.register("Echo", EchoProperties)
+        async def echo(properties: EchoProperties, prefix: str):
+            return {"message": properties["message"], "id": prefix}
+
+        with self.client.websocket_connect("/test") as websocket:
+            websocket.send_json(
+                {
+                    "method": "Echo",
+                    "properties": {"message": "hello"},
+                    "id": str(uuid4()),
+                }
+            )
+            response = websocket.receive_json()
+            self.assertEqual(response["status"], "success")
+            self.assertEqual(response["result"], {"message": "hello", "id": "test"})
+        self.assertNotIn("Echo", RPCServer().registry)
+
+    def test_metrics(self):
+        table = f"metrics_{uuid4().hex}"
+        with self.client.websocket_connect("/test") as websocket:
+            for method, properties in [
+                ("PutItem", {"table_name": table, "item": {"id": "a", "data": "x"}}),
+                ("GetItem", {"table_name": table, "id": "a"}),
+                ("GetItem", {"table_name": table, "id": "missing"}),
+            ]:
+                websocket.send_json(
+                    {"method": method, "properties": properties, "id": str(uuid4())}
+                )
+                websocket.receive_json()
+            response = self.client.get("/metrics")
+            websocket.send_json(
+                {
+                    "method": "DeleteTable",
+                    "properties": {"table_name": table},
+                    "id": str(uuid4()),
+                }
+            )
+            self.assertEqual(websocket.receive_json()["status"], "success")
+        self.assertEqual(response.status_code, 200)
+        body = response.text
+        self.assertIn('realitydb_requests_total{method="GetItem"}', body)
+        self.assertIn(
+            'realitydb_request_errors_total{method="GetItem",code="404"}', body
+        )
+        self.assertIn(
+            'realitydb_request_duration_quantile_seconds{method="PutItem",quantile="0.99"}',
+            body,
+        )
+        self.assertIn("realitydb_thread_pool_queue_depth", body)
+        self.assertIn(
+            f'realitydb_rocksdb{{table="test/{table}",stat="estimate-num-keys"}}', body
+        )
+
+    def test_request_log(self):
+        app = RPCServer(logging=LogConfig(sample_rate=1.0, slow_threshold=0.0))
+        client = TestClient(app)
+        payload = "x" * 10_000
+        with (
+            patch("realitydb.logs.access_logger") as access,
+            patch("realitydb.logs.slow_logger") as slow,
+        ):
+            with client.websocket_connect("/test") as websocket:
+                websocket.send_json(
+                    {
+                        "method": "GetItem",
+                        "properties": {
+                            "table_name": f"log_{uuid4().hex}",
+                            "id": payload,
+                            "token": "secret",
+                        },
+                        "id": "get",
+                    }
+                )
+                websocket.receive_json()
+        fields = access.info.call_args.kwargs["extra"]["fields"]
+        self.assertEqual(fields["method"], "GetItem")
+        self.assertEqual(fields["code"], 404)
+        self.assertGreater(fields["request_bytes"], 10_000)
+        self.assertEqual(fields["properties"]["token"], "[redacted]")
+        self.assertLess(len(fields["properties"]["id"]), 200)
+        timing = slow.warning.call_args.kwargs["extra"]["fields"]["timing_ms"]
+        self.assertEqual(set(timing), {"queued", "handled", "sent"})
+
+        response = client.put("/logging", json={"sample_rate": 0})
+        self.assertEqual(response.json()["sample_rate"], 0)
+
+    def test_profile(self):
+        table = f"profile_{uuid4().hex}"
+        with self.client.websocket_connect("/test") as websocket:
+            websocket.send_json(
+                {
+                    "method": "PutItem",
+                    "properties": {"table_name": table, "item": {"id": "a"}},
+                    "id": "put",
+                    "profile": True,
+                }
+            )
+            response = websocket.receive_json()
+            websocket.send_json(
+                {
+                    "method": "DeleteTable",
+                    "properties": {"table_name": table},
+                    "id": "x",
+                }
+            )
+            self.assertNotIn("profile", websocket.receive_json())
+        spans = {span["name"]: span for span in response["profile"]["spans"]}
+        self.assertEqual(spans["dispatch"]["parent"], "rpc PutItem")
+        self.assertEqual(spans["validate"]["parent"], "dispatch")
+        self.assertEqual(spans["asyncify.wait"]["parent"], "dispatch")
+        self.assertEqual(spans["asyncify.run"]["attributes"]["function"], "put_item")
+        self.assertEqual(spans["get_db.open"]["parent"], "asyncify.run")
+
+    def test_trace_export(self):
+        exporter = InMemoryExporter()
+        tracer.add_exporter(exporter)
+        try:
+            with self.client.websocket_connect("/test") as websocket:
+                websocket.send_json({"method": "Nope", "properties": {}, "id": "nope"})
+                websocket.receive_json()
+        finally:
+            tracer.remove_exporter(exporter)
+        (trace,) = exporter.traces
+        otlp = exporter.to_otlp()["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        names = {span["name"] for span in otlp}
+        self.assertTrue({"rpc unknown", "codec.encode", "ws.send"} <= names)
+        root = next(span for span in otlp if span["name"] == "rpc unknown")
+        self.assertNotIn("parentSpanId", root)
+        self.assertTrue(all(span["traceId"] == trace.trace_id for span in otlp))
+
+    def test_summarize(self):
+        config = LogConfig(max_string=4, max_items=2, max_depth=2)
+        self.assertEqual(
+            summarize({"a": "abcdef", "b": [1, 2, 3], "c": 1}, config),
+            {"a": "abcd...(+2 chars)", "b": [1, 2, "+1 items"], "...": "+1 keys"},
+        )
+        self.assertEqual(
+            summarize({"a": {"b": {"c": 1}}}, config), {"a": {"b": "{...1 keys}"}}
+        )
+        secrets = {"api_key": "k", "Access_Token": "t", "client_secret": "s"}
+        self.assertEqual(
+            summarize(secrets, LogConfig()), dict.fromkeys(secrets, "[redacted]")
+        )
+
+    def test_compression(self):
+        table = f"zstd_{uuid4().hex}"
+        url = "/test?compression=zstd&threshold=1024"
+        with self.client.websocket_connect(url) as websocket:
+            items = [{"id": str(i), "data": "repetitive " * 10} for i in range(50)]
+            # Requests may be compressed too
+            websocket.send_bytes(
+                zstandard.ZstdCompressor().compress(
+                    orjson.dumps(
+                        {
+                            "method": "BatchWriteItem",
+                            "properties": {"table_name": table, "items": items},
+                            "id": "write",
+                        }
+                    )
+                )
+            )
+            response = orjson.loads(
+                zstandard.ZstdDecompressor().decompress(websocket.receive_bytes())
+            )
+            self.assertEqual(response["status"], "success")
+
+            # Small responses stay plain text
+            websocket.send_json(
+                {
+                    "method": "GetItem",
+                    "properties": {"table_name": table, "id": "0"},
+                    "id": "get",
+                }
+            )
+            self.assertEqual(websocket.receive_json()["result"]["id"], "0")
+
+            # Incompressible payloads are not compressed
+            noise = base64.b64encode(os.urandom(8192)).decode()
+            websocket.send_json(
+                {
+                    "method": "PutItem",
+                    "properties": {
+                        "table_name": table,
+                        "item": {"id": "jpeg", "data": noise},
+                    },
+                    "id": "put",
+                }
+            )
+            self.assertEqual(websocket.receive_json()["result"]["data"], noise)
+
+            websocket.send_json(
+                {
+                    "method": "DeleteTable",
+                    "properties": {"table_name": table},
+                    "id": "x",
+                }
+            )
+            websocket.receive_json()
+
+        with self.client.websocket_connect("/test?compression=gzip") as websocket:
+            self.assertEqual(websocket.receive_json()["status"], "error")
+
+    async def test_large_frames_encoded_off_loop(self):
+        from realitydb import compression
+        from realitydb.compression import Codec, CompressionConfig
+        from realitydb.utils import asyncify as run_in_executor
+
+        offloaded = []
+
+        def asyncify(func):
+            offloaded.append(func.__name__)
+            return run_in_executor(func)
+
+        codec = Codec(CompressionConfig())
+        with patch("realitydb.compression.asyncify", asyncify):
+            small = await codec.encode({"id": "a", "result": [1, 2]})
+            rows = [{"id": str(i)} for i in range(compression.LARGE_RESULT_ITEMS)]
+            large = await codec.encode({"id": "b", "result": rows})
+        self.assertEqual(orjson.loads(small)["result"], [1, 2])
+        self.assertEqual(orjson.loads(large)["result"], rows)
+        self.assertEqual(offloaded, ["_encode"])
+
+    def test_batch(self):
+        table = f"batch_{uuid4().hex}"
+
+        def sub(method, **properties):
+            return {"method": method, "properties": dict(properties, table_name=table)}
+
+        with self.client.websocket_connect("/test") as websocket:
+            for ordered in (True, False):
+                websocket.send_json(
+                    {
+                        "method": "Batch",
+                        "properties": {
+                            "ordered": ordered,
+                            "requests": [
+                                sub("PutItem", item={"id": "a", "data": "1"}),
+                                sub("PutItem", item={"id": "b", "data": "2"}),
+                                sub("DeleteItem", id="b"),
+                                sub("DeleteItem", id="missing"),
+                                {"method": "GetItem"},
+                                sub("Query", limit=10),
+                            ],
+                        },
+                        "id": str(uuid4()),
+                    }
+                )
+                response = websocket.receive_json()
+                self.assertEqual(response["status"], "success")
+                statuses = [frame["status"] for frame in response["result"]]
+                self.assertEqual(
+                    statuses,
+                    ["success", "success", "success", "error", "error", "success"],
+                )
+                self.assertEqual(response["result"][3]["error"]["code"], 404)
+                self.assertEqual(response["result"][4]["error"]["code"], INVALID_PARAMS)
+            websocket.send_json(
+                {
+                    "method": "Batch",
+                    "properties": {
+                        "requests": [sub("GetItem", id="a"), sub("GetItem", id="b")]
+                    },
+                    "id": str(uuid4()),
+                }
+            )
+            result = websocket.receive_json()["result"]
+            self.assertEqual(result[0]["result"], {"id": "a", "data": "1"})
+            self.assertEqual(result[1]["error"]["code"], 404)
+            websocket.send_json(
+                {
+                    "method": "DeleteTable",
+                    "properties": {"table_name": table},
+                    "id": "x",
+                }
+            )
+            websocket.receive_json()
+
+    @patch("realitydb.models.DocumentObject.get_item", new_callable=AsyncMock)
+    async def test_rate_limit(self, mock_get_item):
+        mock_get_item.return_value = TestDocument(id="item1", data="Sample data")
+        response = self.client.put(
+            "/limits", json={"tenants": {"limited": {"rate": 0.001, "burst": 1}}}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.client.get("/limits").json()["tenants"]["limited"]["burst"], 1
+        )
+
+        request = {
+            "method": "GetItem",
+            "properties": {"table_name": "TestTable", "id": "item1"},
+            "id": str(uuid4()),
+        }
+        with self.client.websocket_connect("/limited") as websocket:
+            websocket.send_json(request)
+            self.assertEqual(websocket.receive_json()["status"], "success")
+            websocket.send_json(request)
+            response = websocket.receive_json()
+            self.assertEqual(response["error"]["code"], 429)
+            self.assertTrue(response["error"]["data"]["retryable"])
+        # Other tenants keep the default (unlimited) budget
+        with self.client.websocket_connect("/other") as websocket:
+            for _ in range(3):
+                websocket.send_json(request)
+                self.assertEqual(websocket.receive_json()["status"], "success")
+        self.assertIn(
+            'realitydb_rejected_requests_total{tenant="limited",method="GetItem",'
+            'reason="rate"}',
+            self.client.get("/metrics").text,
+        )
+        # Tenants without their own limits share one metric label
+        self.client.put("/limits", json={"tenant": {"rate": 0.001, "burst": 1}})
+        tenant = f"t{uuid4().hex}"
+        with self.client.websocket_connect(f"/{tenant}") as websocket:
+            for _ in range(2):
+                websocket.send_json(request)
+                response = websocket.receive_json()
+            self.assertEqual(response["error"]["code"], 429)
+        text = self.client.get("/metrics").text
+        self.assertIn(
+            'realitydb_rejected_requests_total{tenant="other",method="GetItem",'
+            'reason="rate"}',
+            text,
+        )
+        self.assertNotIn(tenant, text)
+
+    def test_limiter_buckets_bounded(self):
+        from realitydb.limits import Limit, Limiter, LimitsConfig
+
+        limiter = Limiter(
+            LimitsConfig(tenant=Limit(rate=0.001, burst=1)), max_buckets=3
+        )
+        limiter.acquire("busy", "GetItem")()
+        for tenant in range(10):
+            limiter.acquire(f"tenant{tenant}", "GetItem")()
+        self.assertLessEqual(len(limiter._buckets), 3)
+        limiter = Limiter(LimitsConfig(tenant=Limit(rate=1000, burst=1)))
+        for tenant in range(10):
+            limiter.acquire(f"tenant{tenant}", "GetItem")()
+        # Refilled buckets are dropped as new tenants arrive
+        time.sleep(0.01)
+        limiter.acquire("last", "GetItem")()
+        self.assertEqual(list(limiter._buckets), [("tenant", "last")])
+
+    def test_limiter_charges_batches_in_full(self):
+        from realitydb.limits import Limit, Limiter, LimitsConfig
+
+        limiter = Limiter(LimitsConfig(tenant=Limit(rate=0.001, burst=10)))
+        limiter.acquire("a", "Batch", cost=6)()
+        # The remaining 4 tokens do not cover another batch of 6
+        with self.assertRaises(RPCError) as caught:
+            limiter.acquire("a", "Batch", cost=6)
+        self.assertTrue(caught.exception.data["retryable"])
+        limiter.acquire("a", "Batch", cost=4)()
+        # A batch larger than the burst can never be admitted
+        limiter = Limiter(LimitsConfig(tenant=Limit(rate=0.001, burst=10)))
+        with self.assertRaises(RPCError) as caught:
+            limiter.acquire("a", "Batch", cost=11)
+        self.assertEqual(caught.exception.code, 429)
+        self.assertEqual(caught.exception.data, {"retryable": False})
+        self.assertIn("exceeds the burst", caught.exception.message)
+        limiter.acquire("a", "Batch", cost=10)()
+
+    def test_stream_scan(self):
+        table = f"stream_{uuid4().hex}"
+        items = [{"id": f"item{i:02d}", "data": str(i % 2)} for i in range(25)]
+        with self.client.websocket_connect("/test") as websocket:
+            websocket.send_json(
+                {
+                    "method": "BatchWriteItem",
+                    "properties": {"table_name": table, "items": items},
+                    "id": "write",
+                }
+            )
+            self.assertEqual(websocket.receive_json()["status"], "success")
+
+            websocket.send_json(
+                {
+                    "method": "Scan",
+                    "properties": {
+                        "table_name": table,
+                        "stream": True,
+                        "chunk_size": 10,
+                        "credits": 1,
+                    },
+                    "id": "scan",
+                }
+            )
+            first = websocket.receive_json()
+            self.assertEqual((first["status"], first["seq"]), ("partial", 0))
+            self.assertEqual(first["result"], items[:10])
+            websocket.send_json(
+                {"method": "StreamCredit", "id": "scan", "properties": {"credits": 2}}
+            )
+            second, last = websocket.receive_json(), websocket.receive_json()
+            self.assertEqual((second["status"], second["seq"]), ("partial", 1))
+            self.assertEqual((last["status"], last["seq"]), ("complete", 2))
+            self.assertEqual(last["result"], items[20:])
+
+            websocket.send_json(
+                {
+                    "method": "Query",
+                    "properties": {
+                        "table_name": table,
+                        "filters": {"data": "1"},
+                        "stream": True,
+                        "chunk_size": 5,
+                        "credits": 1,
+                    },
+                    "id": "query",
+                }
+            )
+            first = websocket.receive_json()
+            self.assertEqual(first["result"], items[1:10:2])
+            websocket.send_json({"method": "StreamCancel", "id": "query"})
+            self.assertEqual(websocket.receive_json()["status"], "cancelled")
+
+            websocket.send_json(
+                {
+                    "method": "DeleteTable",
+                    "properties": {"table_name": table},
+                    "id": "x",
+                }
+            )
+            websocket.receive_json()
+
+    def test_stream_query_matches_unstreamed(self):
+        table = f"stream_{uuid4().hex}"
+        # Sorted first: a filter on a field an item lacks skips the item
+        items = [{"id": "a"}] + [{"id": f"item{i:02d}", "data": "1"} for i in range(30)]
+        with self.client.websocket_connect("/test") as websocket:
+            websocket.send_json(
+                {
+                    "method": "BatchWriteItem",
+                    "properties": {"table_name": table, "items": items},
+                    "id": "write",
+                }
+            )
+            self.assertEqual(websocket.receive_json()["status"], "success")
+
+            results = []
+            for stream in (False, True):
+                websocket.send_json(
+                    {
+                        "method": "Query",
+                        "properties": {
+                            "table_name": table,
+                            "filters": {"data": "1"},
+                            "stream": stream,
+                        },
+                        "id": f"query{stream}",
+                    }
+                )
+                response = websocket.receive_json()
+                self.assertEqual(
+                    response["status"], "complete" if stream else "success"
+                )
+                results.append([item["id"] for item in response["result"]])
+            # Both paths apply the same default limit
+            self.assertEqual(results[0], results[1])
+            self.assertEqual(results[0], [item["id"] for item in items[1:26]])
+
+            websocket.send_json(
+                {
+                    "method": "DeleteTable",
+                    "properties": {"table_name": table},
+                    "id": "x",
+                }
+            )
+            websocket.receive_json()
+
+    def test_rest_etag(self):
+        table = f"rest_{uuid4().hex}"
+        items = [{"id": "a", "data": "1"}, {"id": "b", "data": "2"}]
+        with self.client.websocket_connect("/test") as websocket:
+            websocket.send_json(
+                {
+                    "method": "BatchWriteItem",
+                    "properties": {"table_name": table, "items": items},
+                    "id": "write",
+                }
+            )
+            websocket.receive_json()
+
+            response = self.client.get(f"/test/{table}/items/a")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), items[0])
+            etag = response.headers["etag"]
+            response = self.client.get(
+                f"/test/{table}/items/a", headers={"If-None-Match": etag}
+            )
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.headers["etag"], etag)
+            self.assertEqual(self.client.get(f"/test/{table}/items/c").status_code, 404)
+
+            response = self.client.get(f"/test/{table}/items?ids=a&ids=b")
+            self.assertEqual(response.json(), items)
+            response = self.client.get(
+                f"/test/{table}/query", params={"filters": '{"data": "2"}'}
+            )
+            self.assertEqual(response.json(), items[1:])
+            scan_etag = self.client.get(f"/test/{table}/scan").headers["etag"]
+
+            websocket.send_json(
+                {
+                    "method": "PutItem",
+                    "properties": {
+                        "table_name": table,
+                        "item": {"id": "b", "data": "3"},
+                    },
+                    "id": "put",
+                }
+            )
+            websocket.receive_json()
+            # Unchanged items still revalidate; the scan does not
+            response = self.client.get(
+                f"/test/{table}/items/a", headers={"If-None-Match": etag}
+            )
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get(
+                f"/test/{table}/scan", headers={"If-None-Match": scan_etag}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()[1], {"id": "b", "data": "3"})
+
+            websocket.send_json(
+                {
+                    "method": "DeleteTable",
+                    "properties": {"table_name": table},
+                    "id": "x",
+                }
+            )
+            websocket.receive_json()
+
+    def test_rest_unknown_table(self):
+        table = f"missing_{uuid4().hex}"
+        response = self.client.get(f"/test/{table}/items/a")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get(f"/test/{table}/scan").status_code, 404)
+        self.assertFalse(os.path.exists(f"/tmp/test/{table}"))
+        # Names that are not identifiers never reach the filesystem
+        self.assertEqual(self.client.get("/test/%2E%2E/scan").status_code, 400)
+        self.assertEqual(self.client.get("/test/a.b/items/a").status_code, 400)
+
+    def test_upload(self):
+        import docx
+
+        import fitz
+
+        from realitydb.extraction import Extractor
+        from realitydb.uploads import Uploads
+
+        self.app.extractor = Extractor(workers=2, pages_per_task=1)
+        self.addCleanup(self.app.extractor.close)
+        with tempfile.TemporaryDirectory() as directory:
+            self.app.uploads = Uploads(
+                max_bytes=64 << 10, chunk_bytes=1024, directory=directory
+            )
+            document = docx.Document()
+            document.add_paragraph("Hello upload")
+            path = os.path.join(directory, "hello.docx")
+            document.save(path)
+            with open(path, "rb") as f:
+                content = f.read()
+            os.remove(path)
+            docx_type = (
+                "application/vnd.openxmlformats-officedocument"
+                ".wordprocessingml.document"
+            )
+
+            response = self.client.post(
+                "/upload", files={"file": ("hello.docx", content, docx_type)}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("<p>Hello upload</p>", response.text)
+            self.assertEqual(
+                response.headers["x-content-sha256"],
+                hashlib.sha256(content).hexdigest(),
+            )
+            # Pages extracted in parallel are streamed in order
+            pdf = fitz.open()
+            for number in range(5):
+                pdf.new_page().insert_text((72, 72), f"Page {number}")
+            response = self.client.post(
+                "/upload",
+                files={"file": ("pages.pdf", pdf.tobytes(), "application/pdf")},
+            )
+            self.assertEqual(response.status_code, 200)
+            texts = re.findall(r"<p>(.*?)</p>", response.text, re.S)
+            self.assertEqual(
+                [text.strip() for text in texts], [f"Page {n}" for n in range(5)]
+            )
+            # An extraction cut short by the timeout says so at the end
+            self.app.extractor.timeout = 0
+            response = self.client.post(
+                "/upload",
+                files={"file": ("pages.pdf", pdf.tobytes(), "application/pdf")},
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(
+                response.text.endswith(
+                    "<p class='realitydb-error'>Extraction timed out after 0s;"
+                    " the output is incomplete.</p>"
+                )
+            )
+            self.app.extractor.timeout = 300
+            # Oversized and unreadable uploads are rejected; none is left behind
+            response = self.client.post(
+                "/upload",
+                files={"file": ("big.pdf", b"x" * (65 << 10), "application/pdf")},
+            )
+            self.assertEqual(response.status_code, 413)
+            response = self.client.post(
+                "/upload", files={"file": ("bad.docx", b"not a docx", docx_type)}
+            )
+            self.assertEqual(response.status_code, 400)
+            response = self.client.post(
+                "/upload", files={"file": ("a.txt", b"text", "text/plain")}
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(os.listdir(directory), [])
+            self.assertFalse(self.app.uploads.slots.locked())
+
+
+class TestReplication(unittest.TestCase):
+    def test_secondary_follows_primary(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = root + "/primary"
+            primary = Rdict(path)
+            primary["a"] = b"1"
+            primary.flush()
+            secondary = Secondary(root + "/secondary", catchup_interval=3600)
+            try:
+                replica = secondary.open(path, Options())
+                self.assertEqual(replica.get("a"), b"1")
+                primary["b"] = b"2"
+                self.assertIsNone(replica.get("b"))
+                secondary.catch_up(path, replica)
+                self.assertEqual(replica.get("b"), b"2")
+                self.assertTrue(secondary.is_fresh(path))
+                replica.close()
+            finally:
+                secondary.stop()
+                primary.close()
+
+    def test_secondary_missing_table(self):
+        with tempfile.TemporaryDirectory() as root:
+            secondary = Secondary(root + "/secondary", catchup_interval=3600)
+            try:
+                with self.assertRaises(RPCError) as error:
+                    secondary.open(root + "/missing", Options())
+                self.assertEqual(error.exception.code, 404)
+            finally:
+                secondary.stop()
+
+    def test_routing(self):
+        self.assertTrue(served_locally("Query", {"table_name": "t"}))
+        self.assertFalse(served_locally("PutItem", {"table_name": "t"}))
+        self.assertFalse(served_locally("SearchVectorStore", {"table_name": "t"}))
+        reads = {"method": "GetItem", "properties": {"table_name": "t", "id": "a"}}
+        write = {"method": "DeleteItem", "properties": {"table_name": "t", "id": "a"}}
+        self.assertTrue(served_locally("Batch", {"requests": [reads, reads]}))
+        self.assertFalse(served_locally("Batch", {"requests": [reads, write]}))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,51 @@
+import asyncio
+import os
+import shutil
+import time
 import pytest
+import numpy as np
 from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+from rocksdict import Rdict  # pylint: disable=E0611
+from realitydb.embedding_cache import EmbeddingCache
+from realitydb.models import close_db, table_path
+from realitydb.vector_index import indexes
 from realitydb.vectorstore import VectorStore
 
+
+@pytest.fixture(autouse=True)
+def embedding_cache():
+    # A fresh in-memory cache, so mocked embeddings do not leak across tests.
+    cache = EmbeddingCache(path=None)
+    with patch("realitydb.vectorstore.embedding_cache", cache):
+        yield cache
+
+
+@pytest.fixture
+def prefix():
+    """A prefix of its own; its indexes and tables are removed afterwards."""
+    prefix = f"vectors_{uuid4().hex}"
+    yield prefix
+    root = table_path(prefix, "")
+    for table_name in os.listdir(root) if os.path.isdir(root) else ():
+        if os.path.isdir(os.path.join(root, table_name)):
+            indexes.drop(prefix, table_name, purge=True)
+            close_db(prefix, table_name)
+            Rdict.destroy(table_path(prefix, table_name))
+    shutil.rmtree(root, ignore_errors=True)
+
+
+def embed_lengths(texts, batch_size=64):
+    """Stands in for the model: a text's embedding is (its length, 0)."""
+    return np.array([[float(len(t)), 0.0] for t in texts], dtype=np.float32)
+
+
+def embed_from(vectors):
+    """Stands in for the model with the embeddings in `vectors`."""
+    def embed(texts, batch_size=64):
+        return np.stack([np.asarray(vectors[t], dtype=np.float32) for t in texts])
+    return embed
+
 @pytest.mark.asyncio
 async def test_add_documents():
     with patch('realitydb.vectorstore.VectorStore.add_documents', new_callable=AsyncMock) as mock_add:
@@ -72,3 +116,511 @@ async def test_delete_non_existent_document():
         
         assert result == {"status": "not_found"}
         mock_delete.assert_called_once_with("non_existent_id", "test_prefix", "test_table")
+
+@pytest.mark.asyncio
+async def test_search_is_isolated_per_table(prefix):
+    for table_name, content in (("a", "apple"), ("b", "banana")):
+        doc = VectorStore(content=content, embedding=[1.0, 0.0], metadata={})
+        await doc.put_item(prefix=prefix, table_name=table_name)
+
+    query = np.array([[1.0, 0.0]], dtype=np.float32)
+    with patch.object(VectorStore, "embed", return_value=query):
+        a = await VectorStore.search("fruit", prefix, "a", k=5)
+        b = await VectorStore.search("fruit", prefix, "b", k=5)
+
+    assert [r["content"] for r in a] == ["apple"]
+    assert [r["content"] for r in b] == ["banana"]
+    assert indexes.peek(prefix, "a").size == 1
+
+@pytest.mark.asyncio
+async def test_registry_evicts_least_recently_used(prefix):
+    from realitydb.vector_index import ID_OVERHEAD, IndexRegistry
+
+    for table_name in ("a", "b", "c"):
+        doc = VectorStore(content=table_name, embedding=[0.5] * 4, metadata={})
+        await doc.put_item(prefix=prefix, table_name=table_name)
+
+    registry = IndexRegistry(max_bytes=2 * (4 * 4 + ID_OVERHEAD))
+    await registry.get(prefix, "a")
+    await registry.get(prefix, "b")
+    await registry.get(prefix, "a")  # a is now more recent than b
+    await registry.get(prefix, "c")
+
+    assert (prefix, "a") in registry
+    assert (prefix, "b") not in registry
+    assert (prefix, "c") in registry
+    assert registry.nbytes <= registry.max_bytes
+
+@pytest.mark.asyncio
+async def test_add_documents_embeds_in_one_batch(prefix):
+    documents = [{"content": str(i), "metadata": {"i": i}} for i in range(5)]
+
+    embed = embed_from({str(i): [float(i), 0.0] for i in range(5)})
+
+    with patch.object(VectorStore, "embed", side_effect=embed) as mock_embed:
+        await indexes.get(prefix, "docs")  # loaded, so new vectors are added to it
+        await VectorStore.add_documents(documents, prefix, "docs", batch_size=2)
+        mock_embed.assert_called_once_with([str(i) for i in range(5)], 2)
+        assert indexes.peek(prefix, "docs").size == 5
+
+        results = await VectorStore.search("3", prefix, "docs", k=2)
+
+    assert [r["metadata"]["i"] for r in results] == [3, 2]
+
+@pytest.mark.asyncio
+async def test_registry_persists_and_revalidates_indexes(prefix):
+    from realitydb.vector_index import IndexRegistry
+
+    def docs(*contents):
+        return [
+            VectorStore(content=c, embedding=[float(len(c)), 1.0], metadata={})
+            for c in contents
+        ]
+
+    await VectorStore.store(prefix=prefix, table_name="t", docs=docs("a", "bb"))
+    built = IndexRegistry(flush_interval=None)
+    table = await built.get(prefix, "t")
+    assert not table.mapped and table.size == 2
+    built.flush()
+
+    # A fresh saved index is memory-mapped and copied on its first write.
+    loaded = IndexRegistry(flush_interval=None)
+    table = await loaded.get(prefix, "t")
+    assert table.mapped and table.size == 2
+    new = docs("ccc")
+    labels, _, sequence = await VectorStore.store(
+        prefix=prefix, table_name="t", docs=new
+    )
+    table.add(labels, np.array([new[0].embedding], dtype=np.float32), sequence)
+    assert not table.mapped and table.size == 3
+    loaded.flush()
+
+    # A write the saved index did not see makes it stale: it is served while
+    # a fresh index is rebuilt in the background.
+    await VectorStore.store(prefix=prefix, table_name="t", docs=docs("dddd"))
+    stale = IndexRegistry(flush_interval=None)
+    table = await stale.get(prefix, "t")
+    assert table.size == 3
+    await asyncio.gather(*stale._rebuilds.values())
+    assert stale.peek(prefix, "t").size == 4
+
+@pytest.mark.asyncio
+async def test_delete_and_update_apply_in_place(prefix):
+    # Stored before labels existed: the first build labels it.
+    legacy = VectorStore(content="z", embedding=[1.0, 0.0], metadata={})
+    await legacy.put_item(prefix=prefix, table_name="t")
+
+    with patch.object(VectorStore, "embed", side_effect=embed_lengths):
+        table = await indexes.get(prefix, "t")
+        await VectorStore.add_documents(
+            [{"content": "a"}, {"content": "bbbb"}], prefix, "t"
+        )
+        assert table.size == 3 and table.sequence is not None
+
+        await VectorStore.delete_document(legacy.id, prefix, "t")
+        assert indexes.peek(prefix, "t") is table
+        assert table.size == 2 and table.sequence is not None
+
+        [hit] = await VectorStore.search("bbbb", prefix, "t", k=1)
+        await VectorStore.update_document(hit["id"], "cc", None, prefix, "t")
+        assert table.size == 2 and table.sequence is not None
+        results = await VectorStore.search("cc", prefix, "t", k=2)
+
+    assert [r["content"] for r in results] == ["cc", "a"]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "spec",
+    [
+        {"type": "ivf_flat", "nlist": 2, "nprobe": 2},
+        {"type": "ivf_sq", "nlist": 2, "metric": "ip"},
+        {"type": "hnsw", "metric": "cosine"},
+    ],
+)
+async def test_configured_index_types(spec, prefix):
+    from realitydb.vector_index import IndexSpec
+
+    await indexes.configure(prefix, "t", IndexSpec(**spec))
+    vectors = np.random.default_rng(0).standard_normal((100, 8), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    contents = {str(i): vectors[i] for i in range(100)}
+
+    embed = embed_from(contents)
+
+    with patch.object(VectorStore, "embed", side_effect=embed):
+        table = await indexes.get(prefix, "t")
+        await VectorStore.add_documents(
+            [{"content": str(i)} for i in range(100)], prefix, "t"
+        )
+        assert table.size == 100
+        assert not table.exact  # IVF indexes trained once past min_train
+
+        [hit] = await VectorStore.search("7", prefix, "t", k=1)
+        assert hit["content"] == "7"
+
+        await VectorStore.delete_document(hit["id"], prefix, "t")
+        results = await VectorStore.search("7", prefix, "t", k=3)
+        assert len(results) == 3 and "7" not in [r["content"] for r in results]
+
+    if spec["type"] == "hnsw":
+        assert table.orphans == 1  # HNSW cannot remove rows
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("brute_force_max", [4096, 0])
+async def test_search_filters_by_metadata(brute_force_max, prefix):
+    vectors = np.random.default_rng(0).standard_normal((60, 8), dtype=np.float32)
+    contents = {str(i): vectors[i] for i in range(60)}
+
+    embed = embed_from(contents)
+
+    documents = [
+        {"content": str(i), "metadata": {"tenant": "ab"[i % 2], "type": i % 3}}
+        for i in range(60)
+    ]
+    with patch.object(VectorStore, "embed", side_effect=embed), patch(
+        "realitydb.vectorstore.BRUTE_FORCE_MAX", brute_force_max
+    ):
+        await VectorStore.add_documents(documents, prefix, "t")
+
+        results = await VectorStore.search(
+            "7", prefix, "t", k=5, filters={"tenant": "a", "type": [0, 1]}
+        )
+        matching = [
+            i for i in range(60) if i % 2 == 0 and i % 3 in (0, 1)
+        ]
+        nearest = sorted(
+            matching, key=lambda i: np.linalg.norm(vectors[i] - vectors[7])
+        )[:5]
+        assert [r["content"] for r in results] == [str(i) for i in nearest]
+        assert all(r["metadata"]["tenant"] == "a" for r in results)
+
+        await VectorStore.delete_document(results[0]["id"], prefix, "t")
+        await VectorStore.update_document(
+            results[1]["id"], "7", {"tenant": "b"}, prefix, "t"
+        )
+        contents["7"] = vectors[7]
+        after = await VectorStore.search(
+            "7", prefix, "t", k=60, filters={"tenant": "a", "type": [0, 1]}
+        )
+        ids = {r["id"] for r in after}
+        assert len(after) == len(matching) - 2
+        assert results[0]["id"] not in ids and results[1]["id"] not in ids
+
+        assert await VectorStore.search("7", prefix, "t", filters={"tenant": "c"}) == []
+
+
+@pytest.mark.asyncio
+async def test_filters_on_table_stored_before_labels(prefix):
+    # Stored before labels and metadata postings existed.
+    for content, kind in (("apple", "x"), ("bread", "y")):
+        doc = VectorStore(content=content, embedding=[1.0, 0.0], metadata={"type": kind})
+        await doc.put_item(prefix=prefix, table_name="t")
+
+    with patch.object(VectorStore, "embed", side_effect=embed_lengths):
+        results = await VectorStore.search("fruit", prefix, "t", filters={"type": "x"})
+    assert [r["content"] for r in results] == ["apple"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["lexical", "hybrid"])
+async def test_lexical_on_table_stored_before_labels(prefix, mode):
+    for content in ("apple pie", "bread"):
+        doc = VectorStore(content=content, embedding=[1.0, 0.0], metadata={})
+        await doc.put_item(prefix=prefix, table_name="t")
+
+    with patch.object(VectorStore, "embed", side_effect=embed_lengths):
+        results = await VectorStore.search("apple", prefix, "t", k=1, mode=mode)
+    assert [r["content"] for r in results] == ["apple pie"]
+
+
+@pytest.mark.asyncio
+async def test_embedding_cache_skips_known_content(embedding_cache, prefix):
+    with patch.object(VectorStore, "embed", side_effect=embed_lengths) as mock_embed:
+        documents = [{"content": c} for c in ("a", "bb", "a", "ccc")]
+        await VectorStore.add_documents(documents, prefix, "t")
+        mock_embed.assert_called_once_with(["a", "bb", "ccc"], 64)
+
+        mock_embed.reset_mock()
+        await VectorStore.add_documents([{"content": "bb"}], prefix, "t")
+        [hit] = await VectorStore.search("bb", prefix, "t", k=1)
+        await VectorStore.update_document(hit["id"], "bb", {"x": 1}, prefix, "t")
+        # Only the search query was encoded.
+        mock_embed.assert_called_once_with(["bb"], 64)
+
+
+def test_embedding_cache_persists_per_model(tmp_path):
+    path = str(tmp_path / "embeddings")
+    vectors = np.eye(2, dtype=np.float32)
+    cache = EmbeddingCache(path, max_entries=1)
+    cache.put("m1", ["a", "b"], vectors)
+    assert [v.tolist() for v in cache.get("m1", ["b", "a"])] == [[0, 1], [1, 0]]
+    cache.close()
+
+    cache = EmbeddingCache(path, max_entries=0)
+    assert cache.get("m1", ["a"])[0].tolist() == [1, 0]
+    # Another model invalidates every cached embedding, also on disk.
+    assert cache.get("m2", ["a", "b"]) == [None, None]
+    cache.close()
+    cache = EmbeddingCache(path)
+    assert cache.get("m1", ["a"]) == [None]
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_lexical_and_hybrid_search(prefix):
+    from realitydb.lexical import tokenize
+    from realitydb.models import get_db
+    from realitydb.vector_index import (
+        BACKFILLED,
+        LEXICAL_DOCS,
+        LEXICAL_LENGTH,
+        Labels,
+        indexes,
+    )
+
+    assert tokenize("See AB-1234.pdf") == ["see", "ab-1234.pdf", "ab", "1234", "pdf"]
+
+    contents = [
+        "invoice for part AB-1234",
+        "quarterly report-2023.pdf",
+        "notes about invoices",
+        "shipping manifest",
+    ]
+
+    def embed(texts, batch_size=64):
+        # "notes" is the vector neighbour of every query.
+        return np.array(
+            [[0.0, 1.0] if "notes" in t else [1.0, float(len(t))] for t in texts],
+            dtype=np.float32,
+        )
+
+    with patch.object(VectorStore, "embed", side_effect=embed):
+        await VectorStore.add_documents([{"content": c} for c in contents], prefix, "t")
+
+        [hit] = await VectorStore.search("ab-1234", prefix, "t", k=1, mode="lexical")
+        assert hit["content"] == contents[0] and hit["bm25"] > 0
+        results = await VectorStore.search("AB-1234", prefix, "t", k=2, mode="hybrid")
+        assert {r["content"] for r in results} >= {contents[0]}
+        assert "bm25" in results[0] and "score" in results[0]
+        [hit] = await VectorStore.search(
+            "AB-1234", prefix, "t", k=1, mode="hybrid", weights={"lexical": 0}
+        )
+        assert hit["content"] == "notes about invoices" and "bm25" not in hit
+
+        # Postings follow updates and deletes.
+        await VectorStore.update_document(hit["id"], "pallet AB-1234", None, prefix, "t")
+        found = await VectorStore.search("1234", prefix, "t", k=5, mode="lexical")
+        assert [r["content"] for r in found] == ["pallet AB-1234", contents[0]]
+        await VectorStore.delete_document(found[1]["id"], prefix, "t")
+        found = await VectorStore.search("invoice", prefix, "t", k=5, mode="lexical")
+        assert found == []
+
+        # Documents stored before the inverted index existed are backfilled.
+        labels = Labels(get_db(prefix, "t"))
+        assert labels.cf.get(LEXICAL_DOCS) == 3
+        labels.cf.delete_range("\x00l\x00", "\x00t\x01")
+        for key in (LEXICAL_DOCS, LEXICAL_LENGTH, BACKFILLED):
+            del labels.cf[key]
+        found = await VectorStore.search("manifest", prefix, "t", mode="lexical")
+        assert [r["content"] for r in found] == ["shipping manifest"]
+        assert labels.cf.get(LEXICAL_DOCS) == 3
+
+        # A leg exceeding the budget is dropped.
+        def slow(texts, batch_size=64):
+            time.sleep(0.3)
+            return embed(texts)
+
+        with patch.object(VectorStore, "embed", side_effect=slow):
+            results = await VectorStore.search(
+                "manifest", prefix, "t", mode="hybrid", budget=0.05
+            )
+        assert [r["content"] for r in results] == ["shipping manifest"]
+        assert "distance" not in results[0]
+
+
+@pytest.mark.parametrize(
+    "storage, tolerance", [("float32", 0), ("float16", 1e-3), ("int8", 1e-2)]
+)
+def test_embedding_encodings(storage, tolerance):
+    from realitydb.vector_index import decode_vectors, encode_vectors
+
+    vectors = np.random.default_rng(0).standard_normal((3, 384), dtype=np.float32)
+    vectors[2] = 0
+    values = encode_vectors(vectors, storage)
+    width = {"float32": 4 * 384, "float16": 2 * 384, "int8": 384 + 4}[storage]
+    assert [len(value) for value in values] == [width] * 3
+    decoded = decode_vectors(values, storage)
+    assert decoded.dtype == np.float32 and decoded.shape == (3, 384)
+    scale = np.abs(vectors).max(axis=1, keepdims=True)
+    assert np.all(np.abs(decoded - vectors) <= tolerance * scale)
+
+
+@pytest.mark.asyncio
+async def test_embeddings_are_stored_apart_from_documents(prefix):
+    from realitydb.methods import batch_get_item, get_item
+    from realitydb.models import get_db
+    from realitydb.vector_index import IndexSpec
+
+    # Stored inline before embeddings had a column family of their own.
+    legacy = VectorStore(content="z", embedding=[1.0, 0.0], metadata={})
+    await legacy.put_item(prefix=prefix, table_name="t")
+
+    with patch.object(VectorStore, "embed", side_effect=embed_lengths):
+        await indexes.get(prefix, "t")
+        await VectorStore.add_documents([{"content": "abc"}], prefix, "t")
+        await indexes.configure(prefix, "t", IndexSpec(storage="int8"))
+        assert (await indexes.get(prefix, "t")).size == 2
+        [hit] = await VectorStore.search("abc", prefix, "t", k=1)
+
+    db = get_db(prefix, "t")
+    for doc_id in (legacy.id, hit["id"]):
+        assert b"embedding" not in db[doc_id]
+    item = await get_item({"table_name": "t", "id": hit["id"]}, prefix)
+    assert "embedding" not in item.model_dump()
+    items = await batch_get_item(
+        {"table_name": "t", "ids": [legacy.id, hit["id"]], "embeddings": True}, prefix
+    )
+    assert items[0].embedding == [1.0, 0.0]
+    assert np.allclose(items[1].embedding, [3.0, 0.0], atol=0.02)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_searches_are_batched(prefix):
+    from realitydb.micro_batch import BATCH_SIZE
+    from realitydb.vector_index import TableIndex
+
+    with patch.object(VectorStore, "embed", side_effect=embed_lengths) as mock_embed:
+        await VectorStore.add_documents(
+            [{"content": "a" * n} for n in range(1, 6)], prefix, "t"
+        )
+        mock_embed.reset_mock()
+        searches = BATCH_SIZE.labels("search")
+        count = searches.count
+        with patch.object(
+            TableIndex, "search_many", autospec=True, side_effect=TableIndex.search_many
+        ) as search_many:
+            results = await asyncio.gather(
+                *(VectorStore.search("a" * n, prefix, "t", k=1) for n in range(1, 6))
+            )
+        mock_embed.assert_called_once_with(["a" * n for n in range(1, 6)], 64)
+        search_many.assert_called_once()
+        assert searches.count == count + 1
+    assert [[r["content"] for r in hits] for hits in results] == [
+        ["a" * n] for n in range(1, 6)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_limits_and_errors():
+
+    from realitydb.micro_batch import MicroBatcher
+
+    batches = []
+
+    async def process(items):
+        batches.append(items)
+        if "boom" in items:
+            raise ValueError("boom")
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher("test", process, max_wait=10, max_batch=3)
+    # A full batch does not wait for max_wait.
+    assert await asyncio.gather(*(batcher.submit(i) for i in range(3))) == [0, 2, 4]
+    assert batches == [[0, 1, 2]]
+
+    batcher.max_wait = 0
+    with pytest.raises(ValueError):
+        await asyncio.gather(batcher.submit("boom"), batcher.submit("x"))
+    assert batches[-1] == ["boom", "x"]
+
+    # A failing search group only fails its own requests.
+    from realitydb.vectorstore import _search_indexes
+
+    class Broken:
+        def search_many(self, vectors, k, nprobe, ef_search):
+            raise RuntimeError("broken index")
+
+    class Working:
+        def search_many(self, vectors, k, nprobe, ef_search):
+            return [[(len(vectors), 0.0)]] * len(vectors)
+
+    query = np.zeros((1, 2), dtype=np.float32)
+    searches = MicroBatcher("test", _search_indexes, max_wait=0)
+    failed, found = await asyncio.gather(
+        searches.submit((Broken(), query, 1, None, None)),
+        searches.submit((Working(), query, 1, None, None)),
+        return_exceptions=True,
+    )
+    assert isinstance(failed, RuntimeError) and found == [(1, 0.0)]
+
+
+@pytest.mark.asyncio
+async def test_search_many_queries_and_vectors(prefix):
+    from realitydb.methods import search_vector_store
+    from realitydb.utils import RPCError
+    from realitydb.vector_index import TableIndex
+
+    documents = [
+        {"content": "a" * n, "metadata": {"odd": n % 2 == 1}} for n in range(1, 7)
+    ]
+    with patch.object(VectorStore, "embed", side_effect=embed_lengths) as mock_embed:
+        await VectorStore.add_documents(documents, prefix, "t")
+        mock_embed.reset_mock()
+        queries = [
+            {"query": "aa"},
+            {"vector": [5.0, 0.0], "k": 3},
+            {"query": "aaa", "k": 1, "filters": {"odd": False}},
+        ]
+        with patch.object(
+            TableIndex, "search_many", autospec=True, side_effect=TableIndex.search_many
+        ) as search_many:
+            results = await search_vector_store(
+                {"table_name": "t", "queries": queries, "k": 2}, prefix
+            )
+        # One encode pass for the texts; vectors skip inference.
+        mock_embed.assert_called_once_with(["aa", "aaa"], 64)
+        search_many.assert_called_once()
+        assert [[len(r["content"]) for r in hits] for hits in results] == [
+            [2, 1],
+            [5, 4, 6],
+            [2],
+        ]
+
+        deduped = await VectorStore.search_many(
+            queries, prefix, "t", k=2, combine="dedupe"
+        )
+        assert [[len(r["content"]) for r in hits] for hits in deduped] == [
+            [2, 1],
+            [5, 4, 6],
+            [],
+        ]
+        merged = await VectorStore.search_many(
+            queries, prefix, "t", k=2, combine="merge"
+        )
+        assert len(merged) == 3 and merged[0]["queries"] == [0, 2]
+
+        # Top-level filters apply to the queries without their own.
+        filtered = await search_vector_store(
+            {
+                "table_name": "t",
+                "queries": [{"query": "a"}, {"query": "aaa", "filters": {"odd": False}}],
+                "filters": {"odd": True},
+                "k": 2,
+            },
+            prefix,
+        )
+        assert [[len(r["content"]) for r in hits] for hits in filtered] == [
+            [1, 3],
+            [2, 4],
+        ]
+
+        with pytest.raises(RPCError):
+            await VectorStore.search_many([{"vector": [1.0]}], prefix, "t")
+        for properties in (
+            {"table_name": "t"},
+            {"table_name": "t", "query": "a", "combine": "merge"},
+            {"table_name": "t", "query": "a", "queries": [{"query": "a"}]},
+        ):
+            with pytest.raises(RPCError):
+                await search_vector_store(properties, prefix)